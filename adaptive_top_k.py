@@ -0,0 +1,66 @@
+import os
+import numpy as np
+
+# "fixed" (default): every question gets top_k chunks; "adaptive": fetch
+# CANDIDATE_POOL chunks and keep them down to the first clear drop in
+# similarity (context packing applies the token budget afterwards)
+TOP_K_POLICY = os.environ.get('RAG_TOP_K_POLICY', 'fixed')
+
+# Chunks fetched per question by the adaptive policy; one search of 20
+# costs about the same as one of 5
+CANDIDATE_POOL = 20
+# Chunks kept at least (when they pass the similarity threshold) and at most
+MIN_K = 2
+MAX_K = 12
+
+# A drop between neighbouring similarities is a gap when it is at least
+# GAP_FACTOR times the median drop among the candidates and at least MIN_GAP
+GAP_FACTOR = 3.0
+MIN_GAP = 0.02
+
+def fetch_k(top_k, policy=TOP_K_POLICY):
+    """How many chunks to search for"""
+    return CANDIDATE_POOL if policy == 'adaptive' else top_k
+
+def score_cutoff(similarities, similarity_threshold, min_k=MIN_K, max_k=MAX_K):
+    """Lowest similarity to keep, and why: 'gap', 'max_k', 'threshold' or 'below_threshold'
+
+    A single-site question usually has a few close chunks and then a clear
+    drop; a broad question has a flat run of similar scores, so it keeps up
+    to max_k chunks.
+    """
+    scores = np.asarray(similarities, dtype=np.float64)
+    ranked = np.sort(scores[scores > similarity_threshold])[::-1]
+    if len(ranked) == 0:
+        # Nothing relevant: keep the best few so the relevance checks can refuse
+        best = np.sort(scores)[::-1][:min_k]
+        return (best[-1] if len(best) else 0.0), 'below_threshold'
+    if len(ranked) <= min_k:
+        return ranked[-1], 'threshold'
+
+    window = ranked[:max_k + 1]
+    gaps = window[:-1] - window[1:]
+    # gaps[i] is the drop after the (i + 1)-th chunk
+    position = int(np.argmax(gaps[min_k - 1:])) + min_k - 1
+    if gaps[position] >= max(MIN_GAP, GAP_FACTOR * float(np.median(gaps))):
+        return window[position], 'gap'
+    keep = min(len(ranked), max_k)
+    return ranked[keep - 1], 'max_k' if len(ranked) > max_k else 'threshold'
+
+def cut_results(results, similarity_threshold, min_k=MIN_K, max_k=MAX_K):
+    """Trim one question's ranked candidates (Chroma query() shape) with the adaptive policy
+
+    Candidates stay in rank order (dense or hybrid); the first max_k above
+    the score cutoff are kept. The token budget is left to pack_context,
+    which applies it after dropping near-duplicate chunks, so duplicates
+    do not use up room here. Returns the trimmed results and the cut stats.
+    """
+    similarities = [1 / (1 + dist) for dist in results['distances'][0]]
+    cutoff, reason = score_cutoff(similarities, similarity_threshold, min_k, max_k)
+    keep = [i for i, similarity in enumerate(similarities) if similarity >= cutoff][:max_k]
+
+    trimmed = {key: (values if values is None or key == 'included' else [[values[0][i] for i in keep]])
+               for key, values in results.items()}
+    stats = {'candidates': len(similarities), 'kept': len(keep), 'cut': reason,
+             'cutoff': round(float(cutoff), 3)}
+    return trimmed, stats
@@ -0,0 +1,105 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_MANIFEST_PATH = os.path.join('./chroma_db', 'ingest_manifest.json')
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    question = re.sub(r'[^\w\s]', ' ', question.lower())
+    return ' '.join(question.split())
+
+def collection_fingerprint(collection, manifest_path=DEFAULT_MANIFEST_PATH):
+    """Cheap value that changes whenever the collection is re-ingested"""
+    try:
+        manifest_mtime = os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        manifest_mtime = None
+    return (collection.name, collection.count(), manifest_mtime)
+
+class AnswerCache:
+    """In-memory cache of RAG answers with TTL and LRU eviction
+
+    Entries are keyed by language, answer mode ('translate' or 'direct',
+    which words the answer differently) and normalized question. A lookup
+    first tries the exact question, then (when a query embedding is given)
+    the most similar cached question with the same language and mode whose
+    cosine similarity is at least similarity_threshold.
+    """
+
+    def __init__(self, similarity_threshold=0.92, ttl_seconds=3600, max_entries=256):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.fingerprint = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def validate(self, fingerprint):
+        """Drop every entry if the collection changed since they were stored"""
+        with self.lock:
+            if fingerprint != self.fingerprint:
+                self.entries.clear()
+                self.fingerprint = fingerprint
+
+    def _expire(self):
+        deadline = time.monotonic() - self.ttl_seconds
+        for key in [key for key, entry in self.entries.items() if entry['created'] < deadline]:
+            del self.entries[key]
+
+    def get(self, question, language='en', embedding=None, answer_mode='translate'):
+        """Return a cached result flagged as cached, or None"""
+        key = (language, answer_mode, normalize_question(question))
+        with self.lock:
+            self._expire()
+            entry = self.entries.get(key)
+            match, similarity = 'exact', 1.0
+
+            if entry is None and embedding is not None:
+                candidates = [(k, e) for k, e in self.entries.items()
+                              if k[:2] == key[:2] and e['embedding'] is not None]
+                if candidates:
+                    matrix = np.stack([e['embedding'] for _, e in candidates])
+                    query = np.asarray(embedding, dtype=np.float32)
+                    scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        key, entry = candidates[best]
+                        match, similarity = 'semantic', float(scores[best])
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            result = dict(entry['result'])
+
+        result['sources'] = list(result['sources'])
+        result['cached'] = True
+        result['cache_match'] = match
+        result['cache_similarity'] = similarity
+        return result
+
+    def put(self, question, result, language='en', embedding=None, answer_mode='translate'):
+        """Store a fresh result, evicting the least recently used entries"""
+        key = (language, answer_mode, normalize_question(question))
+        # Only the answer and its sources are reused; timings and flags are per-request
+        stored = {'answer': result['answer'], 'sources': result['sources']}
+        with self.lock:
+            self.entries[key] = {
+                'result': stored,
+                'embedding': None if embedding is None else np.asarray(embedding, dtype=np.float32),
+                'created': time.monotonic()
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
@@ -1,17 +1,29 @@
 import streamlit as st
-import chromadb
-from sentence_transformers import SentenceTransformer
 import ollama
-from deep_translator import GoogleTranslator
-from langdetect import detect, DetectorFactory
-from langdetect.lang_detect_exception import LangDetectException
 from audio_recorder_streamlit import audio_recorder
 import speech_recognition as sr
 import tempfile
 import os
-
-# Set seed for consistent language detection
-DetectorFactory.seed = 0
+import time
+from concurrent.futures import ThreadPoolExecutor
+from encoder_backend import ENCODER_BACKEND
+from answer_cache import AnswerCache, collection_fingerprint
+from streaming import StreamStats, stream_tokens, translate_sentences, intercept_refusal
+from tracing import Trace, activate, span, submit
+from translation import (LANGUAGE_NAMES, detect_language, translate_text, system_message, translation_cache,
+                         ANSWER_MODE, answer_language_instruction, refusal_key)
+from vector_store import VECTOR_STORE
+from lexical_index import RETRIEVAL_MODE
+from context_packing import pack_context, CONTEXT_TOKEN_BUDGET
+from adaptive_top_k import TOP_K_POLICY
+from mmr import MMR_ENABLED
+from retrieval_service import RETRIEVAL_SERVER, RemoteStore
+from domain_gate import load_domain_gate
+from multilingual_index import (encode_questions, multilingual_domain_gate, MULTILINGUAL_RETRIEVAL,
+                                MULTILINGUAL_LANGUAGES)
+from rag import (get_embedding_model, get_collection, get_lexical_index, get_multilingual_model,
+                 get_multilingual_store, retrieve_context, retrieve_multilingual,
+                 passes_relevance_gate, SIMILARITY_THRESHOLD)
 
 # Page configuration
 st.set_page_config(
@@ -177,58 +189,54 @@ st.markdown("""
 # Initialize components
 @st.cache_resource
 def load_components():
-    embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-    client = chromadb.PersistentClient(path="./chroma_db")
-    collection = client.get_collection(name="tunisian_archaeology")
+    # The same encoder and store rag.py's retrieval helpers use: through the
+    # retrieval server when RAG_RETRIEVAL_SERVER is set, otherwise loaded here
+    # (RAG_ENCODER_BACKEND, RAG_VECTOR_STORE, and the BM25 index for
+    # RAG_RETRIEVAL_MODE=hybrid)
+    embedding_model = get_embedding_model()
+    collection = get_collection()
+    if RETRIEVAL_MODE == 'hybrid' and not isinstance(collection, RemoteStore):
+        get_lexical_index()
     return embedding_model, collection
 
-embedding_model, collection = load_components()
-
-# Language name mapping (100+ languages supported)
-LANGUAGE_NAMES = {
-    'en': 'English', 'fr': 'French', 'ar': 'Arabic', 'es': 'Spanish',
-    'de': 'German', 'it': 'Italian', 'pt': 'Portuguese', 'ru': 'Russian',
-    'zh-cn': 'Chinese (Simplified)', 'zh-tw': 'Chinese (Traditional)',
-    'ja': 'Japanese', 'ko': 'Korean', 'nl': 'Dutch', 'pl': 'Polish',
-    'tr': 'Turkish', 'sv': 'Swedish', 'da': 'Danish', 'fi': 'Finnish',
-    'no': 'Norwegian', 'cs': 'Czech', 'el': 'Greek', 'he': 'Hebrew',
-    'hi': 'Hindi', 'id': 'Indonesian', 'ms': 'Malay', 'th': 'Thai',
-    'vi': 'Vietnamese', 'uk': 'Ukrainian', 'ro': 'Romanian', 'hu': 'Hungarian',
-    'sk': 'Slovak', 'bg': 'Bulgarian', 'hr': 'Croatian', 'sr': 'Serbian',
-    'ca': 'Catalan', 'lt': 'Lithuanian', 'lv': 'Latvian', 'et': 'Estonian',
-    'sl': 'Slovenian', 'af': 'Afrikaans', 'sq': 'Albanian', 'bn': 'Bengali',
-    'fa': 'Persian', 'ur': 'Urdu', 'sw': 'Swahili', 'ta': 'Tamil'
-}
-
-def detect_language(text):
-    """Automatically detect language from text (supports 100+ languages)"""
+@st.cache_resource
+def load_gate():
+    # Site/topic centroids for the off-domain gate; None if they cannot be loaded
     try:
-        detected_lang = detect(text)
-        return detected_lang
-    except LangDetectException:
-        return 'en'
-    except Exception:
-        return 'en'
+        return load_domain_gate(collection)
+    except Exception as e:
+        print(f"⚠️  Domain gate disabled: {e}")
+        return None
 
-def translate_text(text, source_lang='auto', target_lang='en'):
-    """Translate text between any languages"""
+@st.cache_resource
+def load_multilingual():
+    # Encoder, index and domain centroids for searching non-English questions
+    # without translating them; None unless RAG_MULTILINGUAL_RETRIEVAL=1
+    if not MULTILINGUAL_RETRIEVAL or isinstance(collection, RemoteStore):
+        return None
     try:
-        if source_lang == target_lang or (source_lang == 'auto' and target_lang == 'en'):
-            return text
-        
-        translator = GoogleTranslator(source=source_lang, target=target_lang)
-        translated = translator.translate(text)
-        return translated
+        encoder = get_multilingual_model()
+        store = get_multilingual_store()
+        return encoder, store, multilingual_domain_gate(store)
     except Exception as e:
-        return text
+        print(f"⚠️  Multilingual index disabled: {e}")
+        return None
 
-def retrieve_context(question, top_k=5):
-    question_embedding = embedding_model.encode([question])[0]
-    results = collection.query(
-        query_embeddings=[question_embedding.tolist()],
-        n_results=top_k
-    )
-    return results
+@st.cache_resource
+def load_answer_cache():
+    # Shared by every session so the sidebar example questions are answered once
+    return AnswerCache(similarity_threshold=0.92, ttl_seconds=3600, max_entries=256)
+
+@st.cache_resource
+def load_executor():
+    # Shared pool for the overlapping stages of rag_query
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag")
+
+embedding_model, collection = load_components()
+domain_gate = load_gate()
+multilingual = load_multilingual()
+answer_cache = load_answer_cache()
+executor = load_executor()
 
 def format_context(results):
     documents = results['documents'][0]
@@ -236,28 +244,34 @@ def format_context(results):
     distances = results['distances'][0]
     
     formatted_sources = []
-    context_text = ""
+    passages = []
     
-    for i, (doc, meta, dist) in enumerate(zip(documents, metadatas, distances)):
-        similarity = 1 / (1 + dist)
-        
-        if similarity > 0.5:
-            context_text += f"\n{doc}\n"
+    with span('context_formatting', chunks_in=len(documents)) as sp:
+        for i, (doc, meta, dist) in enumerate(zip(documents, metadatas, distances)):
+            similarity = 1 / (1 + dist)
             
-            source_info = {
-                'number': i+1,
-                'title': meta.get('title', 'Unknown'),
-                'source': meta.get('source', 'Unknown'),
-                'site': meta.get('site', ''),
-                'similarity': similarity
-            }
-            formatted_sources.append(source_info)
+            if similarity > SIMILARITY_THRESHOLD:
+                passages.append((doc, similarity))
+                
+                source_info = {
+                    'number': i+1,
+                    'title': meta.get('title', 'Unknown'),
+                    'source': meta.get('source', 'Unknown'),
+                    'site': meta.get('site', ''),
+                    'similarity': similarity
+                }
+                formatted_sources.append(source_info)
+        
+        # Best passages first, without chunk overlap or near-duplicates, within the token budget
+        context_text, kept, packing = pack_context(passages, CONTEXT_TOKEN_BUDGET)
+        # Only cite passages that made it into the prompt
+        formatted_sources = [formatted_sources[i] for i in kept]
+        sp.set(chunks_used=len(formatted_sources), context_chars=len(context_text), **packing)
     
     return context_text, formatted_sources
 
-def generate_answer(question, context):
-    """Generate answer in English (will be translated later)"""
-    prompt = f"""You are an expert ONLY on Tunisian archaeological sites. You can ONLY answer questions about Tunisia's ancient heritage.
+def build_prompt(question, context, language='en'):
+    return f"""You are an expert ONLY on Tunisian archaeological sites. You can ONLY answer questions about Tunisia's ancient heritage.
 
 Context from Tunisian archaeology database:
 {context}
@@ -270,67 +284,265 @@ CRITICAL INSTRUCTIONS:
 - NEVER use general world knowledge about non-Tunisian topics
 - DO NOT mention source numbers
 - If you can answer, write naturally in 2-4 sentences
-
+{answer_language_instruction(language)}
 Answer:"""
 
-    try:
-        response = ollama.generate(
+def generate_answer(question, context, language='en'):
+    """Generate answer in English (translated later) or directly in language"""
+    prompt = build_prompt(question, context, language)
+    with span('llm_generation', prompt_chars=len(prompt)) as sp:
+        try:
+            response = ollama.generate(
+                model='llama3',
+                prompt=prompt,
+                options={'temperature': 0.1, 'top_p': 0.9, 'num_predict': 300}
+            )
+            sp.set(prompt_tokens=response.get('prompt_eval_count'), tokens=response.get('eval_count'))
+            return response['response']
+        except Exception as e:
+            sp.set(error=str(e))
+            return f"Error: {str(e)}"
+
+def generate_answer_stream(question, context, stats, language='en'):
+    """Stream the answer from Llama 3, yielding text pieces as they arrive"""
+    prompt = build_prompt(question, context, language)
+    # Detached: the span stays open across yields without becoming the parent
+    # of whatever the consumer does in between (e.g. back-translation)
+    with span('llm_generation', detached=True, prompt_chars=len(prompt), stream=True) as sp:
+        yield from stream_tokens(ollama.generate(
             model='llama3',
             prompt=prompt,
+            stream=True,
             options={'temperature': 0.1, 'top_p': 0.9, 'num_predict': 300}
-        )
-        return response['response']
-    except Exception as e:
-        return f"Error: {str(e)}"
+        ), stats)
+        sp.set(prompt_tokens=stats.prompt_tokens, tokens=stats.tokens, ttft_ms=None if stats.ttft is None else stats.ttft * 1000,
+               tokens_per_second=stats.tokens_per_second, error=stats.error)
+
+def translate_question(question, user_language):
+    with span('translation', source=user_language, target='en', chars_in=len(question)) as sp:
+        question_english = translate_text(question, source_lang=user_language, target_lang='en')
+        sp.set(chars_out=len(question_english))
+    return question_english
+
+def answer_translator(user_language):
+    """Translate one answer sentence into the user's language, recording a span"""
+    def translate(sentence):
+        with span('back_translation', target=user_language, chars_in=len(sentence)) as sp:
+            translated = translate_text(sentence, source_lang='en', target_lang=user_language)
+            sp.set(chars_out=len(translated))
+            return translated
+    return translate
 
-def rag_query(question, user_language='en'):
-    """Main RAG query function with automatic multilingual support"""
+def localized_message(key, user_language):
+    with span('translation', message=key, target=user_language):
+        return system_message(key, user_language)
+
+def localized_refusal(answer, user_language):
+    """The localized system message for a refusal generated in English, or None"""
+    key = refusal_key(answer)
+    return localized_message(key, user_language) if key else None
+
+def stream_answer(result, question, question_english, context, user_language, question_embedding, direct=False):
+    """Yield answer text as it is generated, translating whole sentences for non-English users
+    
+    With direct=True Llama 3 writes in the user's language and only a refusal
+    is swapped for its pre-translated system message.
+    """
+    stats = result['stream_stats']
+    trace = result['trace']
+    with activate(trace):
+        if direct:
+            pieces = generate_answer_stream(question, context, stats, user_language)
+            pieces = intercept_refusal(pieces, lambda text: localized_refusal(text, user_language))
+        else:
+            pieces = generate_answer_stream(question_english, context, stats)
+            if user_language != 'en':
+                pieces = translate_sentences(pieces, answer_translator(user_language), executor=executor)
+        
+        for piece in pieces:
+            result['answer'] += piece
+            yield piece
+    
+    trace.finish()
+    
+    if stats.error is None:
+        answer_cache.put(question, result, user_language, embedding=question_embedding,
+                         answer_mode='direct' if direct else 'translate')
+
+def rag_query(question, user_language='en', stream=False, trace=None, answer_mode=ANSWER_MODE):
+    """Main RAG query function with automatic multilingual support
+    
+    Stages run on a shared thread pool where they can overlap: the question
+    is translated while the multilingual index is searched, and the answer is
+    translated sentence by sentence while Llama 3 is still generating. Every
+    stage is recorded as a span on result['trace'].
+    
+    With stream=True a generated answer is returned with an 'answer_stream'
+    generator that fills in result['answer'] as tokens arrive. With
+    answer_mode='direct' a non-English answer is generated in the user's
+    language instead of being translated back.
+    """
+    trace = trace or Trace('rag_query')
+    trace.attrs.update(language=user_language, question_chars=len(question), answer_mode=answer_mode)
+    with activate(trace):
+        result = run_rag_query(question, user_language, stream, answer_mode)
+    result['trace'] = trace
+    # A streamed answer closes its trace once the stream is consumed
+    if result.get('answer_stream') is None:
+        trace.finish()
+    return result
+
+def run_rag_query(question, user_language, stream, answer_mode=ANSWER_MODE):
+    """The rag_query pipeline, recorded on the active trace"""
+    direct = answer_mode == 'direct' and user_language != 'en'
+    # English answers are the same in both modes
+    cache_mode = 'direct' if direct else 'translate'
+    
+    # Exact repeat of a recent question: skip translation and generation
+    with span('answer_cache', kind='exact') as sp:
+        answer_cache.validate(collection_fingerprint(collection))
+        cached = answer_cache.get(question, user_language, answer_mode=cache_mode)
+        sp.set(cache_hit=cached is not None)
+    if cached:
+        return cached
     
-    # Step 1: Translate question to English for database search
     question_english = question
-    if user_language != 'en':
-        try:
-            question_english = translate_text(question, source_lang=user_language, target_lang='en')
-        except:
-            question_english = question
+    pending_translation = None
+    gate = domain_gate
+    searched_multilingual = multilingual is not None and user_language in MULTILINGUAL_LANGUAGES
+    if searched_multilingual:
+        # Steps 1-2: Search the multilingual index with the question as asked.
+        # The English question is only needed to generate an English answer,
+        # so that translation runs alongside retrieval (and not at all in
+        # direct mode)
+        if not direct:
+            pending_translation = submit(executor, translate_question, question, user_language)
+        with span('embedding', texts=1, model='multilingual'):
+            question_embedding = encode_questions(multilingual[0], [question])[0]
+        gate = multilingual[2]
+    else:
+        # Step 1: Translate question to English for database search
+        if user_language != 'en':
+            question_english = translate_question(question, user_language)
+        
+        # Step 2: Search database with English query
+        with span('embedding', texts=1):
+            question_embedding = embedding_model.encode([question_english])[0]
+    
+    with span('answer_cache', kind='semantic') as sp:
+        cached = answer_cache.get(question, user_language, embedding=question_embedding, answer_mode=cache_mode)
+        sp.set(cache_hit=cached is not None)
+    if cached:
+        return cached
+    
+    # Clearly off-domain: refuse without retrieval, generation or answer translation
+    if gate is not None:
+        with span('domain_gate') as sp:
+            accepted, score, nearest = gate.check(question_embedding)
+            sp.set(accepted=accepted, score=round(score, 3), nearest=nearest)
+        if not accepted:
+            result = {
+                'answer': localized_message('no_info', user_language),
+                'sources': [],
+                'cached': False
+            }
+            answer_cache.put(question, result, user_language, embedding=question_embedding, answer_mode=cache_mode)
+            return result
     
-    # Step 2: Search database with English query
-    results = retrieve_context(question_english, top_k=5)
+    if searched_multilingual:
+        results = retrieve_multilingual(question, top_k=5, question_embedding=question_embedding)
+    else:
+        results = retrieve_context(question_english, top_k=5, question_embedding=question_embedding)
     context, sources = format_context(results)
     
     # Step 3: Check if we have relevant sources
     if not sources:
-        no_info_msg = "I don't have information about this topic. I can only answer questions about Tunisian archaeological sites like Carthage, Dougga, El Jem, Kerkouane, Sbeitla, and Bulla Regia."
-        if user_language != 'en':
-            no_info_msg = translate_text(no_info_msg, source_lang='en', target_lang=user_language)
-        return {
-            'answer': no_info_msg,
-            'sources': []
+        result = {
+            'answer': localized_message('no_info', user_language),
+            'sources': [],
+            'cached': False
         }
-    
-    # Step 4: Check similarity threshold
-    avg_similarity = sum(s['similarity'] for s in sources) / len(sources)
-    
-    if avg_similarity < 0.45:
-        not_found_msg = "I couldn't find relevant information about this in my database. Please ask about Tunisian archaeological sites."
-        if user_language != 'en':
-            not_found_msg = translate_text(not_found_msg, source_lang='en', target_lang=user_language)
-        return {
-            'answer': not_found_msg,
-            'sources': []
+        answer_cache.put(question, result, user_language, embedding=question_embedding, answer_mode=cache_mode)
+        return result
+    
+    # Step 4: Check the average similarity, with the same gate as rag.py and evaluate.py
+    if not passes_relevance_gate([s['similarity'] for s in sources]):
+        result = {
+            'answer': localized_message('not_found', user_language),
+            'sources': [],
+            'cached': False
         }
+        answer_cache.put(question, result, user_language, embedding=question_embedding, answer_mode=cache_mode)
+        return result
+    
+    # Step 5: Generate answer in English, or directly in the user's language
+    if pending_translation is not None:
+        question_english = pending_translation.result()
+    if stream:
+        result = {'answer': '', 'sources': sources, 'cached': False, 'stream_stats': StreamStats()}
+        result['answer_stream'] = stream_answer(result, question, question_english, context, user_language,
+                                                question_embedding, direct)
+        return result
+    
+    if user_language == 'en':
+        answer = generate_answer(question_english, context)
+        generation_failed = answer.startswith("Error:")
+    elif direct:
+        # Retrieval ran in English; Llama 3 reads the original question and
+        # answers in its language, so there is no back-translation
+        answer = generate_answer(question, context, user_language)
+        generation_failed = answer.startswith("Error:")
+        answer = localized_refusal(answer, user_language) or answer
+    else:
+        # Step 6: Translate answer back to user's language, one finished
+        # sentence at a time while the following ones are still generated
+        stats = StreamStats()
+        pieces = generate_answer_stream(question_english, context, stats)
+        answer = ''.join(translate_sentences(pieces, answer_translator(user_language), executor=executor))
+        generation_failed = stats.error is not None
+    
+    result = {'answer': answer, 'sources': sources, 'cached': False}
+    if not generation_failed:
+        answer_cache.put(question, result, user_language, embedding=question_embedding, answer_mode=cache_mode)
+    return result
+
+def render_answer(result, query_ms):
+    """Show the answer card, streaming tokens in first when the answer is being generated"""
+    if result.get('answer_stream') is not None:
+        placeholder = st.empty()
+        for _ in result['answer_stream']:
+            placeholder.markdown(result['answer'] + " ▌")
+        placeholder.empty()
+    
+    # Check for various "can't answer" messages in different languages
+    cant_answer_keywords = [
+        "can only answer", "couldn't find", "ne peux", "n'ai pas",
+        "فقط", "لا أملك", "solo puedo", "nur", "alleen", "только"
+    ]
     
-    # Step 5: Generate answer in English
-    answer = generate_answer(question_english, context)
+    is_rejection = any(keyword in result['answer'].lower() for keyword in cant_answer_keywords)
     
-    # Step 6: Translate answer back to user's language
-    if user_language != 'en':
-        try:
-            answer = translate_text(answer, source_lang='en', target_lang=user_language)
-        except:
-            pass
+    if is_rejection:
+        st.warning(result['answer'])
+    else:
+        st.success(result['answer'])
+    
+    if result.get('cached'):
+        st.caption(f"⚡ Cached answer ({result['cache_match']} match) · {query_ms:.0f} ms")
+    elif result.get('stream_stats') is not None:
+        st.caption(f"⚡ Streamed · {result['stream_stats'].summary()}")
     
-    return {'answer': answer, 'sources': sources}
+    trace = result.get('trace')
+    if trace is not None and trace.duration_ms is not None:
+        st.caption(f"⏱️ {trace.duration_ms:.0f} ms end-to-end · {trace.stage_ms():.0f} ms of stage work")
+        if show_trace:
+            render_trace(trace)
+
+def render_trace(trace):
+    """Debug panel listing every span of the request"""
+    with st.expander("🐞 Latency trace"):
+        st.dataframe(trace.to_dict()['spans'], use_container_width=True)
+        st.download_button("⬇️ Download JSON", trace.to_json(), file_name=f"trace_{trace.id}.json", mime="application/json")
 
 # Header - Tailwind style
 st.markdown("""
@@ -423,6 +635,21 @@ with st.sidebar:
         if st.button(f"💬 {q}", key=q, use_container_width=True):
             st.session_state.question = q
             st.rerun()
+    
+    st.markdown("<br>", unsafe_allow_html=True)
+    stream_answers = st.toggle("⚡ Stream answers", value=True, help="Show the answer token by token as Llama 3 writes it")
+    answer_mode = 'direct' if st.toggle("🗣️ Answer directly in my language", value=ANSWER_MODE == 'direct',
+                                        help="Llama 3 writes non-English answers itself instead of translating an English answer") else 'translate'
+    show_trace = st.toggle("🐞 Show latency trace", value=False, help="Per-stage timings, sizes and cache hits for each answer")
+    cache_stats = embedding_model.stats()
+    st.caption(f"⚡ Embedding cache ({ENCODER_BACKEND}): {cache_stats['hits']} hits · {cache_stats['misses']} misses")
+    translation_stats = translation_cache.stats()
+    st.caption(f"🌍 Translation cache: {translation_stats['hits']} hits · {translation_stats['misses']} misses")
+    store_name = f"{collection.backend} via {RETRIEVAL_SERVER}" if isinstance(collection, RemoteStore) else VECTOR_STORE
+    st.caption(f"🗄️ Vector store: {store_name} · {RETRIEVAL_MODE} retrieval · {TOP_K_POLICY} top_k{' + MMR' if MMR_ENABLED else ''} · "
+               f"{collection.count()} chunks")
+    if multilingual is not None:
+        st.caption(f"🌐 Multilingual index: {len(MULTILINGUAL_LANGUAGES)} languages searched without translation")
 
 # Initialize session state
 if 'history' not in st.session_state:
@@ -484,7 +711,9 @@ with col2:
             st.success(f"✅ Transcribed: **{text}**")
             
             # AUTO-PROCESS THE QUESTION
-            detected_lang = detect_language(text)
+            trace = Trace('rag_query', input='voice')
+            with activate(trace):
+                detected_lang = detect_language(text)
             lang_name = LANGUAGE_NAMES.get(detected_lang, detected_lang.upper())
             
             lang_flags = {
@@ -498,48 +727,39 @@ with col2:
             st.info(f"{flag} Detected language: **{lang_name}**")
             
             with st.spinner("🤔 Searching through ancient texts..."):
-                result = rag_query(text, detected_lang)
-                
-                st.markdown("### 📝 Answer")
-                
-                cant_answer_keywords = [
-                    "can only answer", "couldn't find", "ne peux", "n'ai pas",
-                    "فقط", "لا أملك", "solo puedo", "nur", "alleen", "только"
-                ]
-                
-                is_rejection = any(keyword in result['answer'].lower() for keyword in cant_answer_keywords)
-                
-                if is_rejection:
-                    st.warning(result['answer'])
-                else:
-                    st.success(result['answer'])
+                query_start = time.perf_counter()
+                result = rag_query(text, detected_lang, stream=stream_answers, trace=trace, answer_mode=answer_mode)
+                query_ms = (time.perf_counter() - query_start) * 1000
+            
+            st.markdown("### 📝 Answer")
+            render_answer(result, query_ms)
+            
+            if result['sources']:
+                st.markdown("### 📚 Referenced Sources")
                 
-                if result['sources']:
-                    st.markdown("### 📚 Referenced Sources")
+                for source in result['sources']:
+                    similarity_percentage = source['similarity'] * 100
                     
-                    for source in result['sources']:
-                        similarity_percentage = source['similarity'] * 100
-                        
-                        if similarity_percentage > 70:
-                            color = "🟢"
-                        elif similarity_percentage > 50:
-                            color = "🟡"
-                        else:
-                            color = "🟠"
-                        
-                        with st.expander(f"{color} **{source['title']}** (Relevance: {similarity_percentage:.0f}%)"):
-                            st.markdown(f"**📖 Source:** {source['source']}")
-                            if source['site']:
-                                st.markdown(f"**📍 Site:** {source['site']}")
-                            st.progress(source['similarity'])
-                
-                # Add to history
-                st.session_state.history.append({
-                    'question': text,
-                    'answer': result['answer'],
-                    'sources': result['sources'],
-                    'language': lang_name
-                })
+                    if similarity_percentage > 70:
+                        color = "🟢"
+                    elif similarity_percentage > 50:
+                        color = "🟡"
+                    else:
+                        color = "🟠"
+                    
+                    with st.expander(f"{color} **{source['title']}** (Relevance: {similarity_percentage:.0f}%)"):
+                        st.markdown(f"**📖 Source:** {source['source']}")
+                        if source['site']:
+                            st.markdown(f"**📍 Site:** {source['site']}")
+                        st.progress(source['similarity'])
+            
+            # Add to history
+            st.session_state.history.append({
+                'question': text,
+                'answer': result['answer'],
+                'sources': result['sources'],
+                'language': lang_name
+            })
             
         except sr.UnknownValueError:
             st.error("❌ Could not understand audio")
@@ -567,7 +787,9 @@ with col2:
     
     if ask_button and question:
         # Detect language automatically
-        detected_lang = detect_language(question)
+        trace = Trace('rag_query', input='text')
+        with activate(trace):
+            detected_lang = detect_language(question)
         
         # Get language name
         lang_name = LANGUAGE_NAMES.get(detected_lang, detected_lang.upper())
@@ -584,52 +806,42 @@ with col2:
         st.info(f"{flag} Detected language: **{lang_name}**")
         
         with st.spinner("🤔 Searching through ancient texts..."):
-            result = rag_query(question, detected_lang)
-            
+            query_start = time.perf_counter()
+            result = rag_query(question, detected_lang, stream=stream_answers, trace=trace, answer_mode=answer_mode)
+            query_ms = (time.perf_counter() - query_start) * 1000
+        
+        st.markdown("<br>", unsafe_allow_html=True)
+        st.markdown("### 📝 Answer")
+        render_answer(result, query_ms)
+        
+        if result['sources']:
             st.markdown("<br>", unsafe_allow_html=True)
-            st.markdown("### 📝 Answer")
-            
-            # Check for various "can't answer" messages in different languages
-            cant_answer_keywords = [
-                "can only answer", "couldn't find", "ne peux", "n'ai pas",
-                "فقط", "لا أملك", "solo puedo", "nur", "alleen", "только"
-            ]
-            
-            is_rejection = any(keyword in result['answer'].lower() for keyword in cant_answer_keywords)
-            
-            if is_rejection:
-                st.warning(result['answer'])
-            else:
-                st.success(result['answer'])
+            st.markdown("### 📚 Referenced Sources")
             
-            if result['sources']:
-                st.markdown("<br>", unsafe_allow_html=True)
-                st.markdown("### 📚 Referenced Sources")
+            for source in result['sources']:
+                similarity_percentage = source['similarity'] * 100
                 
-                for source in result['sources']:
-                    similarity_percentage = source['similarity'] * 100
-                    
-                    if similarity_percentage > 70:
-                        color = "🟢"
-                    elif similarity_percentage > 50:
-                        color = "🟡"
-                    else:
-                        color = "🟠"
-                    
-                    with st.expander(f"{color} **{source['title']}** (Relevance: {similarity_percentage:.0f}%)"):
-                        st.markdown(f"**📖 Source:** {source['source']}")
-                        if source['site']:
-                            st.markdown(f"**📍 Site:** {source['site']}")
-                        st.progress(source['similarity'])
-            
-            st.session_state.history.append({
-                'question': question,
-                'answer': result['answer'],
-                'sources': result['sources'],
-                'language': lang_name
-            })
-            
-            st.session_state.question = ""
+                if similarity_percentage > 70:
+                    color = "🟢"
+                elif similarity_percentage > 50:
+                    color = "🟡"
+                else:
+                    color = "🟠"
+                
+                with st.expander(f"{color} **{source['title']}** (Relevance: {similarity_percentage:.0f}%)"):
+                    st.markdown(f"**📖 Source:** {source['source']}")
+                    if source['site']:
+                        st.markdown(f"**📍 Site:** {source['site']}")
+                    st.progress(source['similarity'])
+        
+        st.session_state.history.append({
+            'question': question,
+            'answer': result['answer'],
+            'sources': result['sources'],
+            'language': lang_name
+        })
+        
+        st.session_state.question = ""
 
 # History
 if st.session_state.history:
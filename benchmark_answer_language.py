@@ -0,0 +1,154 @@
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+from rag import (warmup, get_embedding_model, retrieve_context, format_context, generate_answer,
+                 passes_relevance_gate, SIMILARITY_THRESHOLD, MIN_AVG_SIMILARITY)
+from translation import backend, detect_language, translate_text, system_message, refusal_key, LANGUAGE_NAMES
+from evaluate import test_questions
+
+LANGUAGES = ['fr', 'es', 'de', 'ar']
+
+def topic_coverage(answer_english, expected_topics):
+    """Share of the expected topic keywords found in the (English) answer"""
+    if not expected_topics:
+        return None
+    lowered = answer_english.lower()
+    return sum(1 for topic in expected_topics if topic.lower() in lowered) / len(expected_topics)
+
+def timed(function, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    return value, (time.perf_counter() - start) * 1000
+
+def two_hop(question_english, context, language):
+    """Current flow: answer in English, then one remote call to translate it back"""
+    answer, generation_ms = timed(generate_answer, question_english, context)
+    key = refusal_key(answer)
+    if key:
+        return system_message(key, language), answer, generation_ms, 0.0
+    # Straight to the backend: a translation cache hit would hide the round trip
+    translated, translation_ms = timed(backend.translate, answer, 'en', language)
+    return translated or answer, answer, generation_ms, translation_ms
+
+def direct(question, context, language):
+    """Direct flow: Llama 3 answers in the user's language"""
+    answer, generation_ms = timed(generate_answer, question, context, language)
+    key = refusal_key(answer)
+    if key:
+        return system_message(key, language), True, generation_ms
+    return answer, False, generation_ms
+
+def run(languages, limit=None):
+    model = get_embedding_model()
+    questions = test_questions[:limit] if limit else test_questions
+    rows = []
+    for language in languages:
+        print(f"\n🌍 {LANGUAGE_NAMES.get(language, language)}")
+        for test in questions:
+            question = translate_text(test['question'], source_lang='en', target_lang=language)
+            # Shared by both flows: the question is translated and retrieval runs in English
+            question_english, question_translation_ms = timed(backend.translate, question, language, 'en')
+            question_english = question_english or test['question']
+            results, retrieval_ms = timed(retrieve_context, question_english)
+            context, sources = format_context(results)
+            similarities = [1 / (1 + d) for d in results['distances'][0]]
+            if not passes_relevance_gate(similarities, SIMILARITY_THRESHOLD, MIN_AVG_SIMILARITY):
+                print(f"  ⊘ {question[:60]} (refused before generation in both flows)")
+                continue
+
+            shared_ms = question_translation_ms + retrieval_ms
+            two_hop_answer, english_answer, two_hop_generation_ms, back_translation_ms = two_hop(
+                question_english, context, language)
+            direct_answer, direct_refused, direct_generation_ms = direct(question, context, language)
+
+            # Quality: topic keywords and refusals judged on English versions of both answers
+            direct_english = translate_text(direct_answer, source_lang=language, target_lang='en')
+            vectors = model.encode([english_answer, direct_english])
+            agreement = float(np.dot(vectors[0], vectors[1]) /
+                              (np.linalg.norm(vectors[0]) * np.linalg.norm(vectors[1]) or 1))
+            on_topic = test['category'] != 'off-topic'
+            row = {
+                'language': language,
+                'question': question,
+                'category': test['category'],
+                'shared_ms': shared_ms,
+                'two_hop_ms': shared_ms + two_hop_generation_ms + back_translation_ms,
+                'direct_ms': shared_ms + direct_generation_ms,
+                'back_translation_ms': back_translation_ms,
+                'two_hop_language_ok': detect_language(two_hop_answer) == language,
+                'direct_language_ok': detect_language(direct_answer) == language,
+                'two_hop_coverage': topic_coverage(english_answer, test.get('expected_topics')),
+                'direct_coverage': topic_coverage(direct_english, test.get('expected_topics')),
+                'two_hop_refusal_correct': (refusal_key(english_answer) is None) == on_topic,
+                'direct_refusal_correct': (not direct_refused) == on_topic,
+                'agreement': agreement,
+                'two_hop_answer': two_hop_answer,
+                'direct_answer': direct_answer
+            }
+            rows.append(row)
+            print(f"  ✓ {question[:60]}: two-hop {row['two_hop_ms']:.0f} ms, direct {row['direct_ms']:.0f} ms, "
+                  f"agreement {agreement:.2f}")
+    return rows
+
+def summarize(rows):
+    def mean(key, subset):
+        values = [r[key] for r in subset if r[key] is not None]
+        return sum(values) / len(values) if values else None
+
+    summary = {}
+    for language in sorted(set(r['language'] for r in rows)):
+        subset = [r for r in rows if r['language'] == language]
+        summary[language] = {
+            'questions': len(subset),
+            'two_hop_p50_ms': float(np.percentile([r['two_hop_ms'] for r in subset], 50)),
+            'direct_p50_ms': float(np.percentile([r['direct_ms'] for r in subset], 50)),
+            'back_translation_ms': mean('back_translation_ms', subset),
+            'two_hop_language_ok': mean('two_hop_language_ok', subset),
+            'direct_language_ok': mean('direct_language_ok', subset),
+            'two_hop_coverage': mean('two_hop_coverage', subset),
+            'direct_coverage': mean('direct_coverage', subset),
+            'two_hop_refusal_correct': mean('two_hop_refusal_correct', subset),
+            'direct_refusal_correct': mean('direct_refusal_correct', subset),
+            'agreement': mean('agreement', subset)
+        }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the translate-back and direct-language answer flows")
+    parser.add_argument('--languages', nargs='+', default=LANGUAGES)
+    parser.add_argument('--limit', type=int, help="only the first N evaluate.py test questions")
+    args = parser.parse_args()
+
+    print("="*80)
+    print("ANSWER LANGUAGE BENCHMARK - two-hop (translate back) vs direct generation")
+    print("="*80)
+    warmup()
+    rows = run(args.languages, args.limit)
+    if not rows:
+        print("\n⚠️  No answered questions to compare")
+        return 1
+    summary = summarize(rows)
+
+    print(f"\n{'lang':<5} {'n':>3} {'two-hop p50':>12} {'direct p50':>11} {'saved':>8} "
+          f"{'lang ok':>13} {'topics':>13} {'refusals':>13} {'agree':>6}")
+    for language, s in summary.items():
+        print(f"{language:<5} {s['questions']:>3} {s['two_hop_p50_ms']:>10.0f}ms {s['direct_p50_ms']:>9.0f}ms "
+              f"{s['two_hop_p50_ms'] - s['direct_p50_ms']:>6.0f}ms "
+              f"{s['two_hop_language_ok']:>6.2f}/{s['direct_language_ok']:<6.2f}"
+              f"{s['two_hop_coverage'] or 0:>6.2f}/{s['direct_coverage'] or 0:<6.2f}"
+              f"{s['two_hop_refusal_correct']:>6.2f}/{s['direct_refusal_correct']:<6.2f}"
+              f"{s['agreement']:>6.2f}")
+    print("(quality columns: two-hop/direct)")
+
+    output_file = "answer_language_benchmark.json"
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), 'summary': summary, 'results': rows},
+                  f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Results saved to: {output_file}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
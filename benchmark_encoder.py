@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import subprocess
+from datetime import datetime
+import numpy as np
+
+BACKENDS = ['torch', 'onnx', 'onnx-int8']
+QUERY_RUNS = 200
+BATCH_SIZE = 32
+
+def rss_mb():
+    """Current and peak resident set size of this process, in MB"""
+    status = {}
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            status[key] = value.strip()
+    return int(status['VmRSS'].split()[0]) / 1024, int(status['VmHWM'].split()[0]) / 1024
+
+def measure(backend, questions, chunks):
+    """Load one backend and time it; runs in a fresh process so RSS is its own"""
+    baseline_mb, _ = rss_mb()
+    start = time.perf_counter()
+    from encoder_backend import load_encoder_model
+    model = load_encoder_model(backend=backend)
+    load_ms = (time.perf_counter() - start) * 1000
+    loaded_mb, _ = rss_mb()
+
+    # Warm up kernels and allocators before timing anything
+    model.encode(questions[:4])
+
+    latencies = []
+    for i in range(QUERY_RUNS):
+        start = time.perf_counter()
+        model.encode([questions[i % len(questions)]])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    best_seconds = None
+    for _ in range(3):
+        start = time.perf_counter()
+        model.encode(chunks, batch_size=BATCH_SIZE)
+        elapsed = time.perf_counter() - start
+        best_seconds = elapsed if best_seconds is None else min(best_seconds, elapsed)
+
+    current_mb, peak_mb = rss_mb()
+    return {
+        'backend': backend,
+        'load_ms': load_ms,
+        'query_p50_ms': float(np.percentile(latencies, 50)),
+        'query_p95_ms': float(np.percentile(latencies, 95)),
+        'batch_texts_per_sec': len(chunks) / best_seconds,
+        'rss_baseline_mb': baseline_mb,
+        'rss_loaded_mb': loaded_mb,
+        'rss_mb': current_mb,
+        'rss_peak_mb': peak_mb
+    }
+
+def benchmark_texts(limit):
+    from evaluate import test_questions, off_topic_questions
+    from vector_store import open_store
+    questions = [test['question'] for test in test_questions] + list(off_topic_questions)
+    chunks = open_store().get(include=['documents'])['documents'][:limit]
+    return questions, chunks
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query encoder backends: latency, throughput and RSS")
+    parser.add_argument('--backends', nargs='+', default=BACKENDS)
+    parser.add_argument('--chunks', type=int, default=512, help="stored chunks encoded for the batch throughput")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--texts', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.texts, 'r', encoding='utf-8') as f:
+            texts = json.load(f)
+        print(json.dumps(measure(args.child, texts['questions'], texts['chunks'])))
+        return 0
+
+    print("="*80)
+    print("QUERY ENCODER BENCHMARK - " + " vs ".join(args.backends))
+    print("="*80)
+    questions, chunks = benchmark_texts(args.chunks)
+    print(f"{len(questions)} questions x {QUERY_RUNS} single-query encodes, {len(chunks)} chunks in batches of {BATCH_SIZE}\n")
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as f:
+        json.dump({'questions': questions, 'chunks': chunks}, f)
+        texts_path = f.name
+    results = []
+    try:
+        for backend in args.backends:
+            child = subprocess.run([sys.executable, __file__, '--child', backend, '--texts', texts_path],
+                                   capture_output=True, text=True)
+            if child.returncode != 0:
+                print(f"✗ {backend}: {child.stderr.strip().splitlines()[-1] if child.stderr.strip() else 'failed'}")
+                continue
+            results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+            print(f"✓ {backend} measured")
+    finally:
+        os.unlink(texts_path)
+    if not results:
+        return 1
+
+    print(f"\n{'backend':<10} {'load':>8} {'query p50':>10} {'query p95':>10} {'batch':>12} {'RSS':>9} {'peak RSS':>9}")
+    for r in results:
+        print(f"{r['backend']:<10} {r['load_ms']:>6.0f}ms {r['query_p50_ms']:>8.2f}ms {r['query_p95_ms']:>8.2f}ms "
+              f"{r['batch_texts_per_sec']:>7.1f} t/s {r['rss_mb']:>6.0f} MB {r['rss_peak_mb']:>6.0f} MB")
+
+    # Parity was measured when the models were exported
+    try:
+        from encoder_backend import ONNX_MODEL_DIR
+        with open(os.path.join(ONNX_MODEL_DIR, 'meta.json'), 'r', encoding='utf-8') as f:
+            parity = json.load(f).get('parity', {})
+        for backend, report in parity.items():
+            print(f"🔬 {backend} parity: cosine min {report['min_cosine']:.5f}, mean {report['mean_cosine']:.5f}")
+    except OSError:
+        parity = {}
+
+    output_file = "encoder_benchmark.json"
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), 'results': results, 'parity': parity}, f, indent=2)
+    print(f"\n💾 Results saved to: {output_file}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+from rag import (warmup, get_embedding_model, get_multilingual_model, get_multilingual_store, search,
+                 passes_relevance_gate, RETRIEVAL_MODE)
+from translation import backend, translate_text, LANGUAGE_NAMES
+from evaluate import test_questions, off_topic_questions, score_retrieval
+from domain_gate import unit_rows
+from multilingual_index import MULTILINGUAL_MODEL, MULTILINGUAL_LANGUAGES
+
+LANGUAGES = ['fr', 'ar', 'es', 'de', 'it']
+
+def uncached_encode(encoder, texts):
+    # Straight to the model: embedding cache hits would hide the encode time
+    return np.asarray(encoder.model.encode(texts, show_progress_bar=False), dtype=np.float32)
+
+def timed(function, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    return value, (time.perf_counter() - start) * 1000
+
+def translate_then_search(question, language, top_k):
+    """Current path: translate the question, then search the MiniLM index"""
+    question_english, translation_ms = timed(backend.translate, question, language, 'en')
+    question_english = question_english or question
+    embeddings, encode_ms = timed(uncached_encode, get_embedding_model(), [question_english])
+    results, search_ms = timed(search, [question_english], embeddings, top_k, RETRIEVAL_MODE)
+    return results, {'translation_ms': translation_ms, 'encode_ms': encode_ms, 'search_ms': search_ms}
+
+def multilingual_search(question, top_k):
+    """Search the multilingual index with the question as asked"""
+    embeddings, encode_ms = timed(lambda texts: unit_rows(uncached_encode(get_multilingual_model(), texts)), [question])
+    results, search_ms = timed(lambda: get_multilingual_store().query(query_embeddings=embeddings.tolist(),
+                                                                      n_results=top_k))
+    return results, {'translation_ms': 0.0, 'encode_ms': encode_ms, 'search_ms': search_ms}
+
+def score(test, results):
+    retrieved_files = [meta.get('filename', '') for meta in results['metadatas'][0]]
+    similarities = [1 / (1 + dist) for dist in results['distances'][0]]
+    recall, reciprocal_rank = score_retrieval(test['relevant_files'], retrieved_files)
+    accepted = passes_relevance_gate(similarities)
+    return {
+        'recall': recall,
+        'reciprocal_rank': reciprocal_rank,
+        'gate_correct': accepted == (test['category'] != 'off-topic'),
+        'top_similarity': max(similarities) if similarities else 0
+    }
+
+def summarize(rows):
+    labelled = [r for r in rows if r['recall'] is not None]
+    totals = [r['translation_ms'] + r['encode_ms'] + r['search_ms'] for r in rows]
+    return {
+        'questions': len(rows),
+        'recall': sum(r['recall'] for r in labelled) / len(labelled) if labelled else 0,
+        'mrr': sum(r['reciprocal_rank'] for r in labelled) / len(labelled) if labelled else 0,
+        'gate_accuracy': sum(1 for r in rows if r['gate_correct']) / len(rows),
+        'p50_ms': float(np.percentile(totals, 50)),
+        'translation_p50_ms': float(np.percentile([r['translation_ms'] for r in rows], 50))
+    }
+
+def run(languages, top_k=5):
+    questions = [test for test in test_questions if test['relevant_files'] or test['category'] == 'off-topic']
+    questions += [{'question': q, 'category': 'off-topic', 'relevant_files': []} for q in off_topic_questions]
+    report = {}
+
+    # Reference: the English questions against the MiniLM index
+    english = []
+    for test in questions:
+        embeddings, encode_ms = timed(uncached_encode, get_embedding_model(), [test['question']])
+        results, search_ms = timed(search, [test['question']], embeddings, top_k, RETRIEVAL_MODE)
+        english.append(dict(score(test, results), translation_ms=0.0, encode_ms=encode_ms, search_ms=search_ms))
+    report['en'] = {'english': summarize(english)}
+
+    for language in languages:
+        print(f"\n🌍 {LANGUAGE_NAMES.get(language, language)} ({len(questions)} questions)")
+        rows = {'translate': [], 'multilingual': []}
+        for test in questions:
+            # Setup, not timed: the question as a speaker of this language would ask it
+            question = translate_text(test['question'], source_lang='en', target_lang=language)
+            results, timings = translate_then_search(question, language, top_k)
+            rows['translate'].append(dict(score(test, results), question=question, **timings))
+            results, timings = multilingual_search(question, top_k)
+            rows['multilingual'].append(dict(score(test, results), question=question, **timings))
+        report[language] = {path: summarize(path_rows) for path, path_rows in rows.items()}
+        report[language]['results'] = rows
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare translate-then-search with the multilingual index")
+    parser.add_argument('--languages', nargs='+', default=LANGUAGES)
+    parser.add_argument('--top-k', type=int, default=5)
+    args = parser.parse_args()
+
+    unsupported = [language for language in args.languages if language not in MULTILINGUAL_LANGUAGES]
+    if unsupported:
+        print(f"⚠️  Not in {MULTILINGUAL_MODEL}'s training data, expect weak results: {', '.join(unsupported)}")
+
+    print("="*80)
+    print("MULTILINGUAL RETRIEVAL BENCHMARK - translate then search vs multilingual index")
+    print("="*80)
+    warmup()
+    get_multilingual_store()
+    report = run(args.languages, args.top_k)
+
+    print(f"\n{'lang':<5} {'path':<13} {'recall@' + str(args.top_k):>9} {'MRR':>6} {'gate':>6} "
+          f"{'p50':>9} {'translate':>10}")
+    for language, paths in report.items():
+        for path, s in paths.items():
+            if path == 'results':
+                continue
+            print(f"{language:<5} {path:<13} {s['recall']:>9.3f} {s['mrr']:>6.3f} {s['gate_accuracy']:>6.2f} "
+                  f"{s['p50_ms']:>7.1f}ms {s['translation_p50_ms']:>8.1f}ms")
+
+    output_file = "multilingual_retrieval_benchmark.json"
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), 'model': MULTILINGUAL_MODEL, 'top_k': args.top_k,
+                   'report': report}, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Results saved to: {output_file}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import sys
+import json
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import ollama
+from rag import (warmup, retrieve_context, format_context, build_prompt, passes_relevance_gate,
+                 SIMILARITY_THRESHOLD, MIN_AVG_SIMILARITY)
+from streaming import StreamStats, stream_tokens, translate_sentences
+from tracing import Trace, activate, span
+from translation import backend, translate_text, LANGUAGE_NAMES
+from evaluate import test_questions
+
+LANGUAGES = ['fr', 'de']
+
+def translate(text, source, target, stage):
+    # Straight to the backend: a translation cache hit would hide the round trip
+    with span(stage, chars_in=len(text)):
+        return backend.translate(text, source, target) or text
+
+def generate(prompt):
+    """Stream the English answer, like app.py's generate_answer_stream"""
+    stats = StreamStats()
+    with span('llm_generation', detached=True, prompt_chars=len(prompt)):
+        yield from stream_tokens(ollama.generate(
+            model='llama3',
+            prompt=prompt,
+            stream=True,
+            options={'temperature': 0.1, 'top_p': 0.9, 'num_predict': 300}
+        ), stats)
+
+def run_pipeline(question, language, context, overlapped, executor):
+    """One non-English question, answered and translated back; returns its trace
+
+    Sequential waits for the whole answer before translating its sentences;
+    overlapped translates each sentence while the next ones are generated,
+    as app.py does.
+    """
+    trace = Trace('pipeline', overlapped=overlapped)
+    with activate(trace):
+        question_english = translate(question, language, 'en', 'translation')
+        with span('retrieval'):
+            retrieve_context(question_english)
+        pieces = generate(build_prompt(question_english, context))
+        back = lambda sentence: translate(sentence, 'en', language, 'back_translation')
+        if overlapped:
+            answer = ''.join(translate_sentences(pieces, back, executor=executor))
+        else:
+            # The whole answer first, then its sentences one after another
+            answer = ''.join(translate_sentences(list(pieces), back))
+    trace.finish()
+    trace.attrs['answer_chars'] = len(answer)
+    return trace
+
+def run(languages, limit=None):
+    questions = test_questions[:limit] if limit else test_questions
+    rows = []
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for language in languages:
+            print(f"\n🌍 {LANGUAGE_NAMES.get(language, language)}")
+            for test in questions:
+                question = translate_text(test['question'], source_lang='en', target_lang=language)
+                results = retrieve_context(test['question'])
+                context, sources = format_context(results)
+                similarities = [1 / (1 + d) for d in results['distances'][0]]
+                if not passes_relevance_gate(similarities, SIMILARITY_THRESHOLD, MIN_AVG_SIMILARITY):
+                    continue
+
+                row = {'language': language, 'question': question, 'category': test['category']}
+                # Alternate the order so neither flow always runs on a warm Ollama
+                flows = [False, True] if len(rows) % 2 == 0 else [True, False]
+                for overlapped in flows:
+                    trace = run_pipeline(question, language, context, overlapped, executor)
+                    name = 'overlapped' if overlapped else 'sequential'
+                    row[f'{name}_ms'] = trace.duration_ms
+                    row[f'{name}_stage_ms'] = trace.stage_ms()
+                rows.append(row)
+                print(f"  ✓ {question[:60]}: sequential {row['sequential_ms']:.0f} ms, "
+                      f"overlapped {row['overlapped_ms']:.0f} ms (stages {row['overlapped_stage_ms']:.0f} ms)")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how much overlapping back-translation with generation saves")
+    parser.add_argument('--languages', nargs='+', default=LANGUAGES)
+    parser.add_argument('--limit', type=int, help="only the first N evaluate.py test questions")
+    args = parser.parse_args()
+
+    print("="*80)
+    print("PIPELINE BENCHMARK - sequential vs overlapped answer translation")
+    print("="*80)
+    warmup()
+    rows = run(args.languages, args.limit)
+    if not rows:
+        print("\n⚠️  No answered questions to measure")
+        return 1
+
+    summary = {}
+    print(f"\n{'lang':<5} {'n':>3} {'sequential p50':>15} {'overlapped p50':>15} {'stage sum p50':>14} {'saved p50':>10}")
+    for language in sorted(set(r['language'] for r in rows)):
+        subset = [r for r in rows if r['language'] == language]
+        p50 = lambda key: float(np.percentile([r[key] for r in subset], 50))
+        summary[language] = {
+            'questions': len(subset),
+            'sequential_p50_ms': p50('sequential_ms'),
+            'overlapped_p50_ms': p50('overlapped_ms'),
+            'overlapped_stage_p50_ms': p50('overlapped_stage_ms'),
+            'saved_p50_ms': float(np.percentile([r['sequential_ms'] - r['overlapped_ms'] for r in subset], 50))
+        }
+        s = summary[language]
+        print(f"{language:<5} {s['questions']:>3} {s['sequential_p50_ms']:>13.0f}ms {s['overlapped_p50_ms']:>13.0f}ms "
+              f"{s['overlapped_stage_p50_ms']:>12.0f}ms {s['saved_p50_ms']:>8.0f}ms")
+    print("(stage sum: summed span times of the overlapped run; above its end-to-end time when stages overlap)")
+
+    output_file = "pipeline_benchmark.json"
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), 'summary': summary, 'results': rows},
+                  f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Results saved to: {output_file}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
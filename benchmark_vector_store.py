@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+from vector_store import NumpyStore, chroma_collection
+
+# Corpus multiples to benchmark; larger corpora are the original chunks plus noise
+SCALES = [1, 10, 100]
+QUERIES = 200
+TOP_K = 5
+
+def rss_mb():
+    """Resident memory of this process in MB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def load_corpus(synthetic):
+    """Embeddings, documents and metadata of the real collection (or random vectors)"""
+    if synthetic:
+        rng = np.random.default_rng(0)
+        embeddings = rng.standard_normal((500, 384)).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        documents = [f"synthetic chunk {i}" for i in range(len(embeddings))]
+        metadatas = [{'filename': f"synthetic_{i % 50}.txt"} for i in range(len(embeddings))]
+        return embeddings, documents, metadatas
+    data = chroma_collection().get(include=['embeddings', 'documents', 'metadatas'])
+    return np.asarray(data['embeddings'], dtype=np.float32), data['documents'], data['metadatas']
+
+def scaled_corpus(embeddings, documents, metadatas, scale, rng):
+    """Replicate the corpus scale times, perturbing every copy after the first"""
+    copies = [embeddings]
+    for _ in range(scale - 1):
+        noisy = embeddings + rng.normal(0, 0.02, embeddings.shape).astype(np.float32)
+        copies.append(noisy / np.linalg.norm(noisy, axis=1, keepdims=True))
+    ids = [f"chunk_{copy}_{i}" for copy in range(scale) for i in range(len(embeddings))]
+    return np.concatenate(copies), ids, documents * scale, metadatas * scale
+
+def build_chroma(path, ids, embeddings, documents, metadatas):
+    import chromadb
+    client = chromadb.PersistentClient(path=path)
+    collection = client.create_collection(name="benchmark")
+    batch_size = 5000
+    for i in range(0, len(ids), batch_size):
+        collection.add(
+            ids=ids[i:i + batch_size],
+            embeddings=embeddings[i:i + batch_size].tolist(),
+            documents=documents[i:i + batch_size],
+            metadatas=metadatas[i:i + batch_size]
+        )
+
+def open_backend(backend, path):
+    if backend == 'chroma':
+        import chromadb
+        return chromadb.PersistentClient(path=path).get_collection(name="benchmark")
+    return NumpyStore(path)
+
+def measure(backend, path, queries, output):
+    """Run in a fresh process: memory after loading and query latency"""
+    base_rss = rss_mb()
+    start = time.perf_counter()
+    store = open_backend(backend, path)
+    # The first query pages in the index (HNSW graph or memmapped matrix)
+    store.query(query_embeddings=[queries[0].tolist()], n_results=TOP_K)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    ids = []
+    for query in queries:
+        start = time.perf_counter()
+        result = store.query(query_embeddings=[query.tolist()], n_results=TOP_K)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(result['ids'][0])
+
+    start = time.perf_counter()
+    store.query(query_embeddings=queries.tolist(), n_results=TOP_K)
+    batch_ms = (time.perf_counter() - start) * 1000
+
+    output.put({
+        'load_ms': load_ms,
+        'rss_mb': rss_mb() - base_rss,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'batch_ms': batch_ms,
+        'ids': ids
+    })
+
+def run_isolated(backend, path, queries):
+    context = multiprocessing.get_context('spawn')
+    output = context.Queue()
+    process = context.Process(target=measure, args=(backend, path, queries, output))
+    process.start()
+    result = output.get()
+    process.join()
+    return result
+
+def exact_top_k(vectors, queries, k, block=64):
+    """Row indexes of every query's true top k by float32 brute force, the recall reference"""
+    norms = np.einsum('ij,ij->i', vectors, vectors)
+    top = []
+    for start in range(0, len(queries), block):
+        dist = norms - 2 * (queries[start:start + block] @ vectors.T)
+        part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        top.extend(np.take_along_axis(part, np.argsort(np.take_along_axis(dist, part, axis=1), axis=1), axis=1))
+    return top
+
+def recall(reference, candidate):
+    """Share of the reference top-k that the candidate also returned"""
+    found = sum(len(set(r) & set(c)) for r, c in zip(reference, candidate))
+    return found / sum(len(r) for r in reference)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Chroma and the numpy vector store")
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES)
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float16'])
+    parser.add_argument('--quantization', choices=['int8', 'binary'], help="quantized first pass for the numpy store")
+    parser.add_argument('--synthetic', action='store_true', help="use random vectors instead of chroma_db")
+    parser.add_argument('--skip-chroma', action='store_true')
+    args = parser.parse_args()
+
+    embeddings, documents, metadatas = load_corpus(args.synthetic)
+    rng = np.random.default_rng(42)
+    print("="*80)
+    print(f"VECTOR STORE BENCHMARK - {len(embeddings)} base chunks, {QUERIES} queries, top_k={TOP_K}")
+    print("="*80)
+
+    report = []
+    for scale in args.scales:
+        vectors, ids, docs, metas = scaled_corpus(embeddings, documents, metadatas, scale, rng)
+        # Queries are perturbed corpus vectors, so each has true near neighbours
+        picks = rng.choice(len(vectors), QUERIES, replace=len(vectors) < QUERIES)
+        queries = vectors[picks] + rng.normal(0, 0.05, (QUERIES, vectors.shape[1])).astype(np.float32)
+
+        workdir = tempfile.mkdtemp(prefix='vector_bench_')
+        try:
+            numpy_path = os.path.join(workdir, 'numpy')
+            start = time.perf_counter()
+            NumpyStore.build(ids, vectors, docs, metas, path=numpy_path, name='benchmark', dtype=args.dtype,
+                              quantization=args.quantization)
+            numpy_build = time.perf_counter() - start
+            rows = {'numpy': run_isolated('numpy', numpy_path, queries)}
+            rows['numpy']['build_s'] = numpy_build
+
+            if not args.skip_chroma:
+                chroma_path = os.path.join(workdir, 'chroma')
+                start = time.perf_counter()
+                build_chroma(chroma_path, ids, vectors, docs, metas)
+                chroma_build = time.perf_counter() - start
+                rows['chroma'] = run_isolated('chroma', chroma_path, queries)
+                rows['chroma']['build_s'] = chroma_build
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        # Neither backend is exact in general (HNSW, float16 storage, a
+        # quantized first pass), so both are scored against float32 brute force
+        exact = [[ids[i] for i in row] for row in exact_top_k(vectors, queries, TOP_K)]
+        for row in rows.values():
+            row['recall'] = recall(exact, row['ids'])
+
+        print(f"\n📦 {scale}x corpus: {len(vectors)} chunks")
+        print(f"  {'backend':<8} {'build s':>8} {'load ms':>8} {'RSS MB':>8} {'p50 ms':>8} {'p95 ms':>8} {'batch ms':>9} "
+              f"{f'recall@{TOP_K}':>9}")
+        for backend, row in rows.items():
+            print(f"  {backend:<8} {row['build_s']:>8.2f} {row['load_ms']:>8.1f} {row['rss_mb']:>8.1f} "
+                  f"{row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} {row['batch_ms']:>9.1f} {row['recall']:>9.3f}")
+        print("  (recall against exact float32 search of the same vectors)")
+
+        for row in rows.values():
+            del row['ids']
+        report.append({'scale': scale, 'chunks': len(vectors), 'dtype': args.dtype,
+                       'quantization': args.quantization, 'results': rows})
+
+    output_file = "vector_store_benchmark.json"
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to: {output_file}")
+
+if __name__ == "__main__":
+    sys.exit(main())
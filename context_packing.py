@@ -0,0 +1,128 @@
+import re
+
+# Prompt tokens the retrieved passages may use (question and instructions excluded)
+CONTEXT_TOKEN_BUDGET = 1200
+
+# Passages whose word 5-grams are at least this much contained in an already
+# packed passage are near-duplicates (e.g. dougga_en.txt and thugga_en.txt)
+DUPLICATE_CONTAINMENT = 0.8
+SHINGLE_SIZE = 5
+
+# Shortest repeated word run treated as chunk overlap rather than coincidence
+MIN_OVERLAP_WORDS = 8
+
+# A passage is only cut to fit the budget if at least this many tokens remain
+MIN_PARTIAL_TOKENS = 60
+
+TOKEN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+def count_tokens(text):
+    """Approximate Llama 3 tokens: words and punctuation marks"""
+    return len(TOKEN.findall(text))
+
+def shingles(words):
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def overlap_length(first, second):
+    """Words at the end of first that repeat at the start of second"""
+    longest = min(len(first), len(second))
+    for size in range(longest, MIN_OVERLAP_WORDS - 1, -1):
+        if first[-size:] == second[:size]:
+            return size
+    return 0
+
+def truncate_to_tokens(text, max_tokens):
+    """The longest run of leading sentences within max_tokens"""
+    kept = []
+    used = 0
+    for sentence in SENTENCE_END.split(text):
+        tokens = count_tokens(sentence)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    return ' '.join(kept), used
+
+def pack_context(passages, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Assemble prompt context from (text, similarity) passages
+
+    Passages are taken best score first. Text that repeats the end or start
+    of an already packed passage (chunk overlap) is trimmed, passages mostly
+    contained in one already packed are dropped, and packing stops at
+    token_budget, cutting the last passage at a sentence boundary if
+    enough room is left. Returns the context text, the indexes of the
+    passages it holds (in input order, for citing sources) and packing
+    stats. Tokens removed as duplicate text (dedup_tokens_saved) and tokens
+    left out for the budget (budget_tokens_dropped) are counted apart.
+    """
+    ordered = sorted(range(len(passages)), key=lambda i: -passages[i][1])
+    packed = []
+    packed_shingles = []
+    kept = []
+    stats = {
+        'prompt_tokens_raw': sum(count_tokens(text) for text, _ in passages),
+        'duplicates_dropped': 0,
+        'overlap_words_trimmed': 0,
+        'passages_truncated': 0,
+        'passages_over_budget': 0,
+        'dedup_tokens_saved': 0,
+        'budget_tokens_dropped': 0
+    }
+    used = 0
+
+    for index in ordered:
+        text = passages[index][0]
+        raw_tokens = count_tokens(text)
+        words = text.split()
+
+        # Trim overlap with packed passages on either side
+        trimmed = 0
+        for other in packed:
+            head = overlap_length(other, words)
+            words = words[head:]
+            tail = overlap_length(words, other)
+            words = words[:len(words) - tail]
+            trimmed += head + tail
+        if len(words) < MIN_OVERLAP_WORDS:
+            stats['duplicates_dropped'] += 1
+            stats['dedup_tokens_saved'] += raw_tokens
+            continue
+
+        grams = shingles(words)
+        if any(len(grams & seen) >= DUPLICATE_CONTAINMENT * len(grams) for seen in packed_shingles):
+            stats['duplicates_dropped'] += 1
+            stats['dedup_tokens_saved'] += raw_tokens
+            continue
+
+        passage = ' '.join(words)
+        tokens = count_tokens(passage)
+        # Overlap trimmed off this passage counts as dedup even if the budget then drops it
+        stats['dedup_tokens_saved'] += raw_tokens - tokens
+        if used + tokens > token_budget:
+            remaining = token_budget - used
+            if remaining < MIN_PARTIAL_TOKENS:
+                stats['passages_over_budget'] += 1
+                stats['budget_tokens_dropped'] += tokens
+                continue
+            full_tokens = tokens
+            passage, tokens = truncate_to_tokens(passage, remaining)
+            stats['budget_tokens_dropped'] += full_tokens - tokens
+            if not passage:
+                stats['passages_over_budget'] += 1
+                continue
+            words = passage.split()
+            stats['passages_truncated'] += 1
+
+        stats['overlap_words_trimmed'] += trimmed
+        packed.append(words)
+        packed_shingles.append(grams)
+        kept.append(index)
+        used += tokens
+
+    context_text = ''.join(f"\n{' '.join(words)}\n" for words in packed)
+    stats['prompt_tokens'] = used
+    stats['passages_packed'] = len(packed)
+    return context_text, sorted(kept), stats
@@ -0,0 +1,126 @@
+import os
+import json
+import numpy as np
+from vector_store import CHROMA_PATH, manifest_mtime
+
+DOMAIN_GATE_PATH = os.path.join(CHROMA_PATH, 'domain_centroids')
+
+# Questions whose cosine similarity to every site/topic centroid is below this
+# are refused before retrieval. Kept low so only clearly off-domain questions
+# are caught; borderline ones still go through the similarity checks.
+# Set RAG_DOMAIN_GATE_THRESHOLD=-1 to turn the gate off
+DOMAIN_GATE_THRESHOLD = float(os.environ.get('RAG_DOMAIN_GATE_THRESHOLD', '0.2'))
+
+def centroid_label(metadata):
+    """The site or topic a chunk belongs to (its document title as a fallback)"""
+    for key in ('site', 'topic', 'title'):
+        if metadata.get(key):
+            return f"{key}:{metadata[key]}"
+    return f"file:{metadata.get('filename', '')}"
+
+def unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+def centroid_arrays(embeddings, metadatas):
+    """Normalized mean embedding of every site/topic and its labels"""
+    if not metadatas:
+        return np.zeros((0, 0), dtype=np.float32), []
+    embeddings = unit_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(metadatas), -1))
+    labels = sorted({centroid_label(metadata) for metadata in metadatas})
+    group = {label: i for i, label in enumerate(labels)}
+    rows = np.array([group[centroid_label(metadata)] for metadata in metadatas], dtype=np.int64)
+    sums = np.zeros((len(labels), embeddings.shape[1]), dtype=np.float32)
+    np.add.at(sums, rows, embeddings)
+    return unit_rows(sums), labels
+
+class DomainGate:
+    """Site and topic centroids of the stored chunks, for a one-matmul domain check"""
+
+    def __init__(self, path=DOMAIN_GATE_PATH):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, 'labels.json'), 'r', encoding='utf-8') as f:
+            self.labels = json.load(f)
+        self.centroids = np.load(os.path.join(path, 'centroids.npy'))
+        if len(self.labels) != len(self.centroids):
+            raise ValueError("domain centroids are inconsistent")
+
+    @classmethod
+    def build(cls, embeddings, metadatas, path=DOMAIN_GATE_PATH, source=None):
+        """Compute the centroids and write them to path"""
+        os.makedirs(path, exist_ok=True)
+        centroids, labels = centroid_arrays(embeddings, metadatas)
+
+        def write(filename, save):
+            tmp = os.path.join(path, filename + '.tmp')
+            with open(tmp, 'wb') as f:
+                save(f)
+            os.replace(tmp, os.path.join(path, filename))
+
+        write('centroids.npy', lambda f: np.save(f, centroids))
+        write('labels.json', lambda f: f.write(json.dumps(labels, ensure_ascii=False).encode('utf-8')))
+        write('meta.json', lambda f: f.write(json.dumps({
+            'centroids': len(labels),
+            'chunks': len(metadatas),
+            'source': source
+        }).encode('utf-8')))
+        return cls(path)
+
+    @classmethod
+    def from_arrays(cls, meta, labels, centroids):
+        """A gate over centroids that are already loaded (e.g. from a snapshot)"""
+        gate = cls.__new__(cls)
+        gate.path = None
+        gate.meta = meta
+        gate.labels = labels
+        gate.centroids = centroids
+        return gate
+
+    @classmethod
+    def from_collection(cls, collection, path=DOMAIN_GATE_PATH):
+        """Centroids of every chunk stored in a Chroma collection (or NumpyStore)"""
+        data = collection.get(include=['embeddings', 'metadatas'])
+        return cls.build(data['embeddings'], data['metadatas'], path,
+                         source={'count': collection.count(), 'manifest_mtime_ns': manifest_mtime()})
+
+    def scores(self, query_embeddings):
+        """Best centroid cosine similarity and its index for every query"""
+        if not self.labels:
+            # Nothing ingested yet: no basis for rejecting anything
+            count = len(np.atleast_2d(query_embeddings))
+            return np.ones(count, dtype=np.float32), np.zeros(count, dtype=np.int64)
+        queries = unit_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.centroids.shape[1]))
+        similarities = queries @ np.asarray(self.centroids, dtype=np.float32).T
+        best = similarities.argmax(axis=1)
+        return similarities[np.arange(len(queries)), best], best
+
+    def check(self, query_embedding, threshold=DOMAIN_GATE_THRESHOLD):
+        """(accepted, best similarity, nearest site/topic) for one query"""
+        score, best = self.scores(query_embedding)
+        label = self.labels[int(best[0])] if self.labels else None
+        return bool(score[0] >= threshold), float(score[0]), label
+
+def export_domain_gate(collection, path=DOMAIN_GATE_PATH):
+    """Recompute the site/topic centroids from the stored chunks (run after ingest)"""
+    gate = DomainGate.from_collection(collection, path)
+    print(f"✓ Domain centroids exported: {len(gate.labels)} sites and topics")
+    return gate
+
+def load_domain_gate(collection, path=DOMAIN_GATE_PATH):
+    """Open the centroids, recomputing them if ingest ran since they were written"""
+    # A snapshot or the retrieval server carries its own centroids
+    bundled = getattr(collection, 'domain_gate', None)
+    if bundled is not None:
+        return bundled
+    try:
+        gate = DomainGate(path)
+        source = gate.meta.get('source') or {}
+        if source.get('manifest_mtime_ns') == manifest_mtime() and source.get('count') == collection.count():
+            return gate
+    except (OSError, ValueError, KeyError):
+        pass
+    print("⚠️  Domain centroids missing or out of date - rebuilding")
+    return export_domain_gate(collection, path)
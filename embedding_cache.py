@@ -0,0 +1,239 @@
+import os
+import re
+import hashlib
+import threading
+import unicodedata
+from contextlib import contextmanager
+import numpy as np
+from tracing import annotate
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no cross-process lock, reads still verify their keys
+    fcntl = None
+
+CACHE_DIR = './cache/embeddings'
+DEFAULT_MAX_ENTRIES = 20000
+
+# encode() arguments that do not change the returned vectors
+PASSTHROUGH_KWARGS = {'show_progress_bar', 'batch_size'}
+
+def normalize_text(text):
+    """Normalize text before hashing so whitespace-only differences still hit"""
+    text = unicodedata.normalize('NFC', text)
+    return ' '.join(text.split())
+
+def cache_key(model_name, text):
+    """Cache key from the model name and a hash of the normalized text"""
+    payload = f"{model_name}\x00{normalize_text(text)}".encode('utf-8')
+    return hashlib.blake2b(payload, digest_size=16).hexdigest().encode('ascii')
+
+class EmbeddingCache:
+    """Memory-mapped on-disk embedding cache with LRU eviction
+
+    Vectors, keys and last-use ticks are three .npy files opened with
+    np.memmap, so lookups only page in the rows they touch. The cache holds
+    at most max_entries vectors; when full the least recently used slots
+    are overwritten. Safe to share between threads and between processes
+    (ingest, the app and the retrieval server open the same files): writers,
+    and readers with hits whose last-use ticks they update, hold an
+    exclusive file lock, other readers a shared one, and every read checks
+    the slot still holds its key.
+    """
+
+    def __init__(self, model_name, dim, cache_dir=CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.path = os.path.join(cache_dir, re.sub(r'[^\w.-]', '_', model_name))
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._open()
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+        self.lock_file = open(os.path.join(self.path, 'lock'), 'a+')
+        with self._file_lock(exclusive=True):
+            self._open_files()
+
+    def _open_files(self):
+        vectors_path = os.path.join(self.path, 'vectors.npy')
+        keys_path = os.path.join(self.path, 'keys.npy')
+        ticks_path = os.path.join(self.path, 'ticks.npy')
+
+        try:
+            vectors = np.lib.format.open_memmap(vectors_path, mode='r+')
+            keys = np.lib.format.open_memmap(keys_path, mode='r+')
+            ticks = np.lib.format.open_memmap(ticks_path, mode='r+')
+            if vectors.shape != (self.max_entries, self.dim) or len(keys) != self.max_entries or len(ticks) != self.max_entries:
+                raise ValueError("cache layout changed")
+        except (OSError, ValueError):
+            # Missing, corrupt or resized cache: start over
+            vectors = np.lib.format.open_memmap(vectors_path, mode='w+', dtype=np.float32, shape=(self.max_entries, self.dim))
+            keys = np.lib.format.open_memmap(keys_path, mode='w+', dtype='S32', shape=(self.max_entries,))
+            ticks = np.lib.format.open_memmap(ticks_path, mode='w+', dtype=np.int64, shape=(self.max_entries,))
+            ticks[:] = -1
+
+        self.vectors = vectors
+        self.keys = keys
+        self.ticks = ticks
+        self._reload_slots()
+
+    def _reload_slots(self):
+        """Rebuild the key -> slot map from disk, picking up other processes' writes"""
+        self.slots = {key: slot for slot, key in enumerate(self.keys.tolist()) if key}
+        self.tick = max(getattr(self, 'tick', 0), int(self.ticks.max()) + 1)
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def get_many(self, keys):
+        """Return cached vectors for keys (zeros where missing) and the missing positions"""
+        vectors = np.zeros((len(keys), self.dim), dtype=np.float32)
+        missing = []
+        with self.lock:
+            # Hits write their last-use ticks to the shared file, which must
+            # not race another process evicting by those ticks
+            exclusive = any(key in self.slots for key in keys)
+        with self.lock, self._file_lock(exclusive=exclusive):
+            found_positions = []
+            found_slots = []
+            for i, key in enumerate(keys):
+                slot = self.slots.get(key)
+                if slot is None:
+                    missing.append(i)
+                else:
+                    found_positions.append(i)
+                    found_slots.append(slot)
+
+            if found_slots:
+                # Another process may have evicted or reused a slot since
+                # self.slots was built: a slot whose key changed is a miss
+                stored = self.keys[found_slots]
+                valid = stored == np.array([keys[i] for i in found_positions], dtype=stored.dtype)
+                for i in np.asarray(found_positions)[~valid].tolist():
+                    self.slots.pop(keys[i], None)
+                    missing.append(i)
+                found_positions = np.asarray(found_positions)[valid]
+                found_slots = np.asarray(found_slots)[valid]
+                vectors[found_positions] = self.vectors[found_slots]
+                self.ticks[found_slots] = self.tick
+                self.tick += 1
+                missing.sort()
+
+            self.hits += len(found_slots)
+            self.misses += len(missing)
+        return vectors, missing
+
+    def put_many(self, keys, vectors):
+        """Store vectors, evicting the least recently used entries if full"""
+        with self.lock, self._file_lock(exclusive=True):
+            # Slots other processes filled or evicted since the last write
+            self._reload_slots()
+            pending = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self.slots:
+                    pending[key] = vector
+            if not pending:
+                return
+
+            # Never try to store more than fits
+            items = list(pending.items())[:self.max_entries]
+            free = self.max_entries - len(self.slots)
+            if free >= len(items):
+                empty = np.flatnonzero(self.keys == b'')
+                new_slots = empty[:len(items)]
+            else:
+                # Empty slots have tick -1 so they are picked before any live entry
+                new_slots = np.argpartition(self.ticks, len(items) - 1)[:len(items)]
+                for slot in new_slots:
+                    old_key = self.keys[slot]
+                    if old_key:
+                        self.slots.pop(old_key, None)
+
+            new_slots = np.asarray(new_slots)
+            self.vectors[new_slots] = np.asarray([vector for _, vector in items], dtype=np.float32)
+            self.ticks[new_slots] = self.tick
+            self.tick += 1
+            # Keys are written last so a crash never leaves a key pointing at garbage
+            self.keys[new_slots] = [key for key, _ in items]
+            for (key, _), slot in zip(items, new_slots.tolist()):
+                self.slots[key] = slot
+
+            self.vectors.flush()
+            self.ticks.flush()
+            self.keys.flush()
+
+    def stats(self):
+        """Hit and miss counters for this process"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self.slots),
+            'max_entries': self.max_entries
+        }
+
+class CachedEncoder:
+    """Drop-in wrapper around SentenceTransformer.encode backed by EmbeddingCache"""
+
+    def __init__(self, model, model_name, cache_dir=CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES):
+        self.model = model
+        self.model_name = model_name
+        self.cache = EmbeddingCache(model_name, model.get_sentence_embedding_dimension(), cache_dir, max_entries)
+
+    def encode(self, sentences, pool=None, **kwargs):
+        """Encode sentences, only running the model on cache misses
+
+        With a pool from start_multi_process_pool(), misses are encoded by
+        its worker processes.
+        """
+        # Options that change the output (tensors, normalization, ...) bypass the cache
+        if set(kwargs) - PASSTHROUGH_KWARGS:
+            return self.model.encode(sentences, **kwargs)
+
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        keys = [cache_key(self.model_name, text) for text in texts]
+
+        vectors, missing = self.cache.get_many(keys)
+        annotate(cache_hit=not missing, cache_hits=len(texts) - len(missing))
+
+        if missing:
+            # Encode each distinct missing text once
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], texts[i])
+            if pool is not None:
+                computed = self.model.encode_multi_process(list(unique.values()), pool,
+                                                           batch_size=kwargs.get('batch_size', 32))
+            else:
+                computed = self.model.encode(list(unique.values()), **kwargs)
+            computed = np.asarray(computed, dtype=np.float32)
+            by_key = dict(zip(unique.keys(), computed))
+            for i in missing:
+                vectors[i] = by_key[keys[i]]
+            self.cache.put_many(list(by_key.keys()), computed)
+
+        return vectors[0] if single else vectors
+
+    def stats(self):
+        return self.cache.stats()
+
+    def __getattr__(self, name):
+        # Everything else (tokenizer, max_seq_length, ...) comes from the model
+        return getattr(self.model, name)
@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+# Query encoder runtime: "torch" (default) runs sentence-transformers on
+# PyTorch; "onnx" runs the same model exported to ONNX and "onnx-int8" that
+# export with int8 weights, both on onnxruntime without importing torch
+ENCODER_BACKEND = os.environ.get('RAG_ENCODER_BACKEND', 'torch')
+ENCODER_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+ONNX_MODEL_DIR = os.environ.get('RAG_ONNX_MODEL_DIR', './models/all-MiniLM-L6-v2-onnx')
+ONNX_FILES = {'onnx': 'model.onnx', 'onnx-int8': 'model.int8.onnx'}
+# all-MiniLM-L6-v2's sentence-transformers window
+MAX_SEQ_LENGTH = 256
+
+# Every parity text must embed at least this close (cosine) to the PyTorch
+# vector, or the export is not used
+PARITY_MIN_COSINE = {'onnx': 0.9999, 'onnx-int8': 0.98}
+
+class OnnxEncoder:
+    """all-MiniLM-L6-v2 on onnxruntime, with sentence-transformers' mean pooling and normalization
+
+    Offers the parts of SentenceTransformer that CachedEncoder and rag.py
+    use: encode() and get_sentence_embedding_dimension().
+    """
+
+    def __init__(self, backend='onnx', path=ONNX_MODEL_DIR):
+        import onnxruntime
+        from tokenizers import Tokenizer
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.backend = backend
+        self.max_seq_length = MAX_SEQ_LENGTH
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=self.meta['pad_id'], pad_token=self.meta['pad_token'])
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(os.path.join(path, ONNX_FILES[backend]), options,
+                                                    providers=['CPUExecutionProvider'])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self):
+        return self.meta['dim']
+
+    def encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feed = {'input_ids': ids, 'attention_mask': mask}
+        if 'token_type_ids' in self.input_names:
+            feed['token_type_ids'] = np.zeros_like(ids)
+        hidden = self.session.run(None, feed)[0]
+        pooled = (hidden * mask[:, :, None]).sum(axis=1) / np.maximum(mask.sum(axis=1, keepdims=True), 1)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        """Unit-length float32 embeddings, like SentenceTransformer.encode"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.zeros((len(texts), self.meta['dim']), dtype=np.float32)
+        # Longest first, like sentence-transformers, so each batch pads little
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            vectors[rows] = self.encode_batch([texts[i] for i in rows])
+        return vectors[0] if single else vectors
+
+def cache_name(model_name, backend=ENCODER_BACKEND):
+    """Embedding cache namespace: ONNX vectors differ slightly, so they are cached apart"""
+    return model_name if backend == 'torch' else f"{model_name}@{backend}"
+
+def load_encoder_model(model_name=EMBEDDING_MODEL, backend=ENCODER_BACKEND, path=ONNX_MODEL_DIR):
+    """The query encoder for backend; ONNX exports must have passed their parity check"""
+    if backend == 'torch':
+        # Importing sentence_transformers pulls in torch
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend not in ONNX_FILES:
+        raise ValueError(f"Unknown encoder backend: {backend} (expected one of {', '.join(ENCODER_BACKENDS)})")
+    try:
+        encoder = OnnxEncoder(backend, path)
+    except OSError as e:
+        raise ValueError(f"No ONNX export in {path} ({e}) - run: python encoder_backend.py export") from e
+    if encoder.meta['model'] != model_name:
+        raise ValueError(f"{path} holds {encoder.meta['model']}, not {model_name}")
+    parity = encoder.meta.get('parity', {}).get(backend)
+    if not parity or not parity['passed']:
+        raise ValueError(f"The {backend} export did not pass its parity check - see python encoder_backend.py parity")
+    return encoder
+
+def parity_report(backend, texts, reference, path=ONNX_MODEL_DIR):
+    """How close an export's embeddings are to the PyTorch reference vectors"""
+    vectors = OnnxEncoder(backend, path).encode(texts)
+    cosines = np.sum(vectors * reference, axis=1) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1))
+    return {
+        'texts': len(texts),
+        'min_cosine': float(cosines.min()),
+        'mean_cosine': float(cosines.mean()),
+        'max_abs_diff': float(np.abs(vectors - reference).max()),
+        'passed': bool(cosines.min() >= PARITY_MIN_COSINE[backend])
+    }
+
+def check_parity(texts, model_name=EMBEDDING_MODEL, path=ONNX_MODEL_DIR):
+    """Compare both exports against sentence-transformers and record the result in meta.json"""
+    from sentence_transformers import SentenceTransformer
+    reference = np.asarray(SentenceTransformer(model_name).encode(texts), dtype=np.float32)
+    meta_path = os.path.join(path, 'meta.json')
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    meta['parity'] = {backend: parity_report(backend, texts, reference, path) for backend in ONNX_FILES}
+    tmp = meta_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, meta_path)
+    for backend, report in meta['parity'].items():
+        mark = '✓' if report['passed'] else '✗'
+        print(f"{mark} {backend}: cosine min {report['min_cosine']:.5f}, mean {report['mean_cosine']:.5f}, "
+              f"max |diff| {report['max_abs_diff']:.5f} over {report['texts']} texts "
+              f"(needs >= {PARITY_MIN_COSINE[backend]})")
+    return meta['parity']
+
+def export_onnx(model_name=EMBEDDING_MODEL, path=ONNX_MODEL_DIR):
+    """Export the transformer to ONNX, then quantize its weights to int8
+
+    Needs torch, transformers, onnx and onnxruntime; serving the exports only
+    needs onnxruntime and tokenizers.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    os.makedirs(path, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(['Carthage', 'The amphitheatre of El Jem'], padding=True, return_tensors='pt')
+    names = ['input_ids', 'attention_mask', 'token_type_ids']
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in names + ['last_hidden_state']}
+
+    fp32_path = os.path.join(path, ONNX_FILES['onnx'])
+    tmp = fp32_path + '.tmp'
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in names), tmp, input_names=names,
+                          output_names=['last_hidden_state'], dynamic_axes=dynamic_axes, opset_version=14)
+    os.replace(tmp, fp32_path)
+
+    int8_path = os.path.join(path, ONNX_FILES['onnx-int8'])
+    tmp = int8_path + '.tmp'
+    quantize_dynamic(fp32_path, tmp, weight_type=QuantType.QInt8)
+    os.replace(tmp, int8_path)
+
+    # Writes tokenizer.json, which the tokenizers library reads without transformers
+    tokenizer.save_pretrained(path)
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'model': model_name,
+            'dim': model.config.hidden_size,
+            'pad_id': tokenizer.pad_token_id,
+            'pad_token': tokenizer.pad_token
+        }, f, indent=2)
+    for backend, filename in ONNX_FILES.items():
+        print(f"✓ {backend}: {os.path.join(path, filename)} "
+              f"({os.path.getsize(os.path.join(path, filename)) / 1e6:.1f} MB)")
+
+def parity_texts(limit=200):
+    """Evaluation questions plus a sample of stored chunks, to compare backends on"""
+    from evaluate import test_questions, off_topic_questions
+    texts = [test['question'] for test in test_questions] + list(off_topic_questions)
+    try:
+        from vector_store import open_store
+        texts += open_store().get(include=['documents'])['documents'][:limit]
+    except Exception as e:
+        print(f"⚠️  No stored chunks for the parity check ({e}) - using the questions only")
+    return texts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export all-MiniLM-L6-v2 to ONNX/int8 and check parity")
+    parser.add_argument('command', choices=['export', 'parity'])
+    parser.add_argument('--path', default=ONNX_MODEL_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_onnx(path=args.path)
+    results = check_parity(parity_texts(), path=args.path)
+    sys.exit(0 if all(report['passed'] for report in results.values()) else 1)
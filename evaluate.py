@@ -1,64 +1,299 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
-import ollama
-from rag import rag_query
+import os
+import re
+import sys
 import json
+import time
+import argparse
+import tempfile
 from datetime import datetime
+import numpy as np
+from vector_store import NumpyStore, chroma_collection
+from rag import (rag_query_batch, get_embedding_model, get_domain_gate, warmup, search, passes_relevance_gate,
+                 split_query_results, get_collection, SIMILARITY_THRESHOLD, MIN_AVG_SIMILARITY, RETRIEVAL_MODE)
+from domain_gate import DOMAIN_GATE_THRESHOLD
+from context_packing import pack_context, CONTEXT_TOKEN_BUDGET
+from adaptive_top_k import cut_results, CANDIDATE_POOL
+from mmr import diversify, candidate_embeddings, MMR_CANDIDATES, MAX_PER_FILE, MAX_PER_SITE
+
+DOCS_FOLDER = 'data/raw_documents'
+
+# Domain gate thresholds compared in the retrieval-only report
+DOMAIN_THRESHOLD_SWEEP = [0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4]
+
+# MMR diversity weights compared in the MMR report (1.0 keeps relevance order, with the caps)
+MMR_LAMBDA_SWEEP = [1.0, 0.9, 0.7, 0.5]
+
+# Articles covering the same place or topic; retrieving any of them counts
+ALIAS_GROUPS = [
+    ["carthage_en.txt", "ancient_carthage_en.txt"],
+    ["dougga_en.txt", "thugga_en.txt"],
+    ["sbeitla_en.txt", "sufetula_en.txt"],
+    ["el_djem_en.txt", "thysdrus_en.txt"],
+    ["chemtou_en.txt", "extra_simitthu_en.txt"],
+    ["roman_africa_en.txt", "africa_roman_province_en.txt", "roman_tunisia_en.txt"],
+]
 
 # Test questions with expected characteristics
 test_questions = [
     {
         "question": "What is Carthage?",
         "category": "fact",
-        "expected_topics": ["Phoenician", "ancient", "city"]
+        "expected_topics": ["Phoenician", "ancient", "city"],
+        "relevant_files": [["carthage_en.txt", "ancient_carthage_en.txt"]]
     },
     {
         "question": "What makes Dougga special?",
         "category": "fact",
-        "expected_topics": ["Roman", "theatre", "UNESCO"]
+        "expected_topics": ["Roman", "theatre", "UNESCO"],
+        "relevant_files": [["dougga_en.txt", "thugga_en.txt"]]
     },
     {
         "question": "Tell me about El Jem amphitheatre",
         "category": "fact",
-        "expected_topics": ["Roman", "amphitheatre", "colosseum"]
+        "expected_topics": ["Roman", "amphitheatre", "colosseum"],
+        "relevant_files": [["el_djem_en.txt", "thysdrus_en.txt", "roman_amphitheatre_en.txt"]]
     },
     {
         "question": "Compare Carthage and Dougga",
         "category": "comparison",
-        "expected_topics": ["Phoenician", "Roman", "different"]
+        "expected_topics": ["Phoenician", "Roman", "different"],
+        "relevant_files": [["carthage_en.txt", "ancient_carthage_en.txt"], ["dougga_en.txt", "thugga_en.txt"]]
     },
     {
         "question": "What are the main Roman sites in Tunisia?",
         "category": "synthesis",
-        "expected_topics": ["Dougga", "El Jem", "Sbeitla"]
+        "expected_topics": ["Dougga", "El Jem", "Sbeitla"],
+        "relevant_files": [["roman_tunisia_en.txt", "roman_africa_en.txt", "africa_roman_province_en.txt"]]
     },
     {
         "question": "Describe the Punic civilization",
         "category": "synthesis",
-        "expected_topics": ["Carthage", "Phoenician", "ancient"]
+        "expected_topics": ["Carthage", "Phoenician", "ancient"],
+        "relevant_files": [["ancient_carthage_en.txt", "carthage_en.txt", "phoenicians_en.txt", "punic_wars_en.txt"]]
     },
     {
         "question": "Who was Hannibal?",
         "category": "fact",
-        "expected_topics": ["Carthage", "general", "Rome"]
+        "expected_topics": ["Carthage", "general", "Rome"],
+        "relevant_files": [["hannibal_en.txt"]]
     },
     {
         "question": "What is Kerkouane known for?",
         "category": "fact",
-        "expected_topics": ["Punic", "UNESCO", "settlement"]
+        "expected_topics": ["Punic", "UNESCO", "settlement"],
+        "relevant_files": [["kerkouane_en.txt"]]
     },
     {
         "question": "What are the Byzantine ruins in Tunisia?",
         "category": "synthesis",
-        "expected_topics": ["Sbeitla", "Byzantine", "churches"]
+        "expected_topics": ["Sbeitla", "Byzantine", "churches"],
+        "relevant_files": [["byzantine_africa_en.txt", "sbeitla_en.txt", "sufetula_en.txt"]]
     },
     {
         "question": "Where is the Eiffel Tower?",
         "category": "off-topic",
-        "expected_topics": ["can only answer", "Tunisian", "sites"]
+        "expected_topics": ["can only answer", "Tunisian", "sites"],
+        "relevant_files": []
     }
 ]
 
+# Extra off-topic questions for the retrieval-only gate check
+off_topic_questions = [
+    "What are the pyramids of Egypt?",
+    "Who painted the Mona Lisa?",
+    "How tall is Mount Everest?",
+    "What is the capital of Japan?",
+    "How do I bake sourdough bread?",
+    "Explain how a neural network is trained",
+    "Who won the 2018 FIFA World Cup?",
+    "What is the Great Wall of China?",
+    "How does photosynthesis work?",
+    "What is the population of New York City?",
+    "Tell me about the Colosseum in Rome",
+    "What is the Taj Mahal?",
+    "How do I change a car tire?",
+    "What is the speed of light?",
+    "Who wrote Hamlet?",
+]
+
+def relevant_group(filename):
+    """The alias group of a file, or just the file itself"""
+    for group in ALIAS_GROUPS:
+        if filename in group:
+            return list(group)
+    return [filename]
+
+def generate_retrieval_questions():
+    """Templated questions about every document, labelled with that document"""
+    questions = []
+    for filename in sorted(os.listdir(DOCS_FOLDER)):
+        if not filename.endswith('.txt'):
+            continue
+        with open(os.path.join(DOCS_FOLDER, filename), 'r', encoding='utf-8') as f:
+            header = f.read(500)
+        match = re.search(r'^Title:\s*(.+)$', header, re.MULTILINE)
+        if not match:
+            continue
+        title = match.group(1).strip()
+        for template in ("What is {}?", "Tell me about {}", "What is the history of {}?"):
+            questions.append({
+                "question": template.format(title),
+                "category": "generated",
+                "relevant_files": [relevant_group(filename)]
+            })
+    return questions
+
+def score_retrieval(relevant_files, retrieved_files):
+    """recall@k over the relevant groups and reciprocal rank of the first hit"""
+    if not relevant_files:
+        return None, None
+    found = sum(1 for group in relevant_files if any(f in group for f in retrieved_files))
+    reciprocal_rank = 0.0
+    for rank, filename in enumerate(retrieved_files, 1):
+        if any(filename in group for group in relevant_files):
+            reciprocal_rank = 1 / rank
+            break
+    return found / len(relevant_files), reciprocal_rank
+
+def domain_gate_accuracy(results, scores, threshold):
+    """Share of questions the domain gate decides correctly, and the on/off-topic split"""
+    on_topic = [r['category'] != 'off-topic' for r in results]
+    accepted = scores >= threshold
+    kept = sum(1 for a, on in zip(accepted, on_topic) if a and on)
+    rejected = sum(1 for a, on in zip(accepted, on_topic) if not a and not on)
+    return {
+        'threshold': threshold,
+        'accuracy': (kept + rejected) / len(results),
+        'on_topic_kept': kept,
+        'on_topic': sum(on_topic),
+        'off_topic_rejected': rejected,
+        'off_topic': len(results) - sum(on_topic)
+    }
+
+def evaluate_retrieval(questions, top_k=5, similarity_threshold=SIMILARITY_THRESHOLD,
+                       min_avg_similarity=MIN_AVG_SIMILARITY, mode=RETRIEVAL_MODE,
+                       domain_threshold=DOMAIN_GATE_THRESHOLD):
+    """
+    Retrieval-only evaluation, no LLM calls
+    Tests: recall@k and MRR against labelled files, off-topic gate decision,
+    and the centroid domain gate in front of retrieval
+    """
+    
+    print("="*80)
+    print("🔍 TUNISIAN ARCHAEOLOGY RAG CHATBOT - RETRIEVAL EVALUATION")
+    print("="*80)
+    print(f"Questions: {len(questions)} | {mode} retrieval | top_k={top_k} | similarity>{similarity_threshold} | avg>={min_avg_similarity}\n")
+    
+    start = time.perf_counter()
+    
+    # One encode call and one multi-vector query for the whole set
+    texts = [q['question'] for q in questions]
+    embeddings = get_embedding_model().encode(texts)
+    query_results = search(texts, embeddings, top_k, mode)
+    gate = get_domain_gate()
+    if gate is not None:
+        domain_scores, nearest = gate.scores(embeddings)
+    else:
+        domain_scores, nearest = np.ones(len(texts)), np.zeros(len(texts), dtype=int)
+    
+    results = []
+    for i, test in enumerate(questions):
+        retrieved_files = [meta.get('filename', '') for meta in query_results['metadatas'][i]]
+        similarities = [1 / (1 + dist) for dist in query_results['distances'][i]]
+        recall, reciprocal_rank = score_retrieval(test['relevant_files'], retrieved_files)
+        accepted = passes_relevance_gate(similarities, similarity_threshold, min_avg_similarity)
+        on_topic = test['category'] != 'off-topic'
+        domain_accepted = bool(domain_scores[i] >= domain_threshold)
+        results.append({
+            'question': test['question'],
+            'category': test['category'],
+            'recall': recall,
+            'reciprocal_rank': reciprocal_rank,
+            'gate_accepted': accepted,
+            'gate_correct': accepted == on_topic,
+            'top_similarity': max(similarities) if similarities else 0,
+            'domain_score': float(domain_scores[i]),
+            'domain_nearest': gate.labels[int(nearest[i])] if gate is not None and gate.labels else None,
+            'domain_accepted': domain_accepted,
+            # Answered only if both the domain gate and the similarity gate accept
+            'pipeline_correct': (domain_accepted and accepted) == on_topic,
+            'retrieved_files': retrieved_files
+        })
+    
+    elapsed = time.perf_counter() - start
+    
+    labelled = [r for r in results if r['recall'] is not None]
+    recall_at_k = sum(r['recall'] for r in labelled) / len(labelled) if labelled else 0
+    mrr = sum(r['reciprocal_rank'] for r in labelled) / len(labelled) if labelled else 0
+    gate_accuracy = sum(1 for r in results if r['gate_correct']) / len(results)
+    domain_gate = domain_gate_accuracy(results, domain_scores, domain_threshold)
+    domain_sweep = [domain_gate_accuracy(results, domain_scores, t) for t in DOMAIN_THRESHOLD_SWEEP]
+    pipeline_accuracy = sum(1 for r in results if r['pipeline_correct']) / len(results)
+    
+    print(f"📊 Recall@{top_k}: {recall_at_k:.3f}")
+    print(f"📊 MRR: {mrr:.3f}")
+    print(f"🚦 Gate accuracy: {gate_accuracy*100:.1f}%")
+    if gate is None:
+        print("🧭 Domain gate unavailable")
+    else:
+        print(f"🧭 Domain gate accuracy (centroid similarity>={domain_threshold}): {domain_gate['accuracy']*100:.1f}% "
+              f"(on-topic kept {domain_gate['on_topic_kept']}/{domain_gate['on_topic']}, "
+              f"off-topic rejected {domain_gate['off_topic_rejected']}/{domain_gate['off_topic']})")
+        print(f"🚦 Domain gate + similarity gate accuracy: {pipeline_accuracy*100:.1f}%")
+        print("   threshold   accuracy   on-topic kept   off-topic rejected")
+        for row in domain_sweep:
+            print(f"   {row['threshold']:>9.2f}   {row['accuracy']*100:>7.1f}%   {row['on_topic_kept']:>6}/{row['on_topic']:<6}"
+                  f"   {row['off_topic_rejected']:>9}/{row['off_topic']}")
+    print(f"⏱️  {elapsed:.2f} s ({len(questions) / elapsed:.0f} questions/s)")
+    
+    print(f"\n📋 BREAKDOWN BY CATEGORY:")
+    for category in sorted(set(r['category'] for r in results)):
+        cat_results = [r for r in results if r['category'] == category]
+        cat_labelled = [r for r in cat_results if r['recall'] is not None]
+        gate_correct = sum(1 for r in cat_results if r['gate_correct'])
+        line = f"  - {category.capitalize()}: gate {gate_correct}/{len(cat_results)}"
+        if cat_labelled:
+            cat_recall = sum(r['recall'] for r in cat_labelled) / len(cat_labelled)
+            cat_mrr = sum(r['reciprocal_rank'] for r in cat_labelled) / len(cat_labelled)
+            line += f", recall@{top_k} {cat_recall:.3f}, MRR {cat_mrr:.3f}"
+        print(line)
+    
+    misses = [r for r in labelled if r['recall'] < 1] + [r for r in results if not r['gate_correct']]
+    if misses:
+        print(f"\n❌ MISSES (first 10):")
+        for r in misses[:10]:
+            gate_status = 'accepted' if r['gate_accepted'] else 'rejected'
+            print(f"  - {r['question']} → {r['retrieved_files'][:3]} (gate {gate_status})")
+    
+    output_file = "retrieval_evaluation_results.json"
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(),
+            'parameters': {
+                'retrieval_mode': mode,
+                'top_k': top_k,
+                'similarity_threshold': similarity_threshold,
+                'min_avg_similarity': min_avg_similarity,
+                'domain_threshold': domain_threshold
+            },
+            'summary': {
+                'questions': len(results),
+                'recall_at_k': recall_at_k,
+                'mrr': mrr,
+                'gate_accuracy': gate_accuracy,
+                'domain_gate': domain_gate if gate is not None else None,
+                'domain_gate_sweep': domain_sweep if gate is not None else None,
+                'pipeline_gate_accuracy': pipeline_accuracy,
+                'seconds': elapsed
+            },
+            'detailed_results': results
+        }, f, indent=2, ensure_ascii=False)
+    
+    print(f"\n💾 Results saved to: {output_file}")
+    print(f"\n{'='*80}\n")
+    
+    return results
+
 def evaluate_rag_system():
     """
     Comprehensive evaluation of the RAG chatbot
@@ -73,15 +308,15 @@ def evaluate_rag_system():
     
     results = []
     
-    for idx, test in enumerate(test_questions, 1):
+    # Encode, retrieve and generate for every test question in one batch
+    batch_results = rag_query_batch([test['question'] for test in test_questions])
+    
+    for idx, (test, result) in enumerate(zip(test_questions, batch_results), 1):
         print(f"\n{'='*80}")
         print(f"TEST {idx}/{len(test_questions)}: {test['category'].upper()}")
         print(f"{'='*80}")
         print(f"❓ Question: {test['question']}")
         
-        # Run RAG query
-        result = rag_query(test['question'])
-        
         # Evaluation metrics
         num_sources = len(result['sources'])
         avg_similarity = sum(s['similarity'] for s in result['sources']) / num_sources if num_sources > 0 else 0
@@ -157,6 +392,8 @@ def evaluate_rag_system():
     print(f"📊 Average sources per query: {avg_sources:.1f}")
     print(f"🎯 Average similarity score: {avg_similarity_all:.3f}")
     print(f"📖 Average topic coverage: {avg_topic_coverage*100:.1f}%")
+    cache_stats = get_embedding_model().stats()
+    print(f"⚡ Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']*100:.0f}% hit rate)")
     
     # Category breakdown
     print(f"\n📋 BREAKDOWN BY CATEGORY:")
@@ -208,7 +445,232 @@ def evaluate_rag_system():
     
     return results
 
+def context_rows(questions, per_question, similarity_threshold=SIMILARITY_THRESHOLD):
+    """Recall, distinct sources and packed prompt tokens of each question's final chunks"""
+    rows = []
+    for test, single in zip(questions, per_question):
+        similarities = [1 / (1 + dist) for dist in single['distances'][0]]
+        above = [i for i, sim in enumerate(similarities) if sim > similarity_threshold]
+        _, kept, packing = pack_context([(single['documents'][0][i], similarities[i]) for i in above],
+                                        CONTEXT_TOKEN_BUDGET)
+        # The chunks that reach the prompt
+        used = [above[i] for i in kept]
+        metadatas = single['metadatas'][0]
+        retrieved_files = [meta.get('filename', '') for meta in metadatas]
+        recall, reciprocal_rank = score_retrieval(test['relevant_files'], retrieved_files)
+        rows.append({
+            'question': test['question'],
+            'category': test['category'],
+            'recall': recall,
+            'reciprocal_rank': reciprocal_rank,
+            'chunks': len(used),
+            'files': len({retrieved_files[i] for i in used}),
+            'sites': len({metadatas[i].get('site', '') for i in used if metadatas[i].get('site')}),
+            'prompt_tokens': packing['prompt_tokens'] if used else 0
+        })
+    return rows
+
+def print_context_report(questions, report):
+    """Per-category table of context_rows() results for each compared setting"""
+    def summary(rows):
+        labelled = [r for r in rows if r['recall'] is not None]
+        return {
+            'questions': len(rows),
+            'recall': sum(r['recall'] for r in labelled) / len(labelled) if labelled else None,
+            'mrr': sum(r['reciprocal_rank'] for r in labelled) / len(labelled) if labelled else None,
+            'chunks': sum(r['chunks'] for r in rows) / len(rows),
+            'files': sum(r['files'] for r in rows) / len(rows),
+            'sites': sum(r['sites'] for r in rows) / len(rows),
+            'prompt_tokens': sum(r['prompt_tokens'] for r in rows) / len(rows)
+        }
+    
+    categories = ['all'] + sorted(set(q['category'] for q in questions))
+    summaries = {}
+    print(f"  {'category':<12} {'setting':<14} {'recall':>7} {'MRR':>6} {'chunks':>7} {'files':>6} {'sites':>6} "
+          f"{'prompt tokens':>14}")
+    for category in categories:
+        summaries[category] = {}
+        for setting, rows in report.items():
+            selected = [r for r in rows if category == 'all' or r['category'] == category]
+            row = summary(selected)
+            summaries[category][setting] = row
+            recall = f"{row['recall']:.3f}" if row['recall'] is not None else '-'
+            mrr = f"{row['mrr']:.3f}" if row['mrr'] is not None else '-'
+            print(f"  {category:<12} {setting:<14} {recall:>7} {mrr:>6} {row['chunks']:>7.1f} {row['files']:>6.1f} "
+                  f"{row['sites']:>6.1f} {row['prompt_tokens']:>14.0f}")
+    return summaries
+
+def save_context_report(output_file, parameters, summaries, report):
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(),
+            'parameters': parameters,
+            'summary': summaries,
+            'detailed_results': report
+        }, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Results saved to: {output_file}")
+    print(f"\n{'='*80}\n")
+
+def compare_top_k_policies(questions, top_k=5, similarity_threshold=SIMILARITY_THRESHOLD, mode=RETRIEVAL_MODE):
+    """
+    Fixed top_k against the adaptive score-gap cut, per question category
+    Reports recall, MRR, chunks kept and packed prompt tokens, no LLM calls
+    """
+    print("="*80)
+    print("🎚️  TUNISIAN ARCHAEOLOGY RAG CHATBOT - FIXED VS ADAPTIVE TOP_K")
+    print("="*80)
+    print(f"Questions: {len(questions)} | {mode} retrieval | fixed top_k={top_k} | adaptive pool={CANDIDATE_POOL}\n")
+    
+    texts = [q['question'] for q in questions]
+    embeddings = get_embedding_model().encode(texts)
+    fixed = split_query_results(search(texts, embeddings, top_k, mode))
+    pool = split_query_results(search(texts, embeddings, CANDIDATE_POOL, mode))
+    report = {
+        'fixed': context_rows(questions, fixed, similarity_threshold),
+        'adaptive': context_rows(questions, [cut_results(single, similarity_threshold)[0] for single in pool],
+                                 similarity_threshold)
+    }
+    summaries = print_context_report(questions, report)
+    save_context_report("top_k_policy_comparison.json",
+                        {'retrieval_mode': mode, 'top_k': top_k, 'candidate_pool': CANDIDATE_POOL,
+                         'similarity_threshold': similarity_threshold, 'token_budget': CONTEXT_TOKEN_BUDGET},
+                        summaries, report)
+    return summaries
+
+def compare_mmr(questions, top_k=5, similarity_threshold=SIMILARITY_THRESHOLD, mode=RETRIEVAL_MODE):
+    """
+    Relevance order against MMR re-ranking at several diversity weights
+    Reports distinct files and sites among the used chunks, recall and packed
+    prompt tokens per category, no LLM calls
+    """
+    print("="*80)
+    print("🧩 TUNISIAN ARCHAEOLOGY RAG CHATBOT - MMR DIVERSITY")
+    print("="*80)
+    print(f"Questions: {len(questions)} | {mode} retrieval | top_k={top_k} | pool={MMR_CANDIDATES} | "
+          f"caps {MAX_PER_FILE}/file, {MAX_PER_SITE}/site\n")
+    
+    texts = [q['question'] for q in questions]
+    embeddings = get_embedding_model().encode(texts)
+    pool = split_query_results(search(texts, embeddings, MMR_CANDIDATES, mode))
+    store = get_collection()
+    pool_embeddings = [candidate_embeddings(store, single, get_embedding_model().encode) for single in pool]
+    
+    relevance = [{key: (values if values is None or key == 'included' else [values[0][:top_k]])
+                  for key, values in single.items()} for single in pool]
+    report = {'relevance': context_rows(questions, relevance, similarity_threshold)}
+    for weight in MMR_LAMBDA_SWEEP:
+        reranked = [diversify(single, embedding, vectors, top_k, weight)[0]
+                    for single, embedding, vectors in zip(pool, embeddings, pool_embeddings)]
+        report[f"mmr λ={weight}"] = context_rows(questions, reranked, similarity_threshold)
+    summaries = print_context_report(questions, report)
+    save_context_report("mmr_comparison.json",
+                        {'retrieval_mode': mode, 'top_k': top_k, 'candidates': MMR_CANDIDATES,
+                         'max_per_file': MAX_PER_FILE, 'max_per_site': MAX_PER_SITE,
+                         'similarity_threshold': similarity_threshold, 'token_budget': CONTEXT_TOKEN_BUDGET},
+                        summaries, report)
+    return summaries
+
+def compare_quantization(questions, top_k=5, dtype='float32'):
+    """
+    Recall of the int8 and binary quantized indexes against the float index
+    Each index is exported from the Chroma collection into a temporary numpy store
+    """
+    print("="*80)
+    print("🔍 TUNISIAN ARCHAEOLOGY RAG CHATBOT - QUANTIZED INDEX EVALUATION")
+    print("="*80)
+    
+    data = chroma_collection().get(include=['embeddings', 'documents', 'metadatas'])
+    embeddings = get_embedding_model().encode([q['question'] for q in questions])
+    labelled = [i for i, q in enumerate(questions) if q['relevant_files']]
+    
+    report = {}
+    reference_ids = None
+    with tempfile.TemporaryDirectory() as workdir:
+        for quantization in (None, 'int8', 'binary'):
+            name = quantization or 'float'
+            store = NumpyStore.build(
+                data['ids'], data['embeddings'], data['documents'], data['metadatas'],
+                path=os.path.join(workdir, name), dtype=dtype, quantization=quantization
+            )
+            start = time.perf_counter()
+            results = store.query(embeddings, n_results=top_k)
+            elapsed = time.perf_counter() - start
+            
+            if reference_ids is None:
+                reference_ids = results['ids']
+            # Share of the float index's top-k that this index also returns
+            overlap = sum(len(set(ref) & set(ids)) for ref, ids in zip(reference_ids, results['ids']))
+            overlap /= sum(len(ref) for ref in reference_ids)
+            labelled_recall = [
+                score_retrieval(questions[i]['relevant_files'],
+                                [meta.get('filename', '') for meta in results['metadatas'][i]])[0]
+                for i in labelled
+            ]
+            report[name] = {
+                'index_bytes': store.index_nbytes(),
+                'recall_vs_float': overlap,
+                'recall_at_k': sum(labelled_recall) / len(labelled_recall) if labelled_recall else 0,
+                'seconds': elapsed
+            }
+    
+    float_bytes = report['float']['index_bytes']
+    float_recall = report['float']['recall_at_k']
+    print(f"Questions: {len(questions)} | chunks: {len(data['ids'])} | top_k={top_k}\n")
+    print(f"  {'index':<8} {'index KB':>9} {'smaller':>8} {'top-k vs float':>15} {'recall@k':>9} {'loss':>7} {'ms':>7}")
+    for name, row in report.items():
+        print(f"  {name:<8} {row['index_bytes'] / 1024:>9.1f} {float_bytes / row['index_bytes']:>7.1f}x "
+              f"{row['recall_vs_float']:>15.3f} {row['recall_at_k']:>9.3f} "
+              f"{float_recall - row['recall_at_k']:>7.3f} {row['seconds'] * 1000:>7.1f}")
+    print(f"\n{'='*80}\n")
+    return report
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the Tunisian archaeology RAG chatbot")
+    parser.add_argument('--retrieval-only', action='store_true',
+                        help="skip generation and score retrieval (recall@k, MRR, gate) only")
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--similarity-threshold', type=float, default=SIMILARITY_THRESHOLD)
+    parser.add_argument('--min-avg-similarity', type=float, default=MIN_AVG_SIMILARITY)
+    parser.add_argument('--retrieval-mode', choices=['dense', 'hybrid'], default=RETRIEVAL_MODE)
+    parser.add_argument('--domain-threshold', type=float, default=DOMAIN_GATE_THRESHOLD,
+                        help="centroid similarity below which the domain gate refuses a question")
+    parser.add_argument('--no-generated', action='store_true',
+                        help="only use the hand-written test questions")
+    parser.add_argument('--quantization-report', action='store_true',
+                        help="compare recall of the int8 and binary indexes with the float index")
+    parser.add_argument('--top-k-report', action='store_true',
+                        help="compare fixed top_k with the adaptive score-gap cut per category")
+    parser.add_argument('--mmr-report', action='store_true',
+                        help="compare relevance order with MMR re-ranking: distinct sources and prompt tokens")
+    args = parser.parse_args()
+    
+    if args.retrieval_only or args.quantization_report or args.top_k_report or args.mmr_report:
+        questions = list(test_questions) + [
+            {"question": q, "category": "off-topic", "relevant_files": []} for q in off_topic_questions
+        ]
+        if not args.no_generated:
+            questions += generate_retrieval_questions()
+        if args.quantization_report:
+            print("\n🚀 Starting quantized index evaluation...\n")
+            compare_quantization(questions, args.top_k)
+        elif args.top_k_report:
+            print("\n🚀 Starting top_k policy comparison...\n")
+            warmup(args.retrieval_mode)
+            compare_top_k_policies(questions, args.top_k, args.similarity_threshold, args.retrieval_mode)
+        elif args.mmr_report:
+            print("\n🚀 Starting MMR comparison...\n")
+            warmup(args.retrieval_mode)
+            compare_mmr(questions, args.top_k, args.similarity_threshold, args.retrieval_mode)
+        else:
+            print("\n🚀 Starting retrieval-only evaluation...\n")
+            # Load everything first so the timing covers retrieval only
+            warmup(args.retrieval_mode)
+            evaluate_retrieval(questions, args.top_k, args.similarity_threshold, args.min_avg_similarity,
+                               args.retrieval_mode, args.domain_threshold)
+        print("✅ Evaluation complete!")
+        sys.exit(0)
+    
     print("\n🚀 Starting RAG System Evaluation...\n")
+    warmup()
     results = evaluate_rag_system()
     print("✅ Evaluation complete!")
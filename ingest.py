@@ -1,140 +1,408 @@
 import os
-import re
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
-
-# Initialize embedding model
-print("Loading embedding model...")
-embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-
-# Initialize ChromaDB
-print("Initializing ChromaDB...")
-client = chromadb.PersistentClient(path="./chroma_db")
-
-# Create or get collection
-collection = client.get_or_create_collection(
-    name="tunisian_archaeology",
-    metadata={"description": "Tunisian archaeological sites knowledge base"}
-)
-
-def clean_text(text):
-    """Clean and normalize text"""
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text)
-    # Remove special characters but keep basic punctuation
-    text = re.sub(r'[^\w\s.,;:!?()\-]', '', text)
-    return text.strip()
-
-def extract_metadata(text):
-    """Extract metadata from document header"""
-    lines = text.split('\n')
-    metadata = {
-        'title': '',
-        'source': '',
-        'site': '',
-        'topic': ''
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from embedding_cache import CachedEncoder
+from vector_store import export_numpy_store
+from lexical_index import export_lexical_index
+from domain_gate import export_domain_gate
+from multilingual_index import load_encoder as load_multilingual_encoder, export_multilingual_store, MULTILINGUAL_RETRIEVAL
+from minhash import MinHashIndex, signature
+from parsing import init_worker, parse_document
+
+DOCS_FOLDER = 'data/raw_documents'
+CHROMA_PATH = './chroma_db'
+# The manifest lives inside the Chroma directory so it is removed with it
+MANIFEST_PATH = os.path.join(CHROMA_PATH, 'ingest_manifest.json')
+MANIFEST_VERSION = 1
+# MinHash signatures of stored chunks, for near-duplicate detection across runs
+MINHASH_PATH = os.path.join(CHROMA_PATH, 'minhash_index')
+# Chunk size and overlap in word pieces of the embedder's tokenizer. chunk_tokens
+# plus [CLS] and [SEP] must fit all-MiniLM-L6-v2's 256-token window, or the
+# end of every chunk would be truncated away and never embedded
+CHUNKING = {'chunk_tokens': 250, 'overlap_tokens': 40}
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+# Parsing and encoding processes (default: every core); --workers overrides
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', os.cpu_count() or 1))
+# Chunks encoded and written per batch; large enough to keep every encoder busy
+BATCH_SIZE = 512
+
+# Embedding model is only loaded when there is something to embed
+embedding_model = None
+
+def get_embedding_model():
+    """Load the embedding model on first use"""
+    global embedding_model
+    if embedding_model is None:
+        print("Loading embedding model...")
+        # Imported here, not at the top: spawned parsing workers re-import
+        # this module and must not load torch
+        from sentence_transformers import SentenceTransformer
+        embedding_model = CachedEncoder(SentenceTransformer(EMBEDDING_MODEL), EMBEDDING_MODEL)
+    return embedding_model
+
+# Opened in the main block only: spawned parsing and encoding workers
+# re-import this module and must not open the database
+client = None
+collection = None
+
+def chunk_id(filename, chunk, metadata):
+    """Stable chunk id derived from the source file, its header and the chunk content"""
+    header = json.dumps(metadata, sort_keys=True)
+    digest = hashlib.sha256(f"{filename}\n{header}\n{chunk}".encode('utf-8')).hexdigest()
+    return f"chunk_{digest[:24]}"
+
+def empty_manifest():
+    """Manifest describing an empty collection"""
+    return {
+        'version': MANIFEST_VERSION,
+        'chunking': dict(CHUNKING),
+        'files': {}
     }
+
+def load_manifest():
+    """Load the ingestion manifest, checking it still matches the collection"""
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Ignoring unreadable manifest: {e}")
+        return None
+    
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
     
-    for line in lines[:10]:  # Check first 10 lines
-        if line.startswith('Title:'):
-            metadata['title'] = line.replace('Title:', '').strip()
-        elif line.startswith('Source:'):
-            metadata['source'] = line.replace('Source:', '').strip()
-        elif line.startswith('Site:'):
-            metadata['site'] = line.replace('Site:', '').strip()
-        elif line.startswith('Topic:'):
-            metadata['topic'] = line.replace('Topic:', '').strip()
+    # A collection edited or rebuilt outside this script invalidates the manifest
+    if len(manifest_ids(manifest['files'])) != collection.count():
+        print("⚠️  Manifest does not match the collection - doing a full sync")
+        return None
     
-    return metadata
+    return manifest
+
+def manifest_ids(files):
+    """Every stored chunk id a manifest refers to, as own chunks or as duplicates' canonical copies"""
+    return {cid for entry in files.values() for cid in entry['chunks'] + entry.get('duplicates', [])}
 
-def chunk_text(text, chunk_size=400, overlap=50):
-    """Split text into overlapping chunks by words"""
-    words = text.split()
-    chunks = []
+def alias_map(files):
+    """Canonical chunk id -> sorted files whose near-duplicate chunks it stands in for"""
+    aliases = {}
+    for filename, entry in files.items():
+        for cid in entry.get('duplicates', []):
+            aliases.setdefault(cid, set()).add(filename)
+    return {cid: sorted(names) for cid, names in aliases.items()}
+
+def orphaned_files(files):
+    """Files whose near-duplicate chunks point at a canonical chunk no file owns any more
     
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i + chunk_size])
-        if len(chunk.split()) > 50:  # Minimum chunk size
-            chunks.append(chunk)
+    When the canonical chunk's own file changes or disappears, its old text
+    would otherwise stay indexed for the duplicates, attributed to that file.
+    """
+    owned = {cid for entry in files.values() for cid in entry['chunks']}
+    return sorted(filename for filename, entry in files.items()
+                  if any(cid not in owned for cid in entry.get('duplicates', [])))
+
+def load_minhash_index():
+    """Signatures of every stored chunk, rebuilt from the collection if out of sync"""
+    try:
+        index = MinHashIndex(MINHASH_PATH)
+        if len(index) == collection.count():
+            return index
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Ignoring unreadable MinHash index: {e}")
+    print("Building MinHash index of stored chunks...")
+    return MinHashIndex.from_collection(collection, MINHASH_PATH)
+
+def save_manifest(manifest):
+    """Atomically write the ingestion manifest"""
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def parse_changed_files(filenames, workers):
+    """(filename, result or exception) per file, parsed in a process pool
+    
+    At most 2 * workers files are in flight, so memory stays bounded even
+    when the consumer (embedding) is slower than parsing.
+    """
+    chunking = dict(CHUNKING)
+    if workers <= 1:
+        init_worker(EMBEDDING_MODEL)
+        for filename in filenames:
+            try:
+                yield filename, parse_document(os.path.join(DOCS_FOLDER, filename), chunking)
+            except Exception as e:
+                yield filename, e
+        return
     
-    return chunks
+    # spawn: workers re-import this module as __mp_main__, which loads
+    # neither torch nor Chroma at import time
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=init_worker, initargs=(EMBEDDING_MODEL,)) as pool:
+        pending = deque()
+        names = iter(filenames)
+        for filename in names:
+            pending.append((filename, pool.submit(parse_document, os.path.join(DOCS_FOLDER, filename), chunking)))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            filename, future = pending.popleft()
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            next_name = next(names, None)
+            if next_name is not None:
+                pending.append((next_name, pool.submit(parse_document, os.path.join(DOCS_FOLDER, next_name), chunking)))
+            yield filename, result
 
-def process_documents():
-    """Process all documents in raw_documents folder"""
-    docs_folder = 'data/raw_documents'
-    files = [f for f in os.listdir(docs_folder) if f.endswith('.txt')]
+def process_documents(manifest=None, minhash_index=None, workers=1, state=None):
+    """Process new or changed documents in raw_documents folder
+    
+    A generator: yields (chunk, metadata, id) for every chunk that still
+    needs embedding as soon as its file is parsed. Once exhausted, state
+    holds 'stale_ids' (chunks that no longer exist in the corpus) and
+    'manifest' (the updated manifest).
+    
+    With a minhash_index, a new chunk that is a near-duplicate of a chunk
+    already stored (or stored earlier in this run) is not embedded; the
+    file's manifest entry lists the canonical chunk under 'duplicates'.
+    Files whose canonical chunks are gone afterwards are chunked again, so
+    their text is embedded under their own name.
+    """
+    state = {} if state is None else state
+    files = sorted(f for f in os.listdir(DOCS_FOLDER) if f.endswith('.txt'))
     
     print(f"\nProcessing {len(files)} documents...")
     
-    all_chunks = []
-    all_metadata = []
-    all_ids = []
+    if manifest is None:
+        previous_files = {}
+        # Without a manifest every id in the collection is a candidate for removal
+        previous_ids = set(collection.get(include=[])['ids'])
+    else:
+        previous_files = manifest['files']
+        previous_ids = manifest_ids(previous_files)
+        if manifest['chunking'] != CHUNKING:
+            print("⚠️  Chunking parameters changed - re-chunking every document")
+            previous_files = {}
     
-    chunk_id = 0
+    files_manifest = {}
+    unchanged = 0
+    duplicates = 0
     
+    # Unchanged files keep their chunks without re-chunking or re-embedding.
+    # Only their chunks and chunks kept in this run may be the canonical copy
+    # of a near-duplicate; everything else may become stale
+    changed = []
+    canonical_ids = set()
+    # Hashed once here; parsing workers only read and chunk
+    hashes = {}
     for filename in files:
-        filepath = os.path.join(docs_folder, filename)
-        
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Extract metadata
-            metadata = extract_metadata(content)
-            
-            # Clean text (remove metadata header)
-            text_lines = content.split('\n')
-            main_text = '\n'.join([line for line in text_lines if not line.startswith(('Title:', 'Source:', 'Site:', 'Topic:', 'Category:'))])
-            cleaned_text = clean_text(main_text)
-            
-            # Chunk the text
-            chunks = chunk_text(cleaned_text)
+            with open(os.path.join(DOCS_FOLDER, filename), 'rb') as f:
+                file_hash = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            file_hash = None
+        hashes[filename] = file_hash
+        previous = previous_files.get(filename)
+        if previous and previous['sha256'] == file_hash:
+            files_manifest[filename] = previous
+            canonical_ids.update(previous['chunks'])
+            unchanged += 1
+        else:
+            changed.append(filename)
+    
+    rechunked = set()
+    while changed:
+        for filename, parsed in parse_changed_files(changed, workers):
+            if isinstance(parsed, Exception):
+                print(f"✗ Error processing {filename}: {parsed}")
+                # Keep the previous chunks rather than deleting them on a read error
+                if filename in previous_files:
+                    files_manifest[filename] = previous_files[filename]
+                continue
             
-            print(f"✓ {filename}: {len(chunks)} chunks")
+            metadata, chunks = parsed
+            file_hash = hashes[filename]
+            file_ids = []
+            file_duplicates = []
+            new_chunks = 0
             
             # Prepare data for ChromaDB
-            for chunk in chunks:
-                all_chunks.append(chunk)
+            for chunk, token_count in chunks:
+                cid = chunk_id(filename, chunk, metadata)
+                if cid in file_ids:
+                    continue
+                # Already embedded and stored under the same content-derived id
+                if cid in previous_ids:
+                    file_ids.append(cid)
+                    canonical_ids.add(cid)
+                    continue
+                
+                if minhash_index is not None:
+                    sig = signature(chunk)
+                    match = minhash_index.find(sig, allowed=canonical_ids)
+                    if match:
+                        # A repeat within the same file needs no alias
+                        if match[0] not in file_ids and match[0] not in file_duplicates:
+                            file_duplicates.append(match[0])
+                        duplicates += 1
+                        continue
+                    minhash_index.add(cid, sig)
+                
+                file_ids.append(cid)
+                canonical_ids.add(cid)
                 chunk_metadata = metadata.copy()
                 chunk_metadata['filename'] = filename
                 chunk_metadata['chunk_length'] = len(chunk.split())
-                all_metadata.append(chunk_metadata)
-                all_ids.append(f"chunk_{chunk_id}")
-                chunk_id += 1
-                
-        except Exception as e:
-            print(f"✗ Error processing {filename}: {e}")
+                chunk_metadata['token_count'] = token_count
+                new_chunks += 1
+                yield chunk, chunk_metadata, cid
+            
+            files_manifest[filename] = {'sha256': file_hash, 'chunks': file_ids}
+            if file_duplicates:
+                files_manifest[filename]['duplicates'] = file_duplicates
+            print(f"✓ {filename}: {len(file_ids)} chunks ({new_chunks} new, {len(file_duplicates)} near-duplicates)")
+        
+        # A near-duplicate of a chunk whose file just changed or disappeared
+        changed = [filename for filename in orphaned_files(files_manifest) if filename not in rechunked]
+        rechunked.update(changed)
+        if changed:
+            print(f"↻ Re-chunking {len(changed)} documents whose canonical chunks changed")
+            unchanged -= sum(1 for filename in changed if previous_files.get(filename) is files_manifest[filename])
     
-    return all_chunks, all_metadata, all_ids
+    if unchanged:
+        print(f"⊘ {unchanged} unchanged documents skipped")
+    if duplicates:
+        print(f"⊘ {duplicates} near-duplicate chunks not embedded")
+    
+    live_ids = manifest_ids(files_manifest)
+    state['stale_ids'] = sorted(previous_ids - live_ids)
+    
+    new_manifest = empty_manifest()
+    new_manifest['files'] = files_manifest
+    state['manifest'] = new_manifest
+
+def batched(items, size):
+    """Lists of up to size consecutive items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-def create_embeddings_and_store(chunks, metadata, ids):
-    """Generate embeddings and store in ChromaDB"""
-    print(f"\nGenerating embeddings for {len(chunks)} chunks...")
+def create_embeddings_and_store(chunk_stream, workers=1):
+    """Generate embeddings and store in ChromaDB
     
-    batch_size = 100
-    total_batches = (len(chunks) + batch_size - 1) // batch_size
+    Consumes (chunk, metadata, id) items batch by batch. Encoding uses a
+    SentenceTransformer multi-process pool when workers > 1, and each batch
+    is written to Chroma on a background thread while the next one is
+    encoded. Returns the number of chunks stored.
+    """
+    model = None
+    encode_pool = None
+    writer = ThreadPoolExecutor(max_workers=1)
+    pending_write = None
+    stored = 0
+    encode_seconds = 0.0
+    start = time.perf_counter()
     
-    for i in range(0, len(chunks), batch_size):
-        batch_chunks = chunks[i:i + batch_size]
-        batch_metadata = metadata[i:i + batch_size]
-        batch_ids = ids[i:i + batch_size]
-        
-        # Generate embeddings
-        embeddings = embedding_model.encode(batch_chunks, show_progress_bar=False)
-        
-        # Store in ChromaDB
-        collection.add(
-            embeddings=embeddings.tolist(),
-            documents=batch_chunks,
-            metadatas=batch_metadata,
-            ids=batch_ids
-        )
+    try:
+        for batch_num, batch in enumerate(batched(chunk_stream, BATCH_SIZE), 1):
+            if model is None:
+                print(f"\nGenerating embeddings...")
+                model = get_embedding_model()
+                if workers > 1:
+                    encode_pool = start_encode_pool(model, workers)
+            
+            batch_chunks = [chunk for chunk, _, _ in batch]
+            
+            # Generate embeddings
+            encode_start = time.perf_counter()
+            embeddings = model.encode(batch_chunks, show_progress_bar=False, pool=encode_pool)
+            encode_seconds += time.perf_counter() - encode_start
+            
+            # One write in flight at a time keeps memory bounded
+            if pending_write is not None:
+                pending_write.result()
+            # Store in ChromaDB (upsert so a re-run never collides with existing ids)
+            pending_write = writer.submit(
+                collection.upsert,
+                embeddings=embeddings.tolist(),
+                documents=batch_chunks,
+                metadatas=[metadata for _, metadata, _ in batch],
+                ids=[cid for _, _, cid in batch]
+            )
+            stored += len(batch)
+            print(f"✓ Batch {batch_num} encoded ({stored} chunks so far)")
         
-        batch_num = (i // batch_size) + 1
-        print(f"✓ Batch {batch_num}/{total_batches} stored")
+        if pending_write is not None:
+            pending_write.result()
+    finally:
+        writer.shutdown()
+        if encode_pool is not None:
+            model.stop_multi_process_pool(encode_pool)
+    
+    if model is None:
+        print("\n✅ Nothing new to embed")
+        return 0
     
-    print("\n✅ All embeddings stored in ChromaDB!")
+    elapsed = time.perf_counter() - start
+    stats = model.stats()
+    print(f"\n✅ All embeddings stored in ChromaDB! (embedding cache: {stats['hits']} hits, {stats['misses']} misses)")
+    print(f"⚡ {stored} chunks in {elapsed:.1f} s: {stored / elapsed:.1f} chunks/sec end-to-end, "
+          f"{stored / encode_seconds if encode_seconds else 0:.1f} chunks/sec encoding ({workers} workers)")
+    return stored
+
+def start_encode_pool(model, workers):
+    """SentenceTransformer multi-process pool with one CPU worker per core"""
+    # One torch thread per worker process, or the workers fight over the cores
+    previous = os.environ.get('OMP_NUM_THREADS')
+    os.environ['OMP_NUM_THREADS'] = '1'
+    try:
+        return model.start_multi_process_pool(target_devices=['cpu'] * workers)
+    finally:
+        if previous is None:
+            del os.environ['OMP_NUM_THREADS']
+        else:
+            os.environ['OMP_NUM_THREADS'] = previous
+
+def update_aliases(old_files, new_files):
+    """Record in each canonical chunk's metadata which other files it also stands for"""
+    old_aliases = alias_map(old_files)
+    new_aliases = alias_map(new_files)
+    changed = sorted(cid for cid in set(old_aliases) | set(new_aliases)
+                     if old_aliases.get(cid) != new_aliases.get(cid))
+    if not changed:
+        return
+    
+    stored = collection.get(ids=changed, include=['metadatas'])
+    metadatas = []
+    for cid, metadata in zip(stored['ids'], stored['metadatas']):
+        metadata = dict(metadata)
+        # Chroma metadata values must be scalars, so the file names are comma-joined
+        metadata['aliases'] = ','.join(new_aliases.get(cid, []))
+        metadatas.append(metadata)
+    if stored['ids']:
+        collection.update(ids=stored['ids'], metadatas=metadatas)
+    print(f"🔗 Updated aliases of {len(stored['ids'])} canonical chunks")
+
+def delete_stale_chunks(stale_ids):
+    """Remove chunks whose source text changed or disappeared"""
+    batch_size = 500
+    for i in range(0, len(stale_ids), batch_size):
+        collection.delete(ids=stale_ids[i:i + batch_size])
+    print(f"🗑️  Removed {len(stale_ids)} stale chunks")
 
 # Main execution
 if __name__ == "__main__":
@@ -142,13 +410,59 @@ if __name__ == "__main__":
     print("TUNISIAN ARCHAEOLOGY CHATBOT - DATA INGESTION")
     print("="*60)
     
-    # Process documents
-    chunks, metadata, ids = process_documents()
+    parser = argparse.ArgumentParser(description="Ingest data/raw_documents into ChromaDB")
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS,
+                        help="parsing and encoding processes (default: all cores)")
+    parser.add_argument('--multilingual', action='store_true', default=MULTILINGUAL_RETRIEVAL,
+                        help="also keep the multilingual index up to date (default with RAG_MULTILINGUAL_RETRIEVAL=1)")
+    args = parser.parse_args()
+    workers = max(1, args.workers)
+    
+    # Initialize ChromaDB
+    print("Initializing ChromaDB...")
+    import chromadb
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    
+    # Create or get collection
+    collection = client.get_or_create_collection(
+        name="tunisian_archaeology",
+        metadata={"description": "Tunisian archaeological sites knowledge base"}
+    )
     
-    print(f"\nTotal chunks created: {len(chunks)}")
+    # Process documents (only new or changed files are chunked), streaming
+    # their chunks straight into the encoder
+    manifest = load_manifest()
+    minhash_index = load_minhash_index()
+    state = {}
+    create_embeddings_and_store(process_documents(manifest, minhash_index, workers, state), workers)
+    stale_ids = state['stale_ids']
+    new_manifest = state['manifest']
     
-    # Create embeddings and store
-    create_embeddings_and_store(chunks, metadata, ids)
+    if stale_ids:
+        delete_stale_chunks(stale_ids)
+        minhash_index.remove(stale_ids)
+    
+    update_aliases(manifest['files'] if manifest else {}, new_manifest['files'])
+    minhash_index.save()
+    
+    # Only record the new state once the collection has been updated
+    save_manifest(new_manifest)
+    
+    # Keep the numpy retrieval backend, the BM25 index and the domain centroids
+    # in sync with the collection
+    export_numpy_store(collection)
+    export_lexical_index(collection)
+    export_domain_gate(collection)
+    
+    # Parallel index for searching non-English questions without translating them
+    if args.multilingual:
+        multilingual_model = load_multilingual_encoder()
+        multilingual_pool = start_encode_pool(multilingual_model, workers) if workers > 1 else None
+        try:
+            export_multilingual_store(collection, multilingual_model, multilingual_pool)
+        finally:
+            if multilingual_pool is not None:
+                multilingual_model.stop_multi_process_pool(multilingual_pool)
     
     # Verify
     count = collection.count()
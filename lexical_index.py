@@ -0,0 +1,237 @@
+import os
+import re
+import json
+import unicodedata
+import numpy as np
+from vector_store import CHROMA_PATH, manifest_mtime
+from tracing import span
+
+LEXICAL_INDEX_PATH = os.path.join(CHROMA_PATH, 'lexical_index')
+
+# "dense" (default) or "hybrid", dense results fused with BM25
+RETRIEVAL_MODE = os.environ.get('RAG_RETRIEVAL_MODE', 'dense')
+
+# BM25 parameters, baked into the stored posting weights
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant and how many candidates each side contributes
+RRF_K = 60
+CANDIDATE_FACTOR = 4
+MIN_CANDIDATES = 20
+
+STOPWORDS = set("""
+a about an and are as at be been but by can could did do does for from had has have how i in
+into is it its me my of on or so tell than that the their them then there these they this to
+was were what when where which who whom why will with would you your known
+""".split())
+
+def tokenize(text):
+    """Lowercase, accent-folded word tokens without stopwords"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [t for t in re.findall(r'[^\W_]+', text) if t not in STOPWORDS and (len(t) > 1 or t.isdigit())]
+
+def bm25_arrays(documents, k1=BM25_K1, b=BM25_B):
+    """Flat postings arrays, vocabulary and stats of a BM25 index over documents"""
+    vocab = {}
+    doc_terms = []
+    doc_lengths = np.zeros(len(documents), dtype=np.float32)
+    for i, document in enumerate(documents):
+        tokens = tokenize(document)
+        doc_lengths[i] = len(tokens)
+        counts = {}
+        for token in tokens:
+            term = vocab.setdefault(token, len(vocab))
+            counts[term] = counts.get(term, 0) + 1
+        doc_terms.append(counts)
+
+    # Group (term, doc, tf) triples by term into the flat postings arrays
+    terms = np.array([t for counts in doc_terms for t in counts], dtype=np.int64)
+    docs = np.array([d for d, counts in enumerate(doc_terms) for _ in counts], dtype=np.int32)
+    tfs = np.array([tf for counts in doc_terms for tf in counts.values()], dtype=np.float32)
+    order = np.argsort(terms, kind='stable')
+    terms, docs, tfs = terms[order], docs[order], tfs[order]
+
+    df = np.bincount(terms, minlength=len(vocab)).astype(np.float32)
+    offsets = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+    n = len(documents)
+    idf = np.log(1 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+    avgdl = float(doc_lengths.mean()) if n else 0.0
+    norm = k1 * (1 - b + b * doc_lengths[docs] / (avgdl or 1))
+    weights = (idf[terms] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+    arrays = {'offsets': offsets, 'postings': docs, 'weights': weights, 'idf': idf}
+    meta = {'count': n, 'terms': len(vocab), 'avgdl': avgdl, 'k1': k1, 'b': b}
+    return arrays, vocab, meta
+
+class LexicalIndex:
+    """BM25 inverted index over the stored chunks
+
+    Postings are flat arrays: the chunks containing term t are
+    postings[offsets[t]:offsets[t + 1]], and weights holds each posting's
+    full BM25 contribution (IDF and length normalization included), so a
+    query only adds up a few small slices.
+    """
+
+    def __init__(self, path=LEXICAL_INDEX_PATH):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, 'vocab.json'), 'r', encoding='utf-8') as f:
+            self.vocab = json.load(f)
+        with open(os.path.join(path, 'ids.json'), 'r', encoding='utf-8') as f:
+            self.ids = json.load(f)
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self.postings = np.load(os.path.join(path, 'postings.npy'))
+        self.weights = np.load(os.path.join(path, 'weights.npy'))
+        self.idf = np.load(os.path.join(path, 'idf.npy'))
+
+    @classmethod
+    def build(cls, ids, documents, path=LEXICAL_INDEX_PATH, k1=BM25_K1, b=BM25_B, source=None):
+        """Index documents and write the index to path"""
+        os.makedirs(path, exist_ok=True)
+        arrays, vocab, meta = bm25_arrays(documents, k1, b)
+        meta['source'] = source
+
+        def write(filename, save):
+            tmp = os.path.join(path, filename + '.tmp')
+            with open(tmp, 'wb') as f:
+                save(f)
+            os.replace(tmp, os.path.join(path, filename))
+
+        for key, array in arrays.items():
+            write(key + '.npy', lambda f: np.save(f, array))
+        write('vocab.json', lambda f: f.write(json.dumps(vocab, ensure_ascii=False).encode('utf-8')))
+        write('ids.json', lambda f: f.write(json.dumps(list(ids)).encode('utf-8')))
+        write('meta.json', lambda f: f.write(json.dumps(meta).encode('utf-8')))
+        return cls(path)
+
+    @classmethod
+    def from_arrays(cls, meta, vocab, ids, arrays):
+        """An index over arrays that are already loaded or memory-mapped (e.g. from a snapshot)"""
+        index = cls.__new__(cls)
+        index.path = None
+        index.meta = meta
+        index.vocab = vocab
+        index.ids = ids
+        index.offsets = arrays['offsets']
+        index.postings = arrays['postings']
+        index.weights = arrays['weights']
+        index.idf = arrays['idf']
+        return index
+
+    @classmethod
+    def from_collection(cls, collection, path=LEXICAL_INDEX_PATH):
+        """Index every chunk stored in a Chroma collection (or NumpyStore)"""
+        data = collection.get(include=['documents'])
+        return cls.build(data['ids'], data['documents'], path,
+                         source={'count': collection.count(), 'manifest_mtime_ns': manifest_mtime()})
+
+    def count(self):
+        return len(self.ids)
+
+    def nbytes(self):
+        return self.offsets.nbytes + self.postings.nbytes + self.weights.nbytes + self.idf.nbytes
+
+    def scores(self, query):
+        """BM25 score of every chunk for query"""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in tokenize(query):
+            term = self.vocab.get(token)
+            if term is None:
+                continue
+            start, stop = self.offsets[term], self.offsets[term + 1]
+            # A term appears once per chunk in its postings, so no np.add.at needed
+            scores[self.postings[start:stop]] += self.weights[start:stop]
+        return scores
+
+    def search(self, query, top_k=5):
+        """Ids and BM25 scores of the best matching chunks (only those matching a term)"""
+        scores = self.scores(query)
+        matching = np.flatnonzero(scores)
+        if len(matching) > top_k:
+            matching = matching[np.argpartition(-scores[matching], top_k - 1)[:top_k]]
+        matching = matching[np.argsort(-scores[matching], kind='stable')]
+        return [self.ids[i] for i in matching], scores[matching].tolist()
+
+def export_lexical_index(collection, path=LEXICAL_INDEX_PATH):
+    """Rebuild the BM25 index from the stored chunks (run after ingest)"""
+    index = LexicalIndex.from_collection(collection, path)
+    print(f"✓ Lexical index exported: {index.count()} chunks, {index.meta['terms']} terms, {index.nbytes() / 1e3:.0f} KB")
+    return index
+
+def load_lexical_index(collection, path=LEXICAL_INDEX_PATH):
+    """Open the BM25 index, rebuilding it if ingest ran since it was written"""
+    # A snapshot carries its own index, always in sync with its vectors
+    bundled = getattr(collection, 'lexical_index', None)
+    if bundled is not None:
+        return bundled
+    try:
+        index = LexicalIndex(path)
+        source = index.meta.get('source') or {}
+        if source.get('manifest_mtime_ns') == manifest_mtime() and index.count() == collection.count():
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    print("⚠️  Lexical index missing or out of date - rebuilding")
+    return export_lexical_index(collection, path)
+
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    """Ids ordered by the summed 1 / (rrf_k + rank) over every ranking"""
+    fused = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, 1):
+            fused[cid] = fused.get(cid, 0.0) + 1 / (rrf_k + rank)
+    return sorted(fused, key=lambda cid: -fused[cid])
+
+def hybrid_query(collection, index, questions, query_embeddings, n_results=5):
+    """Dense and BM25 candidates fused with RRF, in Chroma's query() result shape
+
+    Distances stay the dense squared L2 distances (computed for chunks only
+    the lexical side found), so similarity thresholds keep working.
+    """
+    query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+    candidates = max(n_results * CANDIDATE_FACTOR, MIN_CANDIDATES)
+    dense = collection.query(query_embeddings=query_embeddings.tolist(), n_results=candidates)
+    with span('lexical_search', queries=len(questions)) as sp:
+        lexical = [index.search(question, candidates)[0] for question in questions]
+        sp.set(chunks=sum(len(ids) for ids in lexical))
+
+    rankings = [reciprocal_rank_fusion([dense_ids, lexical_ids])[:n_results]
+                for dense_ids, lexical_ids in zip(dense['ids'], lexical)]
+
+    # Chunks missing from a query's own dense results (found by BM25, or by
+    # another query's dense search) need their vectors for the distance:
+    # fetch them once for all queries
+    known = {}
+    for i, ids in enumerate(dense['ids']):
+        for j, cid in enumerate(ids):
+            known[cid] = (dense['documents'][i][j], dense['metadatas'][i][j])
+    missing = sorted({cid for ranking, dense_ids in zip(rankings, dense['ids'])
+                      for cid in set(ranking) - set(dense_ids)})
+    vectors = {}
+    if missing:
+        fetched = collection.get(ids=missing, include=['documents', 'metadatas', 'embeddings'])
+        for cid, document, metadata, embedding in zip(fetched['ids'], fetched['documents'],
+                                                       fetched['metadatas'], fetched['embeddings']):
+            known[cid] = (document, metadata)
+            vectors[cid] = np.asarray(embedding, dtype=np.float32)
+
+    results = {'ids': [], 'embeddings': None, 'documents': [], 'metadatas': [], 'distances': [],
+               'included': ['metadatas', 'documents', 'distances']}
+    for i, ranking in enumerate(rankings):
+        dense_distance = dict(zip(dense['ids'][i], dense['distances'][i]))
+        # An index older than the store may name chunks that are gone
+        ranking = [cid for cid in ranking if cid in dense_distance or cid in vectors]
+        distances = []
+        for cid in ranking:
+            if cid in dense_distance:
+                distances.append(dense_distance[cid])
+            else:
+                distances.append(float(np.sum((vectors[cid] - query_embeddings[i]) ** 2)))
+        results['ids'].append(ranking)
+        results['documents'].append([known[cid][0] for cid in ranking])
+        results['metadatas'].append([known[cid][1] for cid in ranking])
+        results['distances'].append(distances)
+    return results
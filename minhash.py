@@ -0,0 +1,147 @@
+import os
+import re
+import json
+import hashlib
+import numpy as np
+
+# Number of hash permutations in a signature, split into LSH bands of rows
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+
+# Estimated Jaccard similarity of word shingles above which chunks are duplicates
+DUPLICATE_THRESHOLD = 0.8
+SHINGLE_SIZE = 5
+
+# Mersenne prime for the (a * x + b) mod p permutations. Shingle hashes and
+# coefficients are both below it, so a * x + b stays below 2^63 and the
+# modulus wraps every permutation (a larger p would leave a * x + b ordered
+# like x, making every permutation pick the same shingle)
+PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20240101)
+PERM_A = _rng.randint(1, PRIME, NUM_PERM).astype(np.uint64)
+PERM_B = _rng.randint(0, PRIME, NUM_PERM).astype(np.uint64)
+# Stored with the signatures; indexes written with another scheme are rebuilt
+HASH_VERSION = 2
+
+def shingle_hashes(text):
+    """Hashes below PRIME of the lowercase word 5-grams of text"""
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < SHINGLE_SIZE:
+        grams = [' '.join(words)]
+    else:
+        grams = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(g.encode('utf-8'), digest_size=4).digest(), 'little') for g in grams],
+        dtype=np.uint64
+    ) % PRIME
+
+def signature(text):
+    """MinHash signature: the minimum of every permutation over the shingle hashes"""
+    hashes = shingle_hashes(text)
+    return ((np.outer(hashes, PERM_A) + PERM_B) % PRIME).min(axis=0)
+
+class MinHashIndex:
+    """LSH index of MinHash signatures for the chunks stored in the collection
+
+    Signatures are split into BANDS bands of ROWS values; chunks sharing any
+    whole band are candidates, confirmed by comparing the full signatures.
+    Persisted as signatures.npy + ids.json so incremental ingests can match
+    new chunks against chunks stored by earlier runs.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.ids = []
+        self.signatures = np.zeros((0, NUM_PERM), dtype=np.uint64)
+        self.buckets = {}
+        if path and os.path.exists(os.path.join(path, 'ids.json')):
+            with open(os.path.join(path, 'ids.json'), 'r', encoding='utf-8') as f:
+                ids = json.load(f)
+            signatures = np.load(os.path.join(path, 'signatures.npy'))
+            try:
+                with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+                    version = json.load(f).get('hash_version')
+            except FileNotFoundError:
+                version = 1
+            if version != HASH_VERSION:
+                raise ValueError("minhash index was built with another hash scheme")
+            if len(ids) != len(signatures) or signatures.shape[1:] != (NUM_PERM,):
+                raise ValueError("minhash index is inconsistent")
+            self._add_rows(ids, signatures)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _band_keys(self, sig):
+        return [(band, sig[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+    def _add_rows(self, ids, signatures):
+        start = len(self.ids)
+        self.ids.extend(ids)
+        self.signatures = np.concatenate([self.signatures, np.asarray(signatures, dtype=np.uint64).reshape(-1, NUM_PERM)])
+        for row in range(start, len(self.ids)):
+            for key in self._band_keys(self.signatures[row]):
+                self.buckets.setdefault(key, []).append(row)
+
+    def add(self, cid, sig):
+        self._add_rows([cid], sig[None, :])
+
+    def find(self, sig, threshold=DUPLICATE_THRESHOLD, allowed=None):
+        """The most similar indexed chunk at or above threshold, as (id, similarity), or None
+
+        allowed optionally restricts the match to a set of chunk ids.
+        """
+        candidates = set()
+        for key in self._band_keys(sig):
+            candidates.update(self.buckets.get(key, ()))
+        if allowed is not None:
+            candidates = {row for row in candidates if self.ids[row] in allowed}
+        if not candidates:
+            return None
+        rows = np.fromiter(candidates, dtype=np.int64)
+        similarity = (self.signatures[rows] == sig).mean(axis=1)
+        best = int(np.argmax(similarity))
+        if similarity[best] < threshold:
+            return None
+        return self.ids[rows[best]], float(similarity[best])
+
+    def remove(self, ids):
+        """Drop chunks (e.g. stale ones) and rebuild the buckets"""
+        ids = set(ids)
+        keep = [row for row, cid in enumerate(self.ids) if cid not in ids]
+        if len(keep) == len(self.ids):
+            return
+        kept_ids = [self.ids[row] for row in keep]
+        kept_signatures = self.signatures[keep]
+        self.ids = []
+        self.signatures = np.zeros((0, NUM_PERM), dtype=np.uint64)
+        self.buckets = {}
+        self._add_rows(kept_ids, kept_signatures)
+
+    def save(self, path=None):
+        path = path or self.path
+        os.makedirs(path, exist_ok=True)
+        tmp = os.path.join(path, 'signatures.npy.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, self.signatures)
+        os.replace(tmp, os.path.join(path, 'signatures.npy'))
+        tmp = os.path.join(path, 'meta.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'hash_version': HASH_VERSION, 'num_perm': NUM_PERM}, f)
+        os.replace(tmp, os.path.join(path, 'meta.json'))
+        # ids.json last: it is what marks the index as present
+        tmp = os.path.join(path, 'ids.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.ids, f)
+        os.replace(tmp, os.path.join(path, 'ids.json'))
+
+    @classmethod
+    def from_collection(cls, collection, path=None):
+        """Index every chunk already stored in the collection"""
+        index = cls()
+        index.path = path
+        data = collection.get(include=['documents'])
+        if data['ids']:
+            index._add_rows(data['ids'], np.stack([signature(doc) for doc in data['documents']]))
+        return index
@@ -0,0 +1,118 @@
+import os
+import numpy as np
+from domain_gate import unit_rows
+from tracing import span
+from adaptive_top_k import fetch_k, cut_results, TOP_K_POLICY
+
+# Set RAG_MMR=1 to re-rank retrieved chunks with maximal marginal relevance
+# before they are packed into the prompt
+MMR_ENABLED = os.environ.get('RAG_MMR', '0') == '1'
+# Weight of relevance against novelty: 1.0 is pure relevance order, lower
+# values favour chunks unlike the ones already picked
+MMR_LAMBDA = float(os.environ.get('RAG_MMR_LAMBDA', '0.7'))
+# Candidates re-ranked per question
+MMR_CANDIDATES = 20
+# Chunks picked at most from one file and from one site (e.g. carthage_en.txt
+# and ancient_carthage_en.txt both describe Carthage)
+MAX_PER_FILE = 2
+MAX_PER_SITE = 3
+
+def mmr_order(query_embedding, embeddings, k, diversity_weight=MMR_LAMBDA, files=None, sites=None,
+              max_per_file=MAX_PER_FILE, max_per_site=MAX_PER_SITE):
+    """Indexes of up to k candidates picked by maximal marginal relevance
+
+    Each pick maximizes diversity_weight * cos(query, chunk) - (1 -
+    diversity_weight) * max cos(chunk, picked chunk). The candidate
+    similarity matrix is computed once, so each pick is one vector update.
+    Files and sites that reached their cap are excluded from later picks.
+    """
+    if len(embeddings) == 0:
+        return []
+    vectors = unit_rows(np.asarray(embeddings, dtype=np.float32))
+    query = unit_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    groups = []
+    for keys, cap in ((files, max_per_file), (sites, max_per_site)):
+        if keys is not None and cap:
+            # Empty keys (e.g. a chunk without a site) are never capped
+            labels = np.array([key or f"\x00{i}" for i, key in enumerate(keys)], dtype=object)
+            groups.append((labels, cap, {}))
+
+    picked = []
+    while len(picked) < k and available.any():
+        scores = diversity_weight * relevance - (1 - diversity_weight) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+        for labels, cap, counts in groups:
+            label = labels[best]
+            counts[label] = counts.get(label, 0) + 1
+            if counts[label] >= cap:
+                available &= labels != label
+    return picked
+
+def candidate_embeddings(store, results, encode=None):
+    """Embeddings of one question's retrieved chunks, in result order
+
+    Taken from the results when the search returned them, otherwise read
+    from the store by id, or re-encoded with encode() for a store that
+    cannot return embeddings (the retrieval server).
+    """
+    if results.get('embeddings') is not None and results['embeddings'][0] is not None:
+        return np.asarray(results['embeddings'][0], dtype=np.float32)
+    ids = results['ids'][0]
+    if hasattr(store, 'get'):
+        fetched = store.get(ids=ids, include=['embeddings'])
+        by_id = dict(zip(fetched['ids'], fetched['embeddings']))
+        return np.asarray([by_id[cid] for cid in ids], dtype=np.float32)
+    return np.asarray(encode(results['documents'][0]), dtype=np.float32)
+
+def diversify(results, query_embedding, embeddings, k, diversity_weight=MMR_LAMBDA):
+    """One question's results (Chroma query() shape) re-ranked by MMR and cut to k, with stats"""
+    metadatas = results['metadatas'][0]
+    order = mmr_order(query_embedding, embeddings, k, diversity_weight,
+                      files=[meta.get('filename', '') for meta in metadatas],
+                      sites=[meta.get('site', '') for meta in metadatas])
+    reranked = {key: (values if values is None or key == 'included' else [[values[0][i] for i in order]])
+                for key, values in results.items()}
+    top = list(range(min(k, len(metadatas))))
+    stats = {
+        'candidates': len(metadatas),
+        'picked': len(order),
+        'reordered': order != top,
+        'files': len({metadatas[i].get('filename', '') for i in order}),
+        'files_by_relevance': len({metadatas[i].get('filename', '') for i in top})
+    }
+    return reranked, stats
+
+def candidate_count(top_k, policy=TOP_K_POLICY, mmr=MMR_ENABLED):
+    """Chunks to search for: top_k, or a larger pool for the adaptive cut or MMR"""
+    return max(fetch_k(top_k, policy), MMR_CANDIDATES) if mmr else fetch_k(top_k, policy)
+
+def refine_results(results, question_embedding, top_k, similarity_threshold, store, encode,
+                   policy=TOP_K_POLICY, mmr=MMR_ENABLED):
+    """The adaptive cut and the MMR re-ranking, where enabled, between search and context packing
+
+    The adaptive cut decides how many chunks to keep (top_k under the fixed
+    policy); MMR then picks that many from the whole candidate pool, not
+    only from the chunks the cut kept. Returns the results and the stats
+    of each step that ran.
+    """
+    refined = results
+    stats = {}
+    if policy == 'adaptive':
+        with span('adaptive_top_k') as sp:
+            refined, stats['adaptive_top_k'] = cut_results(results, similarity_threshold)
+            sp.set(**stats['adaptive_top_k'])
+    if mmr:
+        k = len(refined['ids'][0]) if policy == 'adaptive' else top_k
+        with span('mmr', k=k) as sp:
+            embeddings = candidate_embeddings(store, results, encode)
+            refined, stats['mmr'] = diversify(results, question_embedding, embeddings, k)
+            sp.set(**stats['mmr'])
+    return refined, stats
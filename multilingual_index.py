@@ -0,0 +1,104 @@
+import os
+import time
+import numpy as np
+from embedding_cache import CachedEncoder
+from vector_store import NumpyStore, CHROMA_PATH, manifest_mtime, NUMPY_STORE_DTYPE, NUMPY_STORE_QUANTIZATION
+from domain_gate import DomainGate, centroid_arrays, unit_rows
+
+# CPU-friendly multilingual encoder (12 layers, 384 dimensions) whose vectors
+# for a sentence and its translations are close, so French or Arabic questions
+# can be searched against the English chunks without translating them
+MULTILINGUAL_MODEL = os.environ.get('RAG_MULTILINGUAL_MODEL',
+                                    'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+# Parallel index of the same chunks; the MiniLM collection stays the main one
+MULTILINGUAL_STORE_PATH = os.path.join(CHROMA_PATH, 'multilingual_store')
+
+# Set RAG_MULTILINGUAL_RETRIEVAL=1 to search questions in MULTILINGUAL_LANGUAGES
+# with the multilingual index instead of translating them first; ingest.py
+# then keeps the index up to date (or pass it --multilingual)
+MULTILINGUAL_RETRIEVAL = os.environ.get('RAG_MULTILINGUAL_RETRIEVAL', '0') == '1'
+
+# LANGUAGE_NAMES codes in the default model's training data; other languages
+# still go through translation
+MULTILINGUAL_LANGUAGES = {
+    'fr', 'ar', 'es', 'de', 'it', 'pt', 'ru', 'zh-cn', 'zh-tw', 'ja', 'ko', 'nl', 'pl', 'tr',
+    'sv', 'da', 'fi', 'no', 'cs', 'el', 'he', 'hi', 'id', 'ms', 'th', 'vi', 'uk', 'ro', 'hu',
+    'sk', 'bg', 'hr', 'sr', 'ca', 'lt', 'lv', 'et', 'sl', 'sq', 'fa', 'ur'
+}
+
+def load_encoder(model_name=MULTILINGUAL_MODEL):
+    """The multilingual model behind the embedding cache"""
+    from sentence_transformers import SentenceTransformer
+    return CachedEncoder(SentenceTransformer(model_name), model_name)
+
+def encode_questions(encoder, questions):
+    """Unit-length question vectors, so 1 / (1 + distance) means what it does for MiniLM"""
+    vectors = encoder.encode(list(questions), show_progress_bar=False)
+    return unit_rows(np.asarray(vectors, dtype=np.float32))
+
+def token_windows(tokenizer, text, size):
+    """text split into pieces of at most size tokens"""
+    ids = tokenizer(text, add_special_tokens=False)['input_ids']
+    if len(ids) <= size:
+        return [text]
+    return [tokenizer.decode(ids[i:i + size]) for i in range(0, len(ids), size)]
+
+def encode_chunks(encoder, chunks, pool=None, batch_size=32):
+    """Unit-length chunk vectors
+
+    Chunks are sized for MiniLM's 256-token window, which is longer than the
+    multilingual model's, so a long chunk is encoded window by window and
+    gets the mean of its windows' vectors instead of being truncated.
+    """
+    size = encoder.max_seq_length - 2
+    pieces = []
+    owners = []
+    for row, chunk in enumerate(chunks):
+        for piece in token_windows(encoder.tokenizer, chunk, size):
+            pieces.append(piece)
+            owners.append(row)
+    if not pieces:
+        return np.zeros((0, encoder.get_sentence_embedding_dimension()), dtype=np.float32)
+    vectors = encoder.encode(pieces, pool=pool, batch_size=batch_size, show_progress_bar=False)
+    vectors = unit_rows(np.asarray(vectors, dtype=np.float32))
+    sums = np.zeros((len(chunks), vectors.shape[1]), dtype=np.float32)
+    np.add.at(sums, np.asarray(owners, dtype=np.int64), vectors)
+    return unit_rows(sums)
+
+def export_multilingual_store(collection, encoder=None, pool=None, path=MULTILINGUAL_STORE_PATH,
+                              dtype=NUMPY_STORE_DTYPE, quantization=NUMPY_STORE_QUANTIZATION):
+    """Embed every chunk of the collection with the multilingual model (run after ingest)
+
+    Vectors of unchanged chunks come from the embedding cache, so after the
+    first export only new chunks are encoded.
+    """
+    encoder = encoder or load_encoder()
+    data = collection.get(include=['documents', 'metadatas'])
+    start = time.perf_counter()
+    embeddings = encode_chunks(encoder, data['documents'], pool)
+    elapsed = time.perf_counter() - start
+    store = NumpyStore.build(
+        data['ids'], embeddings, data['documents'], data['metadatas'],
+        path=path, name=collection.name, dtype=dtype, quantization=quantization,
+        source={'count': collection.count(), 'manifest_mtime_ns': manifest_mtime(), 'model': encoder.model_name}
+    )
+    print(f"✓ Multilingual index exported: {store.count()} vectors ({encoder.model_name}, {elapsed:.1f} s)")
+    return store
+
+def load_multilingual_store(collection, encoder=None, path=MULTILINGUAL_STORE_PATH):
+    """Open the multilingual index, re-embedding the chunks if ingest ran since it was written"""
+    try:
+        store = NumpyStore(path)
+        source = store.meta.get('source') or {}
+        if (source.get('manifest_mtime_ns') == manifest_mtime() and source.get('count') == collection.count()
+                and source.get('model') == MULTILINGUAL_MODEL):
+            return store
+    except (OSError, ValueError, KeyError):
+        pass
+    print("⚠️  Multilingual index missing or out of date - rebuilding")
+    return export_multilingual_store(collection, encoder, path=path)
+
+def multilingual_domain_gate(store):
+    """Site/topic centroids in the multilingual model's vector space"""
+    centroids, labels = centroid_arrays(np.asarray(store.embeddings, dtype=np.float32), store.metadatas)
+    return DomainGate.from_arrays({'centroids': len(labels), 'chunks': store.count()}, labels, centroids)
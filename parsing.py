@@ -0,0 +1,127 @@
+import re
+
+# Tokenizer of the embedding model, loaded once per (worker) process
+tokenizer = None
+
+def init_worker(model_name):
+    """Process pool initializer: load the embedder's tokenizer"""
+    global tokenizer
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+def clean_text(text):
+    """Clean and normalize text"""
+    # Remove extra whitespace
+    text = re.sub(r'\s+', ' ', text)
+    # Remove special characters but keep basic punctuation
+    text = re.sub(r'[^\w\s.,;:!?()\-]', '', text)
+    return text.strip()
+
+def extract_metadata(text):
+    """Extract metadata from document header"""
+    lines = text.split('\n')
+    metadata = {
+        'title': '',
+        'source': '',
+        'site': '',
+        'topic': ''
+    }
+    
+    for line in lines[:10]:  # Check first 10 lines
+        if line.startswith('Title:'):
+            metadata['title'] = line.replace('Title:', '').strip()
+        elif line.startswith('Source:'):
+            metadata['source'] = line.replace('Source:', '').strip()
+        elif line.startswith('Site:'):
+            metadata['site'] = line.replace('Site:', '').strip()
+        elif line.startswith('Topic:'):
+            metadata['topic'] = line.replace('Topic:', '').strip()
+    
+    return metadata
+
+def split_sentences(text):
+    """Split cleaned text into sentences"""
+    return [s for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
+
+def token_pieces(sentence, offsets, max_tokens):
+    """Cut a sentence longer than max_tokens at word boundaries
+
+    offsets are the tokenizer's (start, end) character spans of each token.
+    Returns (text, token_count) pieces of at most max_tokens tokens.
+    """
+    pieces = []
+    start = 0
+    while start < len(offsets):
+        stop = min(start + max_tokens, len(offsets))
+        # Back off so the cut never splits a word into word pieces
+        while stop < len(offsets) and stop > start + 1 and offsets[stop][0] == offsets[stop - 1][1]:
+            stop -= 1
+        text = sentence[offsets[start][0]:offsets[stop - 1][1]].strip()
+        if text:
+            pieces.append((text, stop - start))
+        start = stop
+    return pieces
+
+def chunk_text(text, tokenizer, chunk_tokens=250, overlap_tokens=40):
+    """Split text into overlapping chunks of whole sentences, sized in tokens
+    
+    Sentences are packed until the next one would exceed chunk_tokens; each
+    chunk then starts with the last sentences of the previous one, up to
+    overlap_tokens. Sentences longer than a chunk are cut at word boundaries.
+    Returns (chunk, token_count) pairs.
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        return []
+    
+    encoded = tokenizer(sentences, add_special_tokens=False, return_offsets_mapping=True)
+    units = []
+    for sentence, offsets in zip(sentences, encoded['offset_mapping']):
+        if len(offsets) <= chunk_tokens:
+            units.append((sentence, len(offsets)))
+        else:
+            units.extend(token_pieces(sentence, offsets, chunk_tokens))
+    
+    chunks = []
+    current = []
+    current_tokens = 0
+    for unit in units:
+        if current and current_tokens + unit[1] > chunk_tokens:
+            chunks.append((' '.join(u[0] for u in current), current_tokens))
+            # Carry trailing sentences over as overlap, keeping room for this one
+            overlap = []
+            overlap_size = 0
+            for previous in reversed(current):
+                if overlap_size + previous[1] > overlap_tokens or overlap_size + previous[1] + unit[1] > chunk_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += previous[1]
+            current, current_tokens = overlap, overlap_size
+        current.append(unit)
+        current_tokens += unit[1]
+    
+    if current:
+        chunks.append((' '.join(u[0] for u in current), current_tokens))
+    return chunks
+
+def parse_document(filepath, chunking):
+    """Read, clean and chunk one document
+    
+    Runs in the ingest process pool; init_worker must have loaded the
+    tokenizer. Returns the header metadata and the (chunk, token_count)
+    pairs.
+    """
+    with open(filepath, 'rb') as f:
+        content = f.read().decode('utf-8')
+    
+    # Extract metadata
+    metadata = extract_metadata(content)
+    
+    # Clean text (remove metadata header)
+    text_lines = content.split('\n')
+    main_text = '\n'.join([line for line in text_lines if not line.startswith(('Title:', 'Source:', 'Site:', 'Topic:', 'Category:'))])
+    cleaned_text = clean_text(main_text)
+    
+    # Chunk the text with the embedder's own tokenizer
+    chunks = chunk_text(cleaned_text, tokenizer, **chunking)
+    return metadata, chunks
@@ -1,20 +1,224 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import ollama
+from embedding_cache import CachedEncoder
+from encoder_backend import load_encoder_model, cache_name, ENCODER_BACKEND
+from answer_cache import AnswerCache, collection_fingerprint
+from tracing import Trace, activate, span, submit
+from vector_store import open_store, VECTOR_STORE
+from lexical_index import load_lexical_index, hybrid_query, RETRIEVAL_MODE
+from context_packing import pack_context, CONTEXT_TOKEN_BUDGET
+from mmr import candidate_count, refine_results
+from domain_gate import load_domain_gate, DOMAIN_GATE_THRESHOLD
+from retrieval_service import RETRIEVAL_SERVER, RetrievalClient, RemoteEncoder, RemoteStore
+from multilingual_index import load_encoder as load_multilingual_encoder, load_multilingual_store, encode_questions
 
-# Initialize components
-print("Loading components...")
-embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-client = chromadb.PersistentClient(path="./chroma_db")
-collection = client.get_collection(name="tunisian_archaeology")
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
 
-def retrieve_context(question, top_k=5):
-    """Retrieve relevant chunks from ChromaDB"""
-    question_embedding = embedding_model.encode([question])[0]
-    results = collection.query(
-        query_embeddings=[question_embedding.tolist()],
+# Relevance gate: chunks below SIMILARITY_THRESHOLD are dropped, and the
+# question is refused when the kept chunks average below MIN_AVG_SIMILARITY
+SIMILARITY_THRESHOLD = 0.5
+MIN_AVG_SIMILARITY = 0.45
+
+OFF_DOMAIN_ANSWER = "I can only answer questions about Tunisian archaeological sites like Carthage, Dougga, El Jem, Kerkouane, Sbeitla, and Bulla Regia."
+
+# Components are loaded on first use (or by warmup()), once per process even
+# when several threads ask at the same time, so importing this module is cheap
+components_lock = threading.RLock()
+embedding_model = None
+# Chroma collection or in-process numpy matrix, chosen with RAG_VECTOR_STORE
+collection = None
+# BM25 index for hybrid retrieval
+lexical_index = None
+# Site/topic centroids for the off-domain gate (False when unavailable)
+domain_gate = None
+# Milliseconds each component took to load, and the warmup query
+startup_timings = {}
+# Client of the retrieval server when RAG_RETRIEVAL_SERVER is set
+retrieval_client = None
+# Multilingual encoder and its parallel index, for questions app.py searches
+# without translating them (loaded only by those callers, not by warmup())
+multilingual_model = None
+multilingual_store = None
+
+def get_retrieval_client():
+    """Client of the retrieval server at RAG_RETRIEVAL_SERVER, created on first use"""
+    global retrieval_client
+    with components_lock:
+        if retrieval_client is None:
+            retrieval_client = RetrievalClient(RETRIEVAL_SERVER)
+            print(f"✓ Using retrieval server at {RETRIEVAL_SERVER}")
+    return retrieval_client
+
+def timed_load(name, load):
+    """Run load() and record how long it took under startup_timings[name]"""
+    start = time.perf_counter()
+    component = load()
+    startup_timings[name] = (time.perf_counter() - start) * 1000
+    return component
+
+def get_embedding_model():
+    """The cached sentence encoder, loaded on first use"""
+    global embedding_model
+    if embedding_model is None:
+        with components_lock:
+            if embedding_model is None and RETRIEVAL_SERVER:
+                embedding_model = RemoteEncoder(get_retrieval_client())
+            if embedding_model is None:
+                def load():
+                    # The torch backend imports sentence_transformers (and torch) only now
+                    return CachedEncoder(load_encoder_model(EMBEDDING_MODEL), cache_name(EMBEDDING_MODEL))
+                embedding_model = timed_load('embedding_model_ms', load)
+                print(f"✓ Embedding model loaded ({ENCODER_BACKEND}, {startup_timings['embedding_model_ms']:.0f} ms)")
+    return embedding_model
+
+def get_collection():
+    """The vector store, opened on first use"""
+    global collection
+    if collection is None:
+        with components_lock:
+            if collection is None and RETRIEVAL_SERVER:
+                collection = RemoteStore(get_retrieval_client())
+            if collection is None:
+                try:
+                    store = timed_load('vector_store_ms', open_store)
+                except ValueError as e:
+                    raise RuntimeError(f"Vector store unavailable ({e}) - run ingest.py first") from e
+                print(f"✓ Vector store: {VECTOR_STORE} ({store.count()} chunks, {RETRIEVAL_MODE} retrieval, "
+                      f"{startup_timings['vector_store_ms']:.0f} ms)")
+                collection = store
+    return collection
+
+def get_lexical_index():
+    """The BM25 index, loaded (or rebuilt) on first use"""
+    global lexical_index
+    if lexical_index is None:
+        with components_lock:
+            if lexical_index is None:
+                store = get_collection()
+                lexical_index = timed_load('lexical_index_ms', lambda: load_lexical_index(store))
+    return lexical_index
+
+def get_domain_gate():
+    """The site/topic centroid gate, loaded on first use (None if unavailable)"""
+    global domain_gate
+    if domain_gate is None:
+        with components_lock:
+            if domain_gate is None:
+                try:
+                    domain_gate = timed_load('domain_gate_ms', lambda: load_domain_gate(get_collection()))
+                except Exception as e:
+                    # e.g. a retrieval server without centroids
+                    print(f"⚠️  Domain gate disabled: {e}")
+                    domain_gate = False
+    return domain_gate or None
+
+def get_multilingual_model():
+    """The cached multilingual encoder, loaded on first use"""
+    global multilingual_model
+    if multilingual_model is None:
+        with components_lock:
+            if multilingual_model is None:
+                multilingual_model = timed_load('multilingual_model_ms', load_multilingual_encoder)
+                print(f"✓ Multilingual model loaded ({startup_timings['multilingual_model_ms']:.0f} ms)")
+    return multilingual_model
+
+def get_multilingual_store():
+    """The multilingual index of the stored chunks, opened (or rebuilt) on first use"""
+    global multilingual_store
+    if multilingual_store is None:
+        with components_lock:
+            if multilingual_store is None:
+                store = get_collection()
+                if isinstance(store, RemoteStore):
+                    raise RuntimeError("The retrieval server does not serve the multilingual index")
+                model = get_multilingual_model()
+                multilingual_store = timed_load('multilingual_index_ms', lambda: load_multilingual_store(store, model))
+    return multilingual_store
+
+def passes_domain_gate(question_embedding, threshold=DOMAIN_GATE_THRESHOLD):
+    """Whether a question is close enough to some site or topic to be worth retrieving for"""
+    gate = get_domain_gate()
+    if gate is None:
+        return True
+    with span('domain_gate') as sp:
+        accepted, score, nearest = gate.check(question_embedding, threshold)
+        sp.set(accepted=accepted, score=round(score, 3), nearest=nearest)
+    if not accepted:
+        print(f"⚠️  Off-domain question (closest: {nearest}, similarity {score:.3f})")
+    return accepted
+
+def warmup(mode=RETRIEVAL_MODE):
+    """Load every component and run one dummy encode and query
+    
+    Pays model loading, first-call kernel setup and index page-in up front
+    instead of on the first question. Returns startup_timings.
+    """
+    model = get_embedding_model()
+    store = get_collection()
+    # A retrieval server keeps its own BM25 index
+    if mode == 'hybrid' and not isinstance(store, RemoteStore):
+        get_lexical_index()
+    get_domain_gate()
+    
+    def dummy_query():
+        # Straight to the model: a cache hit would skip the warm-up
+        encode = model.model.encode if isinstance(model, CachedEncoder) else model.encode
+        embedding = encode(['Carthage'])
+        search(['Carthage'], embedding, top_k=1, mode=mode)
+    timed_load('warmup_query_ms', dummy_query)
+    
+    print("⏱️  Startup: " + ", ".join(f"{name[:-3]} {ms:.0f} ms" for name, ms in startup_timings.items()))
+    return dict(startup_timings)
+
+def search(questions, question_embeddings, top_k=5, mode=RETRIEVAL_MODE):
+    """Top-k chunks per question: dense only, or fused with BM25 in hybrid mode"""
+    store = get_collection()
+    if isinstance(store, RemoteStore):
+        # The server runs the same search, hybrid included
+        return store.search(questions, question_embeddings, top_k, mode)
+    if mode == 'hybrid':
+        return hybrid_query(store, get_lexical_index(), questions, question_embeddings, top_k)
+    return store.query(
+        query_embeddings=[embedding.tolist() for embedding in question_embeddings],
         n_results=top_k
     )
+
+answer_cache = AnswerCache(similarity_threshold=0.92, ttl_seconds=3600, max_entries=256)
+
+def retrieve_context(question, top_k=5, question_embedding=None):
+    """Retrieve relevant chunks from ChromaDB"""
+    if question_embedding is None:
+        with span('embedding', texts=1):
+            question_embedding = get_embedding_model().encode([question])[0]
+    with span('vector_search', top_k=candidate_count(top_k), mode=RETRIEVAL_MODE) as sp:
+        results = search([question], [question_embedding], candidate_count(top_k))
+        sp.set(chunks=len(results['ids'][0]))
+    return refine(results, question_embedding, top_k)
+
+def retrieve_multilingual(question, top_k=5, question_embedding=None):
+    """Retrieve chunks for a question in any MULTILINGUAL_LANGUAGES language, without translating it"""
+    if question_embedding is None:
+        with span('embedding', texts=1, model='multilingual'):
+            question_embedding = encode_questions(get_multilingual_model(), [question])[0]
+    with span('vector_search', top_k=candidate_count(top_k), mode='dense', index='multilingual') as sp:
+        results = get_multilingual_store().query(query_embeddings=[question_embedding.tolist()],
+                                                 n_results=candidate_count(top_k))
+        sp.set(chunks=len(results['ids'][0]))
+    return refine(results, question_embedding, top_k, get_multilingual_store())
+
+def refine(results, question_embedding, top_k, store=None):
+    """The adaptive cut and MMR re-ranking (where enabled) of one question's results"""
+    results, stats = refine_results(results, question_embedding, top_k, SIMILARITY_THRESHOLD,
+                                    store or get_collection(), get_embedding_model().encode)
+    if 'adaptive_top_k' in stats:
+        cut = stats['adaptive_top_k']
+        print(f"  🎚️  Kept {cut['kept']}/{cut['candidates']} candidates (cut: {cut['cut']})")
+    if 'mmr' in stats:
+        picked = stats['mmr']
+        print(f"  🧩 MMR picked {picked['picked']}/{picked['candidates']} chunks from {picked['files']} files "
+              f"({picked['files_by_relevance']} by relevance alone)")
     return results
 
 def format_context(results):
@@ -24,33 +228,53 @@ def format_context(results):
     distances = results['distances'][0]
     
     formatted_sources = []
-    context_text = ""
+    passages = []
     
-    for i, (doc, meta, dist) in enumerate(zip(documents, metadatas, distances)):
-        similarity = 1 / (1 + dist)
-        print(f"  Source {i+1}: similarity={similarity:.3f}, distance={dist:.3f}")
-        
-        # STRICTER threshold: 0.5 instead of 0.3
-        if similarity > 0.5:
-            context_text += f"\n{doc}\n"
+    with span('context_formatting', chunks_in=len(documents)) as sp:
+        for i, (doc, meta, dist) in enumerate(zip(documents, metadatas, distances)):
+            similarity = 1 / (1 + dist)
+            print(f"  Source {i+1}: similarity={similarity:.3f}, distance={dist:.3f}")
             
-            source_info = {
-                'number': i+1,
-                'title': meta.get('title', 'Unknown'),
-                'source': meta.get('source', 'Unknown'),
-                'site': meta.get('site', ''),
-                'filename': meta.get('filename', ''),
-                'similarity': similarity
-            }
-            formatted_sources.append(source_info)
+            # STRICTER threshold: 0.5 instead of 0.3
+            if similarity > SIMILARITY_THRESHOLD:
+                passages.append((doc, similarity))
+                
+                source_info = {
+                    'number': i+1,
+                    'title': meta.get('title', 'Unknown'),
+                    'source': meta.get('source', 'Unknown'),
+                    'site': meta.get('site', ''),
+                    'filename': meta.get('filename', ''),
+                    'similarity': similarity
+                }
+                formatted_sources.append(source_info)
+        
+        # Best passages first, without chunk overlap or near-duplicates, within the token budget
+        context_text, kept, packing = pack_context(passages, CONTEXT_TOKEN_BUDGET)
+        if packing['dedup_tokens_saved'] or packing['budget_tokens_dropped']:
+            print(f"  ✂️  Context packed: {packing['prompt_tokens']} tokens ({packing['dedup_tokens_saved']} saved by "
+                  f"dedup, {packing['budget_tokens_dropped']} over budget)")
+        # Only cite passages that made it into the prompt
+        formatted_sources = [formatted_sources[i] for i in kept]
+        sp.set(chunks_used=len(formatted_sources), context_chars=len(context_text), **packing)
     
     return context_text, formatted_sources
 
-def generate_answer(question, context):
-    """Generate answer using Llama 3 via Ollama"""
+def passes_relevance_gate(similarities, similarity_threshold=SIMILARITY_THRESHOLD, min_avg_similarity=MIN_AVG_SIMILARITY):
+    """Whether rag_query would answer (rather than refuse) with these retrieval similarities"""
+    kept = [s for s in similarities if s > similarity_threshold]
+    return bool(kept) and sum(kept) / len(kept) >= min_avg_similarity
+
+def build_prompt(question, context, language='en'):
+    """Llama 3 prompt for question over context, answered in English unless language says otherwise"""
+    instruction = ""
+    if language != 'en':
+        # Only multilingual callers pay for importing the translation helpers
+        from translation import answer_language_instruction
+        instruction = answer_language_instruction(language)
     
     # IMPROVED prompt with stricter instructions
-    prompt = f"""You are an expert ONLY on Tunisian archaeological sites. You can ONLY answer questions about Tunisia's ancient heritage sites like Carthage, Dougga, El Jem, Kerkouane, Sbeitla, Bulla Regia, etc.
+    return f"""You are an expert ONLY on Tunisian archaeological sites. You can ONLY answer questions about Tunisia's ancient heritage sites like Carthage, Dougga, El Jem, Kerkouane, Sbeitla, Bulla Regia, etc.
 
 Context from Tunisian archaeology database:
 {context}
@@ -63,67 +287,193 @@ CRITICAL INSTRUCTIONS:
 - NEVER use your general world knowledge about topics outside Tunisian archaeology
 - DO NOT mention source numbers like [Source 1] or [Source 2]
 - If you can answer, write naturally in 2-4 sentences
-
+{instruction}
 Answer:"""
 
-    try:
-        print("  Calling Llama 3...")
-        response = ollama.generate(
-            model='llama3',
-            prompt=prompt,
-            options={
-                'temperature': 0.1,  # Lower temperature for more factual responses
-                'top_p': 0.9,
-                'num_predict': 300,
-            }
-        )
-        return response['response']
-    except Exception as e:
-        return f"Error: {str(e)}\nMake sure Ollama is running."
+def generate_answer(question, context, language='en'):
+    """Generate answer using Llama 3 via Ollama, in English unless language says otherwise"""
+    prompt = build_prompt(question, context, language)
+    with span('llm_generation', prompt_chars=len(prompt)) as sp:
+        try:
+            print("  Calling Llama 3...")
+            response = ollama.generate(
+                model='llama3',
+                prompt=prompt,
+                options={
+                    'temperature': 0.1,  # Lower temperature for more factual responses
+                    'top_p': 0.9,
+                    'num_predict': 300,
+                }
+            )
+            sp.set(prompt_tokens=response.get('prompt_eval_count'), tokens=response.get('eval_count'))
+            return response['response']
+        except Exception as e:
+            sp.set(error=str(e))
+            return f"Error: {str(e)}\nMake sure Ollama is running."
 
 def rag_query(question):
-    """Complete RAG pipeline with validation"""
+    """Complete RAG pipeline with validation, traced stage by stage"""
+    trace = Trace('rag_query', question_chars=len(question))
+    with activate(trace):
+        result = run_rag_query(question)
+    trace.finish()
+    result['trace'] = trace
+    return result
+
+def run_rag_query(question):
+    """The rag_query pipeline, recorded on the active trace"""
     print(f"\n{'='*60}")
     print(f"Question: {question}")
     print(f"{'='*60}\n")
     
+    # Answer cache: exact question first, then a near-identical one
+    start = time.perf_counter()
+    answer_cache.validate(collection_fingerprint(get_collection()))
+    with span('embedding', texts=1):
+        question_embedding = get_embedding_model().encode([question])[0]
+    with span('answer_cache') as sp:
+        cached = answer_cache.get(question, embedding=question_embedding)
+        sp.set(cache_hit=cached is not None)
+    if cached:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"⚡ Cached answer ({cached['cache_match']} match, {elapsed_ms:.1f} ms)")
+        return cached
+    
+    # Clearly off-domain questions are refused without retrieval or generation
+    if not passes_domain_gate(question_embedding):
+        result = {'answer': OFF_DOMAIN_ANSWER, 'sources': [], 'cached': False}
+        answer_cache.put(question, result, embedding=question_embedding)
+        return result
+    
     # Retrieve
     print("🔍 Retrieving relevant information...")
-    results = retrieve_context(question, top_k=5)
+    results = retrieve_context(question, top_k=5, question_embedding=question_embedding)
     
+    return answer_from_results(question, results, question_embedding)
+
+def answer_from_results(question, results, question_embedding):
+    """Format retrieved chunks, apply the relevance checks and generate the answer"""
     # Format context
     context, sources = format_context(results)
     
     # Check if we have high-quality sources
     if not sources:
         print("⚠️  No high-quality sources found (similarity < 0.5)")
-        return {
+        result = {
             'answer': "I don't have information about this topic in my knowledge base. I can only answer questions about Tunisian archaeological sites like Carthage, Dougga, El Jem, Kerkouane, Sbeitla, and Bulla Regia.",
-            'sources': []
+            'sources': [],
+            'cached': False
         }
+        answer_cache.put(question, result, embedding=question_embedding)
+        return result
     
     # Check average similarity
     avg_similarity = sum(s['similarity'] for s in sources) / len(sources)
     print(f"\n✓ Using {len(sources)} sources (avg similarity: {avg_similarity:.3f})\n")
     
-    if avg_similarity < 0.45:
+    if avg_similarity < MIN_AVG_SIMILARITY:
         print("⚠️  Average similarity too low - topic may be off-domain")
-        return {
+        result = {
             'answer': "I couldn't find relevant information about this question in my database about Tunisian archaeological sites. Please ask about sites like Carthage, Dougga, El Jem, or other Tunisian heritage locations.",
-            'sources': []
+            'sources': [],
+            'cached': False
         }
+        answer_cache.put(question, result, embedding=question_embedding)
+        return result
     
     # Generate answer
     print("🤖 Generating answer with Llama 3...")
     answer = generate_answer(question, context)
     
-    return {
+    result = {
         'answer': answer,
-        'sources': sources
+        'sources': sources,
+        'cached': False
     }
+    # Never cache a failed generation
+    if not answer.startswith("Error:"):
+        answer_cache.put(question, result, embedding=question_embedding)
+    return result
+
+def split_query_results(results):
+    """Split a multi-query Chroma result into single-query results"""
+    count = len(results['ids'])
+    return [
+        {key: (values if values is None or key == 'included' else [values[i]]) for key, values in results.items()}
+        for i in range(count)
+    ]
+
+def rag_query_batch(questions, top_k=5, max_concurrency=2):
+    """Answer many questions at once (evaluation, FAQ precomputation)
+    
+    All questions are encoded in one call and searched with one multi-vector
+    Chroma query; generations are sent to Ollama with at most max_concurrency
+    in flight. Each result is the same as rag_query(question) would return.
+    """
+    questions = list(questions)
+    print(f"\n📦 Batch of {len(questions)} questions")
+    
+    trace = Trace('rag_query_batch', questions=len(questions))
+    with activate(trace):
+        results = run_rag_query_batch(questions, top_k, max_concurrency)
+    trace.finish()
+    for result in results:
+        result['trace'] = trace
+    return results
+
+def run_rag_query_batch(questions, top_k, max_concurrency):
+    """The rag_query_batch pipeline, recorded on the active trace"""
+    answer_cache.validate(collection_fingerprint(get_collection()))
+    with span('embedding', texts=len(questions)):
+        question_embeddings = get_embedding_model().encode(questions)
+    
+    results = [None] * len(questions)
+    pending = []
+    for i, (question, question_embedding) in enumerate(zip(questions, question_embeddings)):
+        cached = answer_cache.get(question, embedding=question_embedding)
+        if cached:
+            results[i] = cached
+        elif not passes_domain_gate(question_embedding):
+            results[i] = {'answer': OFF_DOMAIN_ANSWER, 'sources': [], 'cached': False}
+            answer_cache.put(question, results[i], embedding=question_embedding)
+        else:
+            pending.append(i)
+    cached_count = sum(1 for result in results if result is not None and result.get('cached'))
+    print(f"⚡ {cached_count} answers served from cache, {len(questions) - len(pending) - cached_count} refused as off-domain")
+    
+    if pending:
+        print("🔍 Retrieving relevant information...")
+        with span('vector_search', top_k=candidate_count(top_k), queries=len(pending), mode=RETRIEVAL_MODE) as sp:
+            query_results = search(
+                [questions[i] for i in pending],
+                [question_embeddings[i] for i in pending],
+                candidate_count(top_k)
+            )
+            sp.set(chunks=sum(len(ids) for ids in query_results['ids']))
+        
+        print(f"🤖 Generating {len(pending)} answers with Llama 3 (concurrency {max_concurrency})...")
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            futures = [
+                submit(pool, answer_from_results, questions[i],
+                       refine(single, question_embeddings[i], top_k), question_embeddings[i])
+                for i, single in zip(pending, split_query_results(query_results))
+            ]
+            for i, future in zip(pending, futures):
+                results[i] = future.result()
+    
+    return results
+
+def print_trace(trace):
+    """Print per-stage latency of a traced query"""
+    print(f"\n⏱️  {trace.duration_ms:.0f} ms total")
+    for record in trace.to_dict()['spans']:
+        extras = {k: v for k, v in record.items() if k not in ('name', 'parent', 'start_ms', 'duration_ms', 'thread')}
+        print(f"  {record['name']:<20} {record['duration_ms']:>9.1f} ms  {extras}")
 
 # Test function
 if __name__ == "__main__":
+    warmup()
+    
     # Test queries - including off-topic ones
     test_questions = [
         "What is Carthage?",
@@ -145,5 +495,9 @@ if __name__ == "__main__":
         else:
             print("\n⚠️  No sources used")
         
+        stats = get_embedding_model().stats()
+        print(f"\n⚡ Embedding cache: {stats['hits']} hits, {stats['misses']} misses")
+        print_trace(result['trace'])
+        
         print("\n" + "="*60 + "\n")
         input("Press Enter for next question...")
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from domain_gate import DomainGate
+
+# URL of a running retrieval server (e.g. http://127.0.0.1:8765); when set,
+# rag.py and app.py encode and search through it instead of loading their own
+RETRIEVAL_SERVER = os.environ.get('RAG_RETRIEVAL_SERVER')
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Requests arriving within BATCH_WINDOW_MS of the first one share one encode
+# (or one multi-vector search) call of at most MAX_BATCH items
+BATCH_WINDOW_MS = 5
+MAX_BATCH = 64
+
+REQUEST_TIMEOUT = 60
+
+class MicroBatcher:
+    """Collects concurrent requests into one call of process(key, items)
+
+    submit() blocks until the batch holding its items has been processed.
+    process must return one result per item; requests with different keys
+    (e.g. different top_k) are processed separately.
+    """
+
+    def __init__(self, process, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH, name='batcher'):
+        self.process = process
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.items = 0
+        threading.Thread(target=self.run, name=name, daemon=True).start()
+
+    def submit(self, items, key=None):
+        future = Future()
+        self.queue.put((key, list(items), future))
+        return future.result()
+
+    def run(self):
+        while True:
+            pending = [self.queue.get()]
+            size = len(pending[0][1])
+            deadline = time.perf_counter() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(request)
+                size += len(request[1])
+
+            groups = {}
+            for request in pending:
+                groups.setdefault(request[0], []).append(request)
+            for key, requests in groups.items():
+                self.run_batch(key, requests)
+
+    def run_batch(self, key, requests):
+        items = [item for _, request_items, _ in requests for item in request_items]
+        try:
+            results = self.process(key, items)
+        except Exception as e:
+            for _, _, future in requests:
+                future.set_exception(e)
+            return
+        with self.lock:
+            self.requests += len(requests)
+            self.batches += 1
+            self.items += len(items)
+        start = 0
+        for _, request_items, future in requests:
+            future.set_result(results[start:start + len(request_items)])
+            start += len(request_items)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'batches': self.batches,
+                'items': self.items,
+                'avg_batch_size': self.items / self.batches if self.batches else 0.0
+            }
+
+def merge_query_results(singles):
+    """Inverse of rag.split_query_results: one multi-query result in Chroma's shape"""
+    merged = {'ids': [], 'embeddings': None, 'documents': [], 'metadatas': [], 'distances': [],
+              'included': ['metadatas', 'documents', 'distances']}
+    for single in singles:
+        for key in ('ids', 'documents', 'metadatas', 'distances'):
+            merged[key].append(single[key][0])
+    return merged
+
+def to_json(value):
+    # numpy scalars and arrays (distances, embeddings) become plain lists and floats
+    return json.dumps(value, default=lambda o: o.tolist() if hasattr(o, 'tolist') else str(o))
+
+class RetrievalService:
+    """One warm model and index shared by every client, with micro-batching"""
+
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+        import rag
+        # This process does the work itself, even if RAG_RETRIEVAL_SERVER is set
+        rag.RETRIEVAL_SERVER = None
+        self.rag = rag
+        self.startup_timings = rag.warmup()
+        self.encoder = MicroBatcher(self.encode_batch, window_ms, max_batch, 'encode-batcher')
+        self.searcher = MicroBatcher(self.search_batch, window_ms, max_batch, 'search-batcher')
+
+    def encode_batch(self, key, texts):
+        return list(self.rag.get_embedding_model().encode(texts))
+
+    def search_batch(self, key, items):
+        top_k, mode = key
+        questions = [question for question, _ in items]
+        embeddings = np.asarray([embedding for _, embedding in items], dtype=np.float32)
+        return self.rag.split_query_results(self.rag.search(questions, embeddings, top_k, mode))
+
+    def embed(self, texts):
+        return np.asarray(self.encoder.submit(texts), dtype=np.float32)
+
+    def search(self, questions, embeddings=None, top_k=5, mode=None):
+        if embeddings is None:
+            embeddings = self.embed(questions)
+        items = list(zip(questions, np.asarray(embeddings, dtype=np.float32)))
+        return merge_query_results(self.searcher.submit(items, key=(top_k, mode or self.rag.RETRIEVAL_MODE)))
+
+    def info(self):
+        store = self.rag.get_collection()
+        return {
+            'name': store.name,
+            'count': store.count(),
+            'vector_store': self.rag.VECTOR_STORE,
+            'retrieval_mode': self.rag.RETRIEVAL_MODE,
+            'startup_timings': self.startup_timings
+        }
+
+    def domain_gate(self):
+        gate = self.rag.get_domain_gate()
+        if gate is None:
+            return {'available': False}
+        return {'available': True, 'meta': gate.meta, 'labels': gate.labels, 'centroids': gate.centroids}
+
+    def stats(self):
+        return {
+            'embedding_cache': self.rag.get_embedding_model().stats(),
+            'encode_batching': self.encoder.stats(),
+            'search_batching': self.searcher.stats()
+        }
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def reply(self, status, payload):
+            body = to_json(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def handle_request(self, route):
+            try:
+                self.reply(200, route())
+            except Exception as e:
+                self.reply(500, {'error': f"{type(e).__name__}: {e}"})
+
+        def do_GET(self):
+            routes = {'/info': service.info, '/stats': service.stats, '/domain_gate': service.domain_gate}
+            if self.path not in routes:
+                return self.reply(404, {'error': f"unknown path {self.path}"})
+            self.handle_request(routes[self.path])
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if self.path == '/embed':
+                self.handle_request(lambda: {'embeddings': service.embed(request['texts'])})
+            elif self.path == '/search':
+                self.handle_request(lambda: service.search(
+                    request['questions'], request.get('embeddings'), request.get('top_k', 5), request.get('mode')))
+            else:
+                self.reply(404, {'error': f"unknown path {self.path}"})
+
+        def log_message(self, format, *args):
+            # One line per request would drown the batching output
+            pass
+
+    return Handler
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+    service = RetrievalService(window_ms, max_batch)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    print(f"🛰️  Retrieval server listening on http://{host}:{port} "
+          f"(batch window {window_ms} ms, max batch {max_batch})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        stats = service.stats()
+        print(f"\n📊 Encode: {stats['encode_batching']['requests']} requests in "
+              f"{stats['encode_batching']['batches']} batches · Search: {stats['search_batching']['requests']} "
+              f"requests in {stats['search_batching']['batches']} batches")
+    finally:
+        server.server_close()
+
+class RetrievalClient:
+    """JSON-over-HTTP client of a running retrieval server"""
+
+    def __init__(self, url=RETRIEVAL_SERVER, timeout=REQUEST_TIMEOUT):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def call(self, path, payload=None):
+        data = None if payload is None else to_json(payload).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error', str(e))
+            except ValueError:
+                message = str(e)
+            raise RuntimeError(f"Retrieval server error: {message}") from e
+        except urllib.error.URLError as e:
+            raise RuntimeError(f"Retrieval server unreachable at {self.url} ({e.reason}) - "
+                               f"start it with: python retrieval_service.py") from e
+
+    def embed(self, texts):
+        return np.asarray(self.call('/embed', {'texts': list(texts)})['embeddings'], dtype=np.float32)
+
+    def search(self, questions, embeddings=None, top_k=5, mode=None):
+        payload = {'questions': list(questions), 'top_k': top_k, 'mode': mode}
+        if embeddings is not None:
+            payload['embeddings'] = np.asarray(embeddings, dtype=np.float32)
+        return self.call('/search', payload)
+
+    def info(self):
+        return self.call('/info')
+
+    def domain_gate(self):
+        return self.call('/domain_gate')
+
+    def stats(self):
+        return self.call('/stats')
+
+class RemoteEncoder:
+    """Stand-in for CachedEncoder that encodes on the retrieval server"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        vectors = self.client.embed([sentences] if single else sentences)
+        return vectors[0] if single else vectors
+
+    def stats(self):
+        return self.client.stats()['embedding_cache']
+
+class RemoteStore:
+    """Stand-in for the vector store that searches on the retrieval server"""
+
+    def __init__(self, client):
+        self.client = client
+        info = client.info()
+        self.name = info['name']
+        self.backend = info['vector_store']
+        # The server loads its index once, so the count cannot change under it;
+        # answer cache fingerprints ask for it on every question
+        self.chunk_count = info['count']
+        self.gate = None
+
+    def count(self):
+        return self.chunk_count
+
+    @property
+    def domain_gate(self):
+        """The server's site/topic centroids, fetched on first use (load_domain_gate uses them)"""
+        if self.gate is None:
+            reply = self.client.domain_gate()
+            if not reply['available']:
+                raise RuntimeError("the retrieval server has no domain centroids (run ingest.py, then restart it)")
+            self.gate = DomainGate.from_arrays(reply['meta'], reply['labels'],
+                                               np.asarray(reply['centroids'], dtype=np.float32))
+        return self.gate
+
+    def query(self, query_embeddings, n_results=10, include=None):
+        return self.client.search([''] * len(query_embeddings), query_embeddings, n_results, 'dense')
+
+    def search(self, questions, question_embeddings, top_k=5, mode=None):
+        return self.client.search(questions, question_embeddings, top_k, mode)
+
+def connect(url=RETRIEVAL_SERVER):
+    """Encoder and store backed by the retrieval server at url"""
+    client = RetrievalClient(url)
+    return RemoteEncoder(client), RemoteStore(client)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve embedding and search for rag.py and app.py")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--window-ms', type=float, default=BATCH_WINDOW_MS,
+                        help="how long to wait for more requests to batch with the first")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.window_ms, args.max_batch)
@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import struct
+import hashlib
+import argparse
+from datetime import datetime
+import numpy as np
+from vector_store import (NumpyStore, index_arrays, chroma_collection, COLLECTION_NAME,
+                          NUMPY_STORE_DTYPE, NUMPY_STORE_QUANTIZATION, QUANTIZATIONS)
+from lexical_index import LexicalIndex, bm25_arrays
+from domain_gate import DomainGate, centroid_arrays
+
+# Single-file index for deployment, opened with RAG_VECTOR_STORE=snapshot
+SNAPSHOT_PATH = os.environ.get('RAG_SNAPSHOT_PATH', 'tunisian_archaeology.snapshot')
+
+# File layout: MAGIC, the JSON header length as a little-endian uint64, the
+# JSON header, then every section starting on an ALIGN-byte boundary. The
+# header lists each section's offset (from the first section), dtype, shape
+# and BLAKE2b checksum, so arrays are memory-mapped in place
+MAGIC = b'TUNSNAP\x00'
+SNAPSHOT_VERSION = 1
+ALIGN = 64
+
+class SnapshotError(ValueError):
+    """Snapshot missing, corrupt, or written by an incompatible version"""
+
+def checksum(data):
+    return hashlib.blake2b(memoryview(data).cast('B'), digest_size=16).hexdigest()
+
+def json_section(value):
+    return np.frombuffer(json.dumps(value, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+
+def padding(size):
+    return -size % ALIGN
+
+def write_snapshot(path, ids, embeddings, documents, metadatas, name=COLLECTION_NAME,
+                   dtype=NUMPY_STORE_DTYPE, quantization=NUMPY_STORE_QUANTIZATION):
+    """Write vectors, chunk texts, metadata, the BM25 index and domain centroids to one snapshot file"""
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization: {quantization} (expected int8 or binary)")
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+    lexical, vocab, lexical_meta = bm25_arrays(documents)
+    centroids, labels = centroid_arrays(embeddings, metadatas)
+
+    sections = {'records': json_section({'ids': list(ids), 'documents': list(documents),
+                                         'metadatas': list(metadatas)})}
+    sections.update(index_arrays(embeddings, dtype, quantization))
+    sections['lexical_vocab'] = json_section(vocab)
+    sections.update({'lexical_' + key: array for key, array in lexical.items()})
+    sections['domain_centroids'] = centroids
+    sections['domain_labels'] = json_section(labels)
+
+    layout = {}
+    offset = 0
+    for key, array in sections.items():
+        array = np.ascontiguousarray(array)
+        sections[key] = array
+        layout[key] = {
+            'offset': offset,
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'checksum': checksum(array)
+        }
+        offset += array.nbytes + padding(array.nbytes)
+
+    header = json.dumps({
+        'version': SNAPSHOT_VERSION,
+        'name': name,
+        'count': len(ids),
+        'dim': int(embeddings.shape[1]) if len(ids) else 0,
+        'dtype': str(np.dtype(dtype)),
+        'quantization': quantization,
+        'lexical': lexical_meta,
+        'created': datetime.now().isoformat(),
+        'sections': layout
+    }).encode('utf-8')
+    prefix = MAGIC + struct.pack('<Q', len(header)) + header
+    prefix += b'\x00' * padding(len(prefix))
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(prefix)
+        for array in sections.values():
+            f.write(array.tobytes())
+            f.write(b'\x00' * padding(array.nbytes))
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+def read_header(path):
+    """The snapshot's header and the file offset of its first section"""
+    try:
+        with open(path, 'rb') as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise SnapshotError(f"{path} is not a snapshot file")
+            (length,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(length))
+    except OSError as e:
+        raise SnapshotError(f"Cannot read snapshot {path}: {e}") from e
+    except (struct.error, ValueError) as e:
+        raise SnapshotError(f"Corrupt snapshot header in {path}: {e}") from e
+    if header.get('version') != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Snapshot version {header.get('version')} is not supported "
+                            f"(expected {SNAPSHOT_VERSION}) - re-export it")
+    start = len(MAGIC) + 8 + length
+    return header, start + padding(start)
+
+def map_sections(path, header, start):
+    """Every section memory-mapped read-only, by name"""
+    size = os.path.getsize(path)
+    arrays = {}
+    for key, section in header['sections'].items():
+        dtype = np.dtype(section['dtype'])
+        shape = tuple(section['shape'])
+        nbytes = dtype.itemsize * int(np.prod(shape))
+        offset = start + section['offset']
+        if offset + nbytes > size:
+            raise SnapshotError(f"Snapshot {path} is truncated (section {key})")
+        if nbytes == 0:
+            arrays[key] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[key] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+    return arrays
+
+def verify_sections(header, arrays):
+    for key, array in arrays.items():
+        if checksum(array) != header['sections'][key]['checksum']:
+            raise SnapshotError(f"Snapshot checksum mismatch in section {key}")
+
+def load_snapshot(path=SNAPSHOT_PATH, verify=True):
+    """Open a snapshot as a NumpyStore with its BM25 index and domain centroids attached
+
+    Vector sections stay memory-mapped; only the chunk records and the
+    vocabulary are parsed. verify checks every section's checksum.
+    """
+    header, start = read_header(path)
+    arrays = map_sections(path, header, start)
+    if verify:
+        verify_sections(header, arrays)
+
+    def parse(key):
+        return json.loads(arrays[key].tobytes().decode('utf-8'))
+
+    records = parse('records')
+    meta = {key: header[key] for key in ('name', 'count', 'dim', 'dtype', 'quantization')}
+    meta['source'] = {'snapshot': os.path.abspath(path), 'created': header['created']}
+    store = NumpyStore.from_arrays(meta, arrays['embeddings'], arrays['norms'], records,
+                                   codes=arrays.get('codes'), scales=arrays.get('scales'))
+    lexical = {key[len('lexical_'):]: array for key, array in arrays.items()
+               if key.startswith('lexical_') and key != 'lexical_vocab'}
+    store.lexical_index = LexicalIndex.from_arrays(header['lexical'], parse('lexical_vocab'), records['ids'], lexical)
+    labels = parse('domain_labels')
+    store.domain_gate = DomainGate.from_arrays({'centroids': len(labels), 'chunks': store.count()},
+                                               labels, arrays['domain_centroids'])
+    return store
+
+def export_snapshot(collection, path=SNAPSHOT_PATH, dtype=NUMPY_STORE_DTYPE, quantization=NUMPY_STORE_QUANTIZATION):
+    """Write every chunk of a Chroma collection (or NumpyStore) to a snapshot"""
+    data = collection.get(include=['embeddings', 'documents', 'metadatas'])
+    size = write_snapshot(path, data['ids'], data['embeddings'], data['documents'], data['metadatas'],
+                          name=collection.name, dtype=dtype, quantization=quantization)
+    print(f"✓ Snapshot exported: {len(data['ids'])} chunks, {size / 1e6:.1f} MB -> {path}")
+    return size
+
+def import_snapshot(path=SNAPSHOT_PATH, batch_size=5000):
+    """Restore a Chroma collection from a snapshot (e.g. to resume ingesting)"""
+    import chromadb
+    from vector_store import CHROMA_PATH
+    store = load_snapshot(path)
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    collection = client.get_or_create_collection(name=store.name)
+    for i in range(0, store.count(), batch_size):
+        collection.upsert(
+            ids=store.ids[i:i + batch_size],
+            embeddings=np.asarray(store.embeddings[i:i + batch_size], dtype=np.float32).tolist(),
+            documents=store.documents[i:i + batch_size],
+            metadatas=store.metadatas[i:i + batch_size]
+        )
+    print(f"✓ Imported {store.count()} chunks into ChromaDB collection {store.name}")
+    return collection
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export, verify or import a single-file index snapshot")
+    parser.add_argument('command', choices=['export', 'verify', 'import'])
+    parser.add_argument('--path', default=SNAPSHOT_PATH)
+    parser.add_argument('--dtype', default=NUMPY_STORE_DTYPE, choices=['float32', 'float16'])
+    parser.add_argument('--quantization', default=NUMPY_STORE_QUANTIZATION, choices=['int8', 'binary'])
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'export':
+            export_snapshot(chroma_collection(), args.path, args.dtype, args.quantization)
+        elif args.command == 'verify':
+            start = time.perf_counter()
+            store = load_snapshot(args.path)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"✓ {args.path}: {store.count()} chunks, {store.meta['dtype']}, "
+                  f"index {store.quantization or 'exact'}, checksums OK ({elapsed_ms:.1f} ms)")
+        else:
+            import_snapshot(args.path)
+    except SnapshotError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
@@ -0,0 +1,164 @@
+import re
+import time
+from collections import deque
+from tracing import submit
+
+# A sentence ends at . ! or ? followed by whitespace, or at a line break
+# (list items and headings often have no final punctuation)
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\s*\n\s*')
+
+class StreamError(str):
+    """The error text a failed stream yields in place of answer text, never translated"""
+
+class StreamStats:
+    """Time-to-first-token and throughput of one streamed generation"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.end = None
+        self.chunks = 0
+        self.eval_count = None
+        self.eval_duration_ns = None
+        self.prompt_tokens = None
+        self.error = None
+
+    @property
+    def ttft(self):
+        """Seconds until the model produced its first token"""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.start
+
+    @property
+    def tokens(self):
+        return self.eval_count if self.eval_count is not None else self.chunks
+
+    @property
+    def tokens_per_second(self):
+        # Prefer Ollama's own decode timing, which excludes prompt evaluation
+        if self.eval_count and self.eval_duration_ns:
+            return self.eval_count / (self.eval_duration_ns / 1e9)
+        if self.first_token_at is None or self.end is None or self.end <= self.first_token_at:
+            return None
+        return self.chunks / (self.end - self.first_token_at)
+
+    def summary(self):
+        ttft = self.ttft
+        tps = self.tokens_per_second
+        parts = []
+        if ttft is not None:
+            parts.append(f"first token {ttft * 1000:.0f} ms")
+        if tps is not None:
+            parts.append(f"{tps:.1f} tokens/s")
+        parts.append(f"{self.tokens} tokens")
+        return " · ".join(parts)
+
+def stream_tokens(chunks, stats):
+    """Yield the text of each Ollama stream chunk, recording timings in stats"""
+    try:
+        for chunk in chunks:
+            text = chunk.get('response', '')
+            if text:
+                if stats.first_token_at is None:
+                    stats.first_token_at = time.perf_counter()
+                stats.chunks += 1
+                yield text
+            if chunk.get('done'):
+                stats.eval_count = chunk.get('eval_count')
+                stats.prompt_tokens = chunk.get('prompt_eval_count')
+                stats.eval_duration_ns = chunk.get('eval_duration')
+    except Exception as e:
+        stats.error = str(e)
+        yield StreamError(f"Error: {str(e)}")
+    finally:
+        stats.end = time.perf_counter()
+
+def split_sentences(pieces):
+    """Regroup streamed text pieces into (sentence, separator) pairs
+
+    The separator is the whitespace that followed the sentence (a space, a
+    line break, a blank line), so joining every sentence + separator gives
+    back the text. A StreamError piece ends the current sentence and is
+    passed on as its own pair.
+    """
+    buffer = ""
+    for piece in pieces:
+        if isinstance(piece, StreamError):
+            if buffer:
+                yield trailing_space(buffer)
+            buffer = ""
+            yield piece, ""
+            continue
+        buffer += piece
+        start = 0
+        # Whitespace that goes on in the next piece comes out as an empty
+        # sentence with its own separator
+        for match in SENTENCE_END.finditer(buffer):
+            yield buffer[start:match.start()], match.group()
+            start = match.end()
+        buffer = buffer[start:]
+    if buffer:
+        yield trailing_space(buffer)
+
+def trailing_space(text):
+    stripped = text.rstrip()
+    return stripped, text[len(stripped):]
+
+def translate_sentences(pieces, translate, executor=None):
+    """Translate a token stream one sentence at a time as sentences complete
+    
+    With an executor each sentence is translated in the background while
+    later tokens are still being generated; output order is preserved.
+    Separators (spaces, line breaks) are kept as generated, and stream
+    errors and blank text are passed through untranslated.
+    """
+    sentences = split_sentences(pieces)
+    if executor is None:
+        translated = ((keep_or(translate, sentence), separator) for sentence, separator in sentences)
+    else:
+        translated = _translate_in_background(sentences, translate, executor)
+    
+    for text, separator in translated:
+        yield text + separator
+
+def keep_or(translate, sentence):
+    if isinstance(sentence, StreamError) or not sentence.strip():
+        return sentence
+    return translate(sentence)
+
+def _translate_in_background(sentences, translate, executor):
+    pending = deque()
+    for sentence, separator in sentences:
+        pending.append((submit(executor, keep_or, translate, sentence), separator))
+        # Hand over finished translations without waiting on the rest
+        while pending and pending[0][0].done():
+            future, separator = pending.popleft()
+            yield future.result(), separator
+    while pending:
+        future, separator = pending.popleft()
+        yield future.result(), separator
+
+def intercept_refusal(pieces, replacement):
+    """Pass a token stream through unless its first sentence is a refusal
+    
+    replacement(text) returns the text to show instead of a refusal, or None
+    for a real answer. Only the first sentence is held back to decide.
+    """
+    pieces = iter(pieces)
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        if SENTENCE_END.search(buffer):
+            break
+    
+    substitute = replacement(buffer)
+    if substitute is None:
+        if buffer:
+            yield buffer
+        yield from pieces
+        return
+    # Let the generation finish so its stats are recorded, but show the substitute
+    for _ in pieces:
+        pass
+    yield substitute
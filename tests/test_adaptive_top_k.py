@@ -0,0 +1,42 @@
+from adaptive_top_k import cut_results, score_cutoff, fetch_k, CANDIDATE_POOL, MAX_K
+
+def results_for(similarities, words=300):
+    """One question's results in Chroma's shape, every chunk words long"""
+    count = len(similarities)
+    return {
+        'ids': [[f"c{i}" for i in range(count)]],
+        'documents': [[' '.join(['word'] * words)] * count],
+        'metadatas': [[{'filename': f"f{i}.txt"} for i in range(count)]],
+        'distances': [[1 / s - 1 for s in similarities]],
+        'embeddings': None,
+        'included': ['metadatas', 'documents', 'distances']
+    }
+
+def test_fetch_k_uses_the_pool_only_for_the_adaptive_policy():
+    assert fetch_k(5, 'fixed') == 5
+    assert fetch_k(5, 'adaptive') == CANDIDATE_POOL
+
+def test_cut_at_the_first_clear_gap():
+    similarities = [0.90, 0.89, 0.88, 0.70, 0.69, 0.68, 0.67, 0.66]
+    trimmed, stats = cut_results(results_for(similarities), 0.5)
+    assert trimmed['ids'] == [['c0', 'c1', 'c2']]
+    assert stats['cut'] == 'gap'
+    assert trimmed['included'] == ['metadatas', 'documents', 'distances']
+
+def test_flat_scores_keep_max_k_regardless_of_chunk_tokens():
+    # 20 chunks of 300 words are far over the context budget; packing trims them later
+    similarities = [0.9 - 0.005 * i for i in range(20)]
+    trimmed, stats = cut_results(results_for(similarities), 0.5)
+    assert stats['kept'] == MAX_K
+    assert stats['cut'] == 'max_k'
+    assert trimmed['ids'][0] == [f"c{i}" for i in range(MAX_K)]
+
+def test_nothing_relevant_keeps_the_best_few_for_the_relevance_checks():
+    cutoff, reason = score_cutoff([0.3, 0.2, 0.1], 0.5)
+    assert reason == 'below_threshold'
+    assert cutoff == 0.2
+
+def test_few_above_threshold_keeps_them_all():
+    trimmed, stats = cut_results(results_for([0.8, 0.6, 0.3, 0.2]), 0.5)
+    assert trimmed['ids'] == [['c0', 'c1']]
+    assert stats['cut'] == 'threshold'
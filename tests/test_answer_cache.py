@@ -0,0 +1,36 @@
+import numpy as np
+from answer_cache import AnswerCache, normalize_question
+
+RESULT = {'answer': 'El Jem was built around 238 AD.', 'sources': [{'title': 'El Jem'}], 'cached': False}
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = AnswerCache()
+    cache.put("When was El Jem built?", RESULT)
+    hit = cache.get("  when was el jem BUILT ")
+    assert hit['answer'] == RESULT['answer']
+    assert hit['cached'] and hit['cache_match'] == 'exact'
+    assert normalize_question("El-Jem?") == 'el jem'
+
+def test_semantic_hit_needs_similar_embedding_and_same_language():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put("When was El Jem built?", RESULT, 'fr', embedding=np.array([1.0, 0.0]))
+    hit = cache.get("El Jem construction date", 'fr', embedding=np.array([0.99, 0.05]))
+    assert hit['cache_match'] == 'semantic' and hit['cache_similarity'] > 0.9
+    assert cache.get("El Jem construction date", 'de', embedding=np.array([0.99, 0.05])) is None
+    assert cache.get("Who was Hannibal?", 'fr', embedding=np.array([0.0, 1.0])) is None
+
+def test_answer_mode_is_part_of_the_key():
+    cache = AnswerCache()
+    embedding = np.array([1.0, 0.0])
+    cache.put("Quand El Jem a-t-il été construit ?", RESULT, 'fr', embedding=embedding, answer_mode='direct')
+    assert cache.get("Quand El Jem a-t-il été construit ?", 'fr', embedding=embedding) is None
+    assert cache.get("Quand El Jem a-t-il été construit ?", 'fr', answer_mode='direct') is not None
+
+def test_validate_clears_on_new_fingerprint_and_lru_eviction():
+    cache = AnswerCache(max_entries=2)
+    cache.validate(('tunisian_archaeology', 10, 1))
+    for question in ('a', 'b', 'c'):
+        cache.put(question, RESULT)
+    assert cache.get('a') is None and cache.get('c') is not None
+    cache.validate(('tunisian_archaeology', 12, 2))
+    assert cache.get('c') is None
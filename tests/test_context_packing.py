@@ -0,0 +1,56 @@
+from context_packing import pack_context, count_tokens, truncate_to_tokens
+
+DOUGGA = ("Dougga was a Numidian and then Roman town. Its capitol, theatre and temples survive on a hill "
+          "above the Khalled valley. The Libyco-Punic mausoleum is a rare Numidian monument.")
+EL_JEM = ("The amphitheatre of El Jem was built around 238 AD. It could seat thirty five thousand spectators. "
+          "It is one of the best preserved Roman stone ruins in the world.")
+KERKOUANE = ("Kerkouane is a Punic city on Cap Bon that was abandoned after the First Punic War. Its houses "
+             "keep their floors, baths and streets, so it shows a Punic town plan no later city covered.")
+
+def test_count_tokens_counts_words_and_punctuation():
+    assert count_tokens("El Jem, Tunisia.") == 5
+
+def test_best_passage_first_and_all_kept_under_budget():
+    context, kept, stats = pack_context([(DOUGGA, 0.6), (EL_JEM, 0.8)])
+    assert context.index("amphitheatre") < context.index("Dougga")
+    assert kept == [0, 1]
+    assert stats['dedup_tokens_saved'] == stats['budget_tokens_dropped'] == 0
+    assert stats['prompt_tokens'] == stats['prompt_tokens_raw']
+
+def test_near_duplicate_is_dropped_and_counted_as_dedup():
+    copy = DOUGGA.replace("Khalled", "Oued Khalled")
+    context, kept, stats = pack_context([(DOUGGA, 0.8), (copy, 0.7), (EL_JEM, 0.6)])
+    assert kept == [0, 2]
+    assert stats['duplicates_dropped'] == 1
+    assert stats['dedup_tokens_saved'] == count_tokens(copy)
+    assert stats['budget_tokens_dropped'] == 0
+
+def test_chunk_overlap_is_trimmed():
+    overlapping = "It is one of the best preserved Roman stone ruins in the world. " + DOUGGA
+    context, kept, stats = pack_context([(EL_JEM, 0.8), (overlapping, 0.7)])
+    assert kept == [0, 1]
+    assert context.count("best preserved") == 1
+    assert stats['overlap_words_trimmed'] == 13
+    assert stats['dedup_tokens_saved'] == count_tokens(overlapping) - count_tokens(DOUGGA)
+
+def test_budget_savings_are_reported_apart_from_dedup():
+    budget = count_tokens(EL_JEM) + 5
+    context, kept, stats = pack_context([(EL_JEM, 0.8), (DOUGGA, 0.7), (KERKOUANE, 0.6)], token_budget=budget)
+    assert kept == [0]
+    assert stats['passages_over_budget'] == 2
+    assert stats['dedup_tokens_saved'] == 0
+    assert stats['budget_tokens_dropped'] == count_tokens(DOUGGA) + count_tokens(KERKOUANE)
+    assert stats['prompt_tokens'] + stats['budget_tokens_dropped'] == stats['prompt_tokens_raw']
+
+def test_last_passage_is_cut_at_a_sentence():
+    budget = count_tokens(EL_JEM) + 70
+    long_passage = ' '.join([KERKOUANE] * 3)
+    context, kept, stats = pack_context([(EL_JEM, 0.8), (long_passage, 0.7)], token_budget=budget)
+    assert kept == [0, 1] and stats['passages_truncated'] == 1
+    assert stats['prompt_tokens'] <= budget
+    assert context.rstrip().endswith(('.', '!', '?'))
+    assert stats['prompt_tokens'] + stats['budget_tokens_dropped'] + stats['dedup_tokens_saved'] == stats['prompt_tokens_raw']
+
+def test_truncate_to_tokens_keeps_whole_sentences():
+    text, used = truncate_to_tokens("One two three. Four five six.", 5)
+    assert text == "One two three." and used == 4
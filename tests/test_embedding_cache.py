@@ -0,0 +1,76 @@
+import numpy as np
+from embedding_cache import EmbeddingCache, CachedEncoder, cache_key
+
+class CountingModel:
+    """Deterministic stand-in for SentenceTransformer that counts encoded texts"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.array([[len(text), text.count('a'), 1.0, 0.0] for text in texts], dtype=np.float32)
+
+def test_round_trip_and_normalized_keys(tmp_path):
+    model = CountingModel()
+    encoder = CachedEncoder(model, 'test-model', cache_dir=str(tmp_path), max_entries=8)
+    first = encoder.encode(['Carthage', 'El Jem'])
+    again = encoder.encode(['  Carthage ', 'El   Jem'])
+    assert np.array_equal(first, again)
+    assert model.encoded == ['Carthage', 'El Jem']
+    assert encoder.stats()['hits'] == 2
+
+def test_persists_across_instances(tmp_path):
+    CachedEncoder(CountingModel(), 'test-model', cache_dir=str(tmp_path)).encode(['Dougga'])
+    model = CountingModel()
+    vector = CachedEncoder(model, 'test-model', cache_dir=str(tmp_path)).encode('Dougga')
+    assert model.encoded == []
+    assert vector[0] == len('Dougga')
+
+def test_lru_eviction(tmp_path):
+    cache = EmbeddingCache('test-model', 2, cache_dir=str(tmp_path), max_entries=2)
+    keys = [cache_key('test-model', text) for text in ('a', 'b', 'c')]
+    cache.put_many(keys[:2], np.eye(2, dtype=np.float32))
+    cache.get_many([keys[0]])
+    cache.put_many([keys[2]], np.ones((1, 2), dtype=np.float32))
+    _, missing = cache.get_many(keys)
+    assert missing == [1]
+
+def test_slot_reused_by_another_process_is_a_miss(tmp_path):
+    # Two instances on the same files behave like two processes with their own slot maps
+    first = EmbeddingCache('test-model', 2, cache_dir=str(tmp_path), max_entries=1)
+    second = EmbeddingCache('test-model', 2, cache_dir=str(tmp_path), max_entries=1)
+    mine, theirs = cache_key('test-model', 'mine'), cache_key('test-model', 'theirs')
+    first.put_many([mine], np.array([[1.0, 0.0]], dtype=np.float32))
+    second.put_many([theirs], np.array([[0.0, 1.0]], dtype=np.float32))
+
+    vectors, missing = first.get_many([mine])
+    assert missing == [0]
+    assert not vectors.any()
+    vectors, missing = second.get_many([theirs])
+    assert missing == [] and vectors[0].tolist() == [0.0, 1.0]
+
+def test_writes_see_other_processes_entries(tmp_path):
+    first = EmbeddingCache('test-model', 2, cache_dir=str(tmp_path), max_entries=4)
+    second = EmbeddingCache('test-model', 2, cache_dir=str(tmp_path), max_entries=4)
+    key = cache_key('test-model', 'shared')
+    first.put_many([key], np.array([[1.0, 2.0]], dtype=np.float32))
+    second.put_many([key], np.array([[1.0, 2.0]], dtype=np.float32))
+    # The second write found the key on disk instead of storing a duplicate
+    assert int((second.keys == key).sum()) == 1
+
+def test_hits_update_ticks_under_the_exclusive_lock(tmp_path, monkeypatch):
+    cache = EmbeddingCache('test-model', 2, cache_dir=str(tmp_path), max_entries=4)
+    keys = [cache_key('test-model', text) for text in ('a', 'b')]
+    cache.put_many(keys[:1], np.ones((1, 2), dtype=np.float32))
+    locks = []
+    file_lock = cache._file_lock
+    monkeypatch.setattr(cache, '_file_lock', lambda exclusive: locks.append(exclusive) or file_lock(exclusive))
+    before = int(cache.ticks[cache.slots[keys[0]]])
+    cache.get_many(keys[1:])
+    cache.get_many(keys)
+    assert locks == [False, True]
+    assert int(cache.ticks[cache.slots[keys[0]]]) > before
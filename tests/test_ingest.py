@@ -0,0 +1,81 @@
+import re
+import pytest
+import ingest
+import parsing
+from minhash import MinHashIndex
+
+PARAGRAPH = ("The amphitheatre of El Jem was built around 238 AD in Thysdrus and could seat thirty five "
+             "thousand spectators. It is one of the best preserved Roman stone ruins in the world and was "
+             "listed as a World Heritage Site in 1979. Its arena hosted gladiator fights and wild animal hunts.")
+OTHER = ("Dougga was a Numidian and then Roman town whose capitol, theatre and temples survive on a hill "
+         "above the Khalled valley. The Libyco-Punic mausoleum is one of the rare monuments of Numidian "
+         "architecture and its bilingual inscription helped decipher the Libyan script.")
+
+class WordTokenizer:
+    """Whitespace tokenizer with the offset mapping chunk_text() reads"""
+
+    def __call__(self, sentences, add_special_tokens=False, return_offsets_mapping=True):
+        return {'offset_mapping': [[m.span() for m in re.finditer(r'\S+', s)] for s in sentences]}
+
+@pytest.fixture
+def docs(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, 'DOCS_FOLDER', str(tmp_path))
+    monkeypatch.setattr(ingest, 'init_worker', lambda model_name: None)
+    monkeypatch.setattr(parsing, 'tokenizer', WordTokenizer())
+    return tmp_path
+
+def write(folder, name, site, text):
+    (folder / name).write_text(f"Title: {name}\nSite: {site}\n\n{text}\n", encoding='utf-8')
+
+def ingest_once(manifest, index):
+    state = {}
+    embedded = list(ingest.process_documents(manifest, index, 1, state))
+    return embedded, state
+
+def test_unchanged_files_are_not_re_embedded(docs):
+    write(docs, 'a_en.txt', 'El Jem', PARAGRAPH)
+    write(docs, 'b_en.txt', 'Dougga', OTHER)
+    index = MinHashIndex()
+    embedded, state = ingest_once(ingest.empty_manifest(), index)
+    assert sorted(meta['filename'] for _, meta, _ in embedded) == ['a_en.txt', 'b_en.txt']
+
+    embedded, again = ingest_once(state['manifest'], index)
+    assert embedded == [] and again['stale_ids'] == []
+
+    write(docs, 'b_en.txt', 'Dougga', OTHER + " The site was inscribed in 1997.")
+    embedded, changed = ingest_once(state['manifest'], index)
+    assert [meta['filename'] for _, meta, _ in embedded] == ['b_en.txt']
+    assert changed['stale_ids'] == state['manifest']['files']['b_en.txt']['chunks']
+
+def test_near_duplicate_points_at_canonical_chunk(docs):
+    write(docs, 'a_en.txt', 'El Jem', PARAGRAPH)
+    write(docs, 'b_en.txt', 'El Jem', PARAGRAPH + " Today it hosts a music festival.")
+    embedded, state = ingest_once(ingest.empty_manifest(), MinHashIndex())
+    files = state['manifest']['files']
+    assert [meta['filename'] for _, meta, _ in embedded] == ['a_en.txt']
+    assert files['b_en.txt']['chunks'] == []
+    assert files['b_en.txt']['duplicates'] == files['a_en.txt']['chunks']
+
+def test_changed_canonical_file_re_chunks_its_duplicates(docs):
+    write(docs, 'a_en.txt', 'El Jem', PARAGRAPH)
+    write(docs, 'b_en.txt', 'El Jem', PARAGRAPH + " Today it hosts a music festival.")
+    index = MinHashIndex()
+    _, state = ingest_once(ingest.empty_manifest(), index)
+    canonical = state['manifest']['files']['a_en.txt']['chunks']
+
+    # a_en.txt no longer holds the text b_en.txt's duplicate pointed at
+    write(docs, 'a_en.txt', 'Dougga', OTHER)
+    embedded, updated = ingest_once(state['manifest'], index)
+    files = updated['manifest']['files']
+    assert sorted(meta['filename'] for _, meta, _ in embedded) == ['a_en.txt', 'b_en.txt']
+    assert 'duplicates' not in files['b_en.txt'] and files['b_en.txt']['chunks']
+    assert updated['stale_ids'] == canonical
+    assert not set(canonical) & ingest.manifest_ids(files)
+
+def test_orphaned_files():
+    files = {
+        'a_en.txt': {'sha256': 'x', 'chunks': ['c2']},
+        'b_en.txt': {'sha256': 'y', 'chunks': [], 'duplicates': ['c1']},
+        'c_en.txt': {'sha256': 'z', 'chunks': [], 'duplicates': ['c2']}
+    }
+    assert ingest.orphaned_files(files) == ['b_en.txt']
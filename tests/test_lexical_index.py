@@ -0,0 +1,81 @@
+import numpy as np
+import lexical_index
+from lexical_index import LexicalIndex, tokenize, reciprocal_rank_fusion, hybrid_query
+from vector_store import NumpyStore
+
+DOCUMENTS = [
+    "The amphitheatre of El Jem seated thirty five thousand spectators.",
+    "Dougga keeps a Roman capitol, a theatre and the Libyco-Punic mausoleum.",
+    "Kerkouane is a Punic town on Cap Bon with tiled floors and baths.",
+    "The Bardo museum in Tunis holds Roman mosaics from across Tunisia."
+]
+IDS = ['el_jem', 'dougga', 'kerkouane', 'bardo']
+
+def test_tokenize_folds_accents_and_drops_stopwords():
+    assert tokenize("Où est le Musée du Bardo?") == ['ou', 'est', 'le', 'musee', 'du', 'bardo']
+    assert tokenize("What is the theatre of Dougga") == ['theatre', 'dougga']
+
+def test_search_matches_brute_force_bm25(tmp_path):
+    index = LexicalIndex.build(IDS, DOCUMENTS, str(tmp_path))
+    k1, b = index.meta['k1'], index.meta['b']
+    docs = [tokenize(d) for d in DOCUMENTS]
+    avgdl = sum(len(d) for d in docs) / len(docs)
+    query = "Roman theatre and Punic mausoleum"
+    expected = []
+    for doc in docs:
+        score = 0.0
+        for term in tokenize(query):
+            df = sum(term in d for d in docs)
+            tf = doc.count(term)
+            if tf:
+                idf = np.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+        expected.append(score)
+    assert np.allclose(index.scores(query), expected, atol=1e-5)
+
+    ids, scores = index.search(query, top_k=2)
+    assert ids[0] == 'dougga'
+    assert index.search(query, top_k=5)[0][1:] in (['kerkouane', 'bardo'], ['bardo', 'kerkouane'])
+    assert scores == sorted(scores, reverse=True)
+
+def test_search_returns_only_matching_chunks_and_survives_reload(tmp_path):
+    LexicalIndex.build(IDS, DOCUMENTS, str(tmp_path))
+    index = LexicalIndex(str(tmp_path))
+    assert index.search("Kerkouane", top_k=5)[0] == ['kerkouane']
+    assert index.search("Carthage", top_k=5)[0] == []
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['b', 'd']])
+    assert fused[0] == 'b'
+    assert set(fused) == {'a', 'b', 'c', 'd'}
+
+def test_hybrid_query_brings_in_lexical_only_chunks_with_dense_distances(tmp_path):
+    embeddings = np.eye(4, dtype=np.float32)
+    store = NumpyStore.build(IDS, embeddings, DOCUMENTS, [{'filename': f"{cid}.txt"} for cid in IDS],
+                             path=str(tmp_path / 'store'))
+    index = LexicalIndex.build(IDS, DOCUMENTS, str(tmp_path / 'lexical'))
+    # The query vector is the El Jem chunk, but the words only match Kerkouane
+    results = hybrid_query(store, index, ["Kerkouane tiled floors"], embeddings[[0]], n_results=2)
+    assert set(results['ids'][0]) == {'el_jem', 'kerkouane'}
+    distances = dict(zip(results['ids'][0], results['distances'][0]))
+    assert distances['el_jem'] == 0.0
+    assert np.isclose(distances['kerkouane'], 2.0)
+    assert results['documents'][0][results['ids'][0].index('kerkouane')] == DOCUMENTS[2]
+
+def test_hybrid_query_batch_fetches_vectors_of_another_querys_dense_hits(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical_index, 'MIN_CANDIDATES', 2)
+    monkeypatch.setattr(lexical_index, 'CANDIDATE_FACTOR', 1)
+    embeddings = np.eye(4, dtype=np.float32)
+    store = NumpyStore.build(IDS, embeddings, DOCUMENTS, [{'filename': f"{cid}.txt"} for cid in IDS],
+                             path=str(tmp_path / 'store'))
+    index = LexicalIndex.build(IDS, DOCUMENTS, str(tmp_path / 'lexical'))
+    # Kerkouane is a dense hit of the first query only, and a BM25-only hit of the second
+    queries = ["Carthage", "Kerkouane tiled floors"]
+    vectors = np.array([[1, 0, 0.5, 0], [0, 1, 0, 0.5]], dtype=np.float32)
+    batch = hybrid_query(store, index, queries, vectors, n_results=2)
+    assert 'kerkouane' in batch['ids'][1]
+    for i, question in enumerate(queries):
+        single = hybrid_query(store, index, [question], vectors[[i]], n_results=2)
+        assert batch['ids'][i] == single['ids'][0]
+        expected = ((embeddings[[IDS.index(cid) for cid in batch['ids'][i]]] - vectors[i]) ** 2).sum(axis=1)
+        assert np.allclose(batch['distances'][i], expected)
@@ -0,0 +1,53 @@
+import os
+import pytest
+from minhash import MinHashIndex, signature, shingle_hashes
+
+DOUGGA = ("Dougga was a Numidian and then Roman town in northern Tunisia. Its capitol, theatre and temples "
+          "survive on a hill above the Khalled valley, and the Libyco-Punic mausoleum is a rare Numidian "
+          "monument that was taken apart in 1842 and rebuilt in 1910 by French archaeologists.")
+EL_JEM = ("The amphitheatre of El Jem was built around 238 AD in the Roman town of Thysdrus. It could seat "
+          "thirty five thousand spectators and is one of the best preserved Roman stone ruins in the world.")
+
+def test_identical_text_has_identical_signature():
+    assert (signature(DOUGGA) == signature(DOUGGA)).all()
+
+def test_signature_agreement_estimates_jaccard_similarity():
+    edited = DOUGGA.replace("1910", "1911")
+    first, second = set(shingle_hashes(DOUGGA).tolist()), set(shingle_hashes(edited).tolist())
+    jaccard = len(first & second) / len(first | second)
+    estimate = (signature(DOUGGA) == signature(edited)).mean()
+    assert 0.6 < jaccard < 0.9
+    assert abs(estimate - jaccard) < 0.15
+
+def test_near_duplicate_is_found_and_unrelated_text_is_not():
+    index = MinHashIndex()
+    index.add('dougga', signature(DOUGGA))
+    index.add('el_jem', signature(EL_JEM))
+    match = index.find(signature(DOUGGA.replace("archaeologists", "archaeologist")))
+    assert match is not None and match[0] == 'dougga' and match[1] >= 0.8
+    assert index.find(signature("Kerkouane is a Punic city on Cap Bon abandoned after the First Punic War.")) is None
+
+def test_allowed_restricts_matches():
+    index = MinHashIndex()
+    index.add('dougga', signature(DOUGGA))
+    assert index.find(signature(DOUGGA), allowed={'el_jem'}) is None
+
+def test_remove_and_save_round_trip(tmp_path):
+    index = MinHashIndex(str(tmp_path))
+    index.add('dougga', signature(DOUGGA))
+    index.add('el_jem', signature(EL_JEM))
+    index.remove(['dougga'])
+    assert index.find(signature(DOUGGA)) is None
+    index.save()
+
+    reloaded = MinHashIndex(str(tmp_path))
+    assert reloaded.ids == ['el_jem']
+    assert reloaded.find(signature(EL_JEM)) == ('el_jem', 1.0)
+
+def test_index_from_an_older_hash_scheme_is_refused(tmp_path):
+    index = MinHashIndex(str(tmp_path))
+    index.add('dougga', signature(DOUGGA))
+    index.save()
+    os.remove(tmp_path / 'meta.json')
+    with pytest.raises(ValueError):
+        MinHashIndex(str(tmp_path))
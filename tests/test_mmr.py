@@ -0,0 +1,60 @@
+import numpy as np
+from mmr import mmr_order, diversify, refine_results, candidate_count
+
+QUERY = np.array([1.0, 0.0, 0.0])
+
+def results_for(similarities, metadatas):
+    count = len(similarities)
+    return {
+        'ids': [[f"c{i}" for i in range(count)]],
+        'documents': [[f"chunk {i}" for i in range(count)]],
+        'metadatas': [metadatas],
+        'distances': [[1 / s - 1 for s in similarities]],
+        'embeddings': None,
+        'included': ['metadatas', 'documents', 'distances']
+    }
+
+def test_pure_relevance_weight_keeps_relevance_order():
+    embeddings = np.array([[0.9, 0.1, 0.0], [1.0, 0.0, 0.0], [0.5, 0.5, 0.5]])
+    assert mmr_order(QUERY, embeddings, 3, diversity_weight=1.0) == [1, 0, 2]
+
+def test_near_duplicate_loses_to_a_novel_chunk():
+    embeddings = np.array([[1.0, 0.1, 0.0], [1.0, 0.11, 0.0], [0.7, 0.0, 0.7]])
+    assert mmr_order(QUERY, embeddings, 2, diversity_weight=0.5) == [0, 2]
+
+def test_per_file_cap():
+    embeddings = np.array([[1.0, 0.0, 0.0], [0.99, 0.1, 0.0], [0.98, 0.0, 0.1], [0.5, 0.5, 0.0]])
+    order = mmr_order(QUERY, embeddings, 3, diversity_weight=1.0, files=['a', 'a', 'a', 'b'], max_per_file=2)
+    assert order == [0, 1, 3]
+
+def test_diversify_slices_every_field_and_reports_files():
+    embeddings = np.array([[1.0, 0.1, 0.0], [1.0, 0.11, 0.0], [0.7, 0.0, 0.7]])
+    results = results_for([0.9, 0.89, 0.7], [{'filename': 'a.txt'}, {'filename': 'a.txt'}, {'filename': 'b.txt'}])
+    reranked, stats = diversify(results, QUERY, embeddings, 2, diversity_weight=0.5)
+    assert reranked['ids'] == [['c0', 'c2']]
+    assert reranked['documents'] == [['chunk 0', 'chunk 2']]
+    assert stats['files'] == 2 and stats['files_by_relevance'] == 1 and stats['reordered']
+
+def test_candidate_count():
+    assert candidate_count(5, 'fixed', mmr=False) == 5
+    assert candidate_count(5, 'fixed', mmr=True) == 20
+
+def test_adaptive_mmr_picks_from_the_whole_pool():
+    # Three close chunks of one file, then a gap: the cut keeps 3, but MMR
+    # may swap a near-duplicate for a less similar chunk beyond the gap
+    similarities = [0.90, 0.895, 0.89, 0.70, 0.69, 0.68, 0.67]
+    metadatas = [{'filename': 'a.txt'}] * 3 + [{'filename': f"{name}.txt"} for name in 'bcde']
+    embeddings = np.array([[1.0, 0.1, 0.0]] * 3 + [[0.7, 0.0, 0.7], [0.6, 0.8, 0.0], [0.5, 0.0, 0.8], [0.4, 0.9, 0.0]])
+    results = results_for(similarities, metadatas)
+    results['embeddings'] = [embeddings.tolist()]
+
+    refined, stats = refine_results(results, QUERY, 5, 0.5, store=None, encode=None, policy='adaptive', mmr=True)
+    assert stats['adaptive_top_k']['kept'] == 3
+    assert stats['mmr']['candidates'] == len(similarities)
+    assert len(refined['ids'][0]) == 3
+    assert set(refined['ids'][0]) - {'c0', 'c1', 'c2'}
+
+def test_fixed_policy_without_mmr_leaves_results_alone():
+    results = results_for([0.9, 0.8], [{'filename': 'a.txt'}, {'filename': 'b.txt'}])
+    refined, stats = refine_results(results, QUERY, 5, 0.5, store=None, encode=None, policy='fixed', mmr=False)
+    assert refined is results and stats == {}
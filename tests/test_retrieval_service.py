@@ -0,0 +1,119 @@
+import threading
+from http.server import ThreadingHTTPServer
+import numpy as np
+import pytest
+from retrieval_service import MicroBatcher, merge_query_results, make_handler, RetrievalClient, connect
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    def process(key, items):
+        calls.append((key, list(items)))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(process, window_ms=200, max_batch=64)
+    results = {}
+    barrier = threading.Barrier(4)
+
+    def client(i):
+        barrier.wait()
+        results[i] = batcher.submit([i, i + 100])
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {i: [i * 10, (i + 100) * 10] for i in range(4)}
+    assert len(calls) == 1 and len(calls[0][1]) == 8
+    assert batcher.stats() == {'requests': 4, 'batches': 1, 'items': 8, 'avg_batch_size': 8.0}
+
+def test_requests_with_different_keys_are_processed_apart():
+    keys = []
+    batcher = MicroBatcher(lambda key, items: keys.append(key) or list(items), window_ms=1)
+    assert batcher.submit(['a'], key=5) == ['a']
+    assert batcher.submit(['b'], key=10) == ['b']
+    assert keys == [5, 10]
+
+def test_errors_reach_every_waiting_request():
+    def fail(key, items):
+        raise ValueError("index closed")
+
+    with pytest.raises(ValueError, match="index closed"):
+        MicroBatcher(fail, window_ms=1).submit(['a'])
+
+def test_merge_query_results():
+    singles = [{'ids': [[f'c{i}']], 'documents': [[f'doc {i}']], 'metadatas': [[{}]], 'distances': [[0.1 * i]]}
+               for i in range(2)]
+    merged = merge_query_results(singles)
+    assert merged['ids'] == [['c0'], ['c1']] and merged['distances'] == [[0.0], [0.1]]
+
+class FakeService:
+    """What make_handler needs from RetrievalService, without a model or an index"""
+
+    def __init__(self, gate=True):
+        self.info_calls = 0
+        self.gate = gate
+
+    def embed(self, texts):
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+    def search(self, questions, embeddings=None, top_k=5, mode=None):
+        return merge_query_results([{'ids': [[f'{q}-{k}' for k in range(top_k)]], 'documents': [[q] * top_k],
+                                     'metadatas': [[{}] * top_k], 'distances': [[0.5] * top_k]} for q in questions])
+
+    def info(self):
+        self.info_calls += 1
+        return {'name': 'tunisian_archaeology', 'count': 169, 'vector_store': 'numpy', 'retrieval_mode': 'dense'}
+
+    def domain_gate(self):
+        if not self.gate:
+            return {'available': False}
+        return {'available': True, 'meta': {'centroids': 2}, 'labels': ['site:Dougga', 'site:El Jem'],
+                'centroids': np.eye(2, dtype=np.float32)}
+
+    def stats(self):
+        return {'embedding_cache': {'hits': 0, 'misses': 0}}
+
+@pytest.fixture
+def server():
+    def start(service):
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(service))
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        return f"http://127.0.0.1:{httpd.server_address[1]}"
+    servers = []
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+def test_client_round_trip(server):
+    service = FakeService()
+    encoder, store = connect(server(service))
+    assert encoder.encode("Dougga").tolist() == [6.0, 1.0]
+    results = store.search(["Dougga", "El Jem"], None, top_k=2)
+    assert results['ids'] == [['Dougga-0', 'Dougga-1'], ['El Jem-0', 'El Jem-1']]
+    # The count comes from the info call made when connecting
+    assert [store.count() for _ in range(3)] == [169] * 3
+    assert service.info_calls == 1
+
+def test_domain_gate_comes_from_the_server(server):
+    from domain_gate import load_domain_gate
+    _, store = connect(server(FakeService()))
+    gate = load_domain_gate(store)
+    accepted, score, nearest = gate.check(np.array([0.1, 1.0]))
+    assert accepted and nearest == 'site:El Jem'
+
+def test_missing_server_gate_is_an_error(server):
+    from domain_gate import load_domain_gate
+    _, store = connect(server(FakeService(gate=False)))
+    with pytest.raises(RuntimeError, match="no domain centroids"):
+        load_domain_gate(store)
+
+def test_server_errors_become_runtime_errors(server):
+    class Broken(FakeService):
+        def embed(self, texts):
+            raise KeyError('model')
+    with pytest.raises(RuntimeError, match="KeyError"):
+        RetrievalClient(server(Broken())).embed(["x"])
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from snapshot import write_snapshot, load_snapshot, read_header, SnapshotError, ALIGN
+from vector_store import NumpyStore
+from lexical_index import LexicalIndex
+
+DOCUMENTS = [
+    "The amphitheatre of El Jem seated thirty five thousand spectators.",
+    "Dougga keeps a Roman capitol, a theatre and the Libyco-Punic mausoleum.",
+    "Kerkouane is a Punic town on Cap Bon with tiled floors and baths.",
+    "Le musée du Bardo à Tunis conserve des mosaïques romaines."
+]
+IDS = ['el_jem', 'dougga', 'kerkouane', 'bardo']
+METADATAS = [{'filename': 'el_jem_en.txt', 'site': 'El Jem'}, {'filename': 'dougga_en.txt', 'site': 'Dougga'},
+             {'filename': 'kerkouane_en.txt', 'site': 'Kerkouane'}, {'filename': 'bardo_fr.txt', 'topic': 'museum'}]
+
+def write(path, quantization=None):
+    embeddings = np.random.RandomState(0).randn(len(IDS), 8).astype(np.float32)
+    write_snapshot(str(path), IDS, embeddings, DOCUMENTS, METADATAS, quantization=quantization)
+    return embeddings
+
+@pytest.mark.parametrize('quantization', [None, 'int8', 'binary'])
+def test_round_trip_searches_like_the_numpy_store(tmp_path, quantization):
+    embeddings = write(tmp_path / 'index.snapshot', quantization)
+    snapshot = load_snapshot(str(tmp_path / 'index.snapshot'))
+    store = NumpyStore.build(IDS, embeddings, DOCUMENTS, METADATAS, path=str(tmp_path / 'store'),
+                             quantization=quantization)
+
+    assert snapshot.ids == IDS and snapshot.documents == DOCUMENTS and snapshot.metadatas == METADATAS
+    assert isinstance(snapshot.embeddings, np.memmap)
+    assert snapshot.embeddings.offset % ALIGN == 0
+    queries = embeddings + 0.1
+    assert snapshot.query(queries.tolist(), n_results=3) == store.query(queries.tolist(), n_results=3)
+
+def test_bundled_lexical_index_and_domain_gate(tmp_path):
+    embeddings = write(tmp_path / 'index.snapshot')
+    snapshot = load_snapshot(str(tmp_path / 'index.snapshot'))
+    lexical = LexicalIndex.build(IDS, DOCUMENTS, str(tmp_path / 'lexical'))
+    assert snapshot.lexical_index.search("Punic mausoleum", 4) == lexical.search("Punic mausoleum", 4)
+    assert snapshot.lexical_index.search("musee", 4)[0] == ['bardo']
+    assert snapshot.domain_gate.labels == ['site:Dougga', 'site:El Jem', 'site:Kerkouane', 'topic:museum']
+    accepted, score, label = snapshot.domain_gate.check(embeddings[1], threshold=0.5)
+    assert accepted and label == 'site:Dougga' and score == pytest.approx(1.0)
+
+def test_corruption_is_detected(tmp_path):
+    path = tmp_path / 'index.snapshot'
+    write(path)
+    header, start = read_header(str(path))
+    data = bytearray(path.read_bytes())
+    data[start + header['sections']['embeddings']['offset']] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(SnapshotError, match="checksum mismatch in section embeddings"):
+        load_snapshot(str(path))
+    assert load_snapshot(str(path), verify=False).count() == len(IDS)
+
+def test_truncated_and_foreign_files_are_refused(tmp_path):
+    path = tmp_path / 'index.snapshot'
+    write(path)
+    path.write_bytes(path.read_bytes()[:200])
+    with pytest.raises(SnapshotError):
+        load_snapshot(str(path))
+    (tmp_path / 'other.bin').write_bytes(b'not a snapshot')
+    with pytest.raises(SnapshotError, match="not a snapshot"):
+        load_snapshot(str(tmp_path / 'other.bin'))
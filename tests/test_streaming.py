@@ -0,0 +1,96 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from streaming import StreamError, StreamStats, stream_tokens, split_sentences, translate_sentences, intercept_refusal
+
+def ollama_chunks(pieces, fail_after=None):
+    for i, piece in enumerate(pieces):
+        if i == fail_after:
+            raise ConnectionError("ollama went away")
+        yield {'response': piece, 'done': False}
+    yield {'response': '', 'done': True, 'eval_count': 7, 'prompt_eval_count': 120, 'eval_duration': 350_000_000}
+
+def test_stream_tokens_yields_text_and_records_ollama_stats():
+    stats = StreamStats()
+    assert ''.join(stream_tokens(ollama_chunks(["El ", "Jem", "."]), stats)) == "El Jem."
+    assert stats.chunks == 3
+    assert stats.ttft is not None and stats.ttft >= 0
+    assert stats.tokens == 7 and stats.prompt_tokens == 120
+    assert stats.tokens_per_second == 20.0
+    assert "7 tokens" in stats.summary()
+
+def test_stream_error_is_shown_and_recorded():
+    stats = StreamStats()
+    text = ''.join(stream_tokens(ollama_chunks(["El ", "Jem"], fail_after=1), stats))
+    assert text == "El Error: ollama went away"
+    assert [piece for piece in stream_tokens(ollama_chunks(["El"], fail_after=0), StreamStats())
+            if isinstance(piece, StreamError)] == ["Error: ollama went away"]
+    assert stats.error == "ollama went away"
+    assert stats.end is not None
+
+def test_split_sentences_regroups_pieces():
+    pieces = ["Dougga is Ro", "man. Its theatre", " seats 3500! Is it", " open? Yes"]
+    assert list(split_sentences(pieces)) == [("Dougga is Roman.", " "), ("Its theatre seats 3500!", " "),
+                                             ("Is it open?", " "), ("Yes", "")]
+
+def test_split_sentences_keeps_line_breaks_as_separators():
+    pieces = ["Sites:\n", "- Dougga\n- El", " Jem\n", "\nBoth are Roman. "]
+    pairs = list(split_sentences(pieces))
+    assert ''.join(sentence + separator for sentence, separator in pairs) == ''.join(pieces)
+    assert [sentence for sentence, _ in pairs if sentence] == ["Sites:", "- Dougga", "- El Jem", "Both are Roman."]
+
+def test_translate_sentences_keeps_order_with_background_translation():
+    def translate(sentence):
+        # Earlier sentences finish last, so order must come from the queue
+        time.sleep(0.02 if sentence.startswith('One') else 0)
+        return sentence.upper()
+    pieces = ["One. ", "Two. ", "Three."]
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        assert ''.join(translate_sentences(pieces, translate, executor=executor)) == "ONE. TWO. THREE."
+    assert ''.join(translate_sentences(pieces, translate)) == "ONE. TWO. THREE."
+
+def test_translation_keeps_paragraphs_and_list_lines():
+    pieces = ["Two sites stand out.\n\n", "- Dougga\n", "- El Jem"]
+    translated = ''.join(translate_sentences(pieces, lambda sentence: f"<{sentence}>"))
+    assert translated == "<Two sites stand out.>\n\n<- Dougga>\n<- El Jem>"
+
+def test_stream_error_is_not_translated():
+    def pieces():
+        yield "Dougga is "
+        yield StreamError("Error: ollama went away")
+    seen = []
+    def translate(sentence):
+        seen.append(sentence)
+        return sentence.upper()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert ''.join(translate_sentences(pieces(), translate, executor=executor)) == "DOUGGA IS Error: ollama went away"
+    assert seen == ["Dougga is"]
+
+def test_translation_starts_before_the_stream_ends():
+    started = []
+    def pieces():
+        yield "First sentence. "
+        time.sleep(0.05)
+        started.append(len(translated))
+        yield "Second sentence."
+    translated = []
+    def translate(sentence):
+        translated.append(sentence)
+        return sentence
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(translate_sentences(pieces(), translate, executor=executor))
+    assert started == [1]
+
+def test_refusal_is_replaced_after_the_first_sentence():
+    consumed = []
+    def pieces():
+        for piece in ["I don't", " know that. ", "Sorry", "."]:
+            consumed.append(piece)
+            yield piece
+    replacement = lambda text: "Je ne sais pas." if text.startswith("I don't know") else None
+    assert list(intercept_refusal(pieces(), replacement)) == ["Je ne sais pas."]
+    # The rest of the generation still ran, so its stats are complete
+    assert consumed == ["I don't", " know that. ", "Sorry", "."]
+
+def test_real_answer_passes_through_unchanged():
+    pieces = ["Dougga ", "is Roman. ", "Its ", "theatre survives."]
+    assert ''.join(intercept_refusal(iter(pieces), lambda text: None)) == ''.join(pieces)
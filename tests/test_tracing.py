@@ -0,0 +1,69 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import tracing
+from tracing import Trace, activate, span, annotate, submit
+
+def test_span_without_an_active_trace_does_nothing():
+    with span('embedding', texts=1) as record:
+        record.set(cache_hit=True)
+    annotate(cache_hit=False)
+
+def test_nested_spans_record_their_parent_and_attributes():
+    trace = Trace('question', language='fr')
+    with activate(trace):
+        with span('retrieval', top_k=5):
+            with span('embedding') as record:
+                annotate(cache_hit=True)
+            record.set(texts=1)
+    trace.finish()
+    spans = {s['name']: s for s in trace.to_dict()['spans']}
+    assert spans['retrieval']['parent'] is None and spans['retrieval']['top_k'] == 5
+    assert spans['embedding']['parent'] == 'retrieval'
+    assert spans['embedding']['cache_hit'] is True and spans['embedding']['texts'] == 1
+    assert trace.to_dict()['language'] == 'fr'
+
+def test_detached_span_is_not_a_parent():
+    trace = Trace('question')
+    with activate(trace):
+        with span('llm_generation', detached=True):
+            with span('back_translation'):
+                pass
+    assert {s.name: s.parent for s in trace.spans}['back_translation'] is None
+
+def test_submit_carries_the_trace_into_worker_threads():
+    def work(i):
+        with span('sentence', index=i):
+            time.sleep(0.01)
+    trace = Trace('question')
+    with ThreadPoolExecutor(max_workers=2) as executor, activate(trace):
+        with span('translation'):
+            for future in [submit(executor, work, i) for i in range(2)]:
+                future.result()
+    sentences = [s for s in trace.spans if s.name == 'sentence']
+    assert len(sentences) == 2
+    assert all(s.parent == 'translation' for s in sentences)
+    assert all(s.thread != 'MainThread' for s in sentences)
+
+def test_stage_ms_sums_overlapping_top_level_spans():
+    def stage(name):
+        with span(name):
+            time.sleep(0.05)
+    trace = Trace('question')
+    with ThreadPoolExecutor(max_workers=2) as executor, activate(trace):
+        for future in [submit(executor, stage, name) for name in ('a', 'b')]:
+            future.result()
+    trace.finish()
+    assert trace.stage_ms() > trace.duration_ms
+
+def test_finish_exports_one_json_line_once(tmp_path, monkeypatch):
+    path = tmp_path / 'traces.jsonl'
+    monkeypatch.setattr(tracing, 'TRACE_FILE', str(path))
+    trace = Trace('question')
+    with activate(trace), span('retrieval'):
+        pass
+    trace.finish()
+    trace.finish()
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])['trace_id'] == trace.id
@@ -0,0 +1,63 @@
+import sqlite3
+import pytest
+import translation
+from translation import TranslationCache, LocalBackend, translate_text
+
+class CountingBackend(LocalBackend):
+    def __init__(self):
+        self.calls = 0
+
+    def translate(self, text, source_lang, target_lang):
+        self.calls += 1
+        return super().translate(text, source_lang, target_lang)
+
+@pytest.fixture
+def local(tmp_path, monkeypatch):
+    backend = CountingBackend()
+    monkeypatch.setattr(translation, 'backend', backend)
+    monkeypatch.setattr(translation, 'translation_cache',
+                        TranslationCache(str(tmp_path / 'translations.sqlite3'), backend_name='local'))
+    return backend
+
+def test_local_round_trip(local):
+    french = translate_text("Where is Dougga?", source_lang='en', target_lang='fr')
+    assert french == "[fr] Where is Dougga?"
+    assert translate_text(french, source_lang='fr', target_lang='en') == "Where is Dougga?"
+    assert translate_text("Where is Dougga?", source_lang='en', target_lang='en') == "Where is Dougga?"
+    assert local.calls == 2
+
+def test_repeat_translation_is_a_cache_hit(local):
+    for _ in range(3):
+        assert translate_text("El Jem", source_lang='en', target_lang='de') == "[de] El Jem"
+    assert local.calls == 1
+    stats = translation.translation_cache.stats()
+    assert stats == {'hits': 2, 'misses': 1}
+    # Another target language is a separate entry
+    translate_text("El Jem", source_lang='en', target_lang='it')
+    assert local.calls == 2
+
+def test_backends_do_not_share_entries(tmp_path):
+    path = str(tmp_path / 'translations.sqlite3')
+    TranslationCache(path, backend_name='local').put("Carthage", 'en', 'fr', "[fr] Carthage")
+    assert TranslationCache(path, backend_name='google').get("Carthage", 'en', 'fr') is None
+    assert TranslationCache(path, backend_name='local').get("Carthage", 'en', 'fr') == "[fr] Carthage"
+
+def test_least_recently_used_rows_are_pruned(tmp_path):
+    cache = TranslationCache(str(tmp_path / 'translations.sqlite3'), max_entries=2, backend_name='local')
+    cache.put("a", 'en', 'fr', "[fr] a")
+    cache.put("b", 'en', 'fr', "[fr] b")
+    cache.get("a", 'en', 'fr')
+    cache.put("c", 'en', 'fr', "[fr] c")
+    assert cache.get("b", 'en', 'fr') is None
+    assert cache.get("a", 'en', 'fr') == "[fr] a"
+
+def test_cache_without_backend_column_is_rebuilt(tmp_path):
+    path = str(tmp_path / 'translations.sqlite3')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE translations (text_hash TEXT, source TEXT, target TEXT, translated TEXT, "
+                 "last_used REAL, PRIMARY KEY (text_hash, source, target))")
+    conn.execute("INSERT INTO translations VALUES (?, 'en', 'fr', '[fr] Carthage', 0)",
+                 (TranslationCache.text_hash("Carthage"),))
+    conn.commit()
+    conn.close()
+    assert TranslationCache(path, backend_name='google').get("Carthage", 'en', 'fr') is None
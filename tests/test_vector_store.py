@@ -0,0 +1,78 @@
+import numpy as np
+import vector_store
+from vector_store import NumpyStore
+
+def random_store(path, count=300, dim=32, seed=0, **kwargs):
+    rng = np.random.RandomState(seed)
+    embeddings = rng.randn(count, dim).astype(np.float32)
+    ids = [f"c{i}" for i in range(count)]
+    store = NumpyStore.build(ids, embeddings, [f"chunk {i}" for i in range(count)],
+                             [{'filename': f"f{i % 7}.txt"} for i in range(count)], path=str(path), **kwargs)
+    return store, embeddings, rng.randn(5, dim).astype(np.float32)
+
+def brute_force(embeddings, queries, k):
+    dist = ((queries[:, None, :] - embeddings[None, :, :]) ** 2).sum(axis=2)
+    order = np.argsort(dist, axis=1, kind='stable')[:, :k]
+    return order, np.take_along_axis(dist, order, axis=1)
+
+def test_exact_search_matches_brute_force(tmp_path):
+    store, embeddings, queries = random_store(tmp_path, quantization=None)
+    index, dist = store.search(queries, 10)
+    expected_index, expected_dist = brute_force(embeddings, queries, 10)
+    assert (index == expected_index).all()
+    assert np.allclose(dist, expected_dist, rtol=1e-4, atol=1e-3)
+
+def test_blocks_are_merged_like_one_scan(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, 'BLOCK_ROWS', 64)
+    store, embeddings, queries = random_store(tmp_path, quantization=None)
+    index, _ = store.search(queries, 10)
+    assert (index == brute_force(embeddings, queries, 10)[0]).all()
+
+def test_float16_store_keeps_the_neighbours(tmp_path):
+    store, embeddings, queries = random_store(tmp_path, dtype='float16', quantization=None)
+    index, _ = store.search(queries, 10)
+    expected, _ = brute_force(embeddings, queries, 10)
+    overlap = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(index.tolist(), expected.tolist())])
+    assert overlap >= 0.9
+
+def test_query_and_get_have_chromas_shape(tmp_path):
+    store, embeddings, queries = random_store(tmp_path, quantization=None)
+    results = store.query(query_embeddings=queries[:2].tolist(), n_results=3)
+    assert len(results['ids']) == 2 and len(results['ids'][0]) == 3
+    assert results['documents'][0][0] == f"chunk {results['ids'][0][0][1:]}"
+    assert results['distances'][0] == sorted(results['distances'][0])
+
+    fetched = store.get(ids=['c5', 'missing', 'c2'], include=['documents', 'embeddings'])
+    assert fetched['ids'] == ['c5', 'c2']
+    assert fetched['documents'] == ['chunk 5', 'chunk 2']
+    assert np.allclose(fetched['embeddings'], embeddings[[5, 2]])
+    assert fetched['metadatas'] is None
+
+def test_top_k_above_the_store_size(tmp_path):
+    store, _, queries = random_store(tmp_path, count=4, quantization=None)
+    index, dist = store.search(queries[0], 10)
+    assert index.shape == (1, 4)
+    assert (dist >= 0).all()
+
+def recall(index, expected):
+    return np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(index.tolist(), expected.tolist())])
+
+def test_int8_codes_round_trip_within_half_a_step():
+    embeddings = np.random.RandomState(1).randn(20, 16).astype(np.float32)
+    codes, scales = vector_store.quantize_int8(embeddings)
+    assert codes.dtype == np.int8
+    assert (np.abs(codes * scales[:, None] - embeddings) <= scales[:, None] / 2 + 1e-6).all()
+
+def test_binary_codes_are_packed_sign_bits():
+    codes = vector_store.quantize_binary(np.array([[1.0, -1.0, 0.5, -0.5, 2.0, 0.0, -3.0, 4.0, 1.0]]))
+    assert codes.tolist() == [[0b10101001, 0b10000000]]
+
+def test_quantized_first_pass_is_rescored_exactly(tmp_path):
+    for quantization, minimum in (('int8', 0.95), ('binary', 0.8)):
+        store, embeddings, queries = random_store(tmp_path / quantization, count=2000, quantization=quantization)
+        index, dist = store.search(queries, 10)
+        expected, _ = brute_force(embeddings, queries, 10)
+        assert recall(index, expected) >= minimum, quantization
+        exact = ((embeddings[index] - queries[:, None, :]) ** 2).sum(axis=2)
+        assert np.allclose(dist, exact, rtol=1e-4, atol=1e-3)
+        assert store.index_nbytes() < store.nbytes()
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+# Append every finished trace to this JSON-lines file when set
+TRACE_FILE = os.environ.get('RAG_TRACE_FILE')
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """One timed stage of a request with its input/output sizes and cache use"""
+
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.thread = threading.current_thread().name
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self, trace_start):
+        return {
+            'name': self.name,
+            'parent': self.parent,
+            'start_ms': round((self.start - trace_start) * 1000, 3),
+            'duration_ms': None if self.duration_ms is None else round(self.duration_ms, 3),
+            'thread': self.thread,
+            **self.attrs
+        }
+
+class Trace:
+    """Spans recorded while answering one question (or one batch)"""
+
+    def __init__(self, name, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.timestamp = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, detached=False, **attrs):
+        parent = current_span.get()
+        record = Span(name, parent.name if parent is not None else None, **attrs)
+        # A detached span never becomes the parent of spans opened inside it
+        token = None if detached else current_span.set(record)
+        try:
+            yield record
+        finally:
+            record.duration_ms = (time.perf_counter() - record.start) * 1000
+            if token is not None:
+                current_span.reset(token)
+            with self.lock:
+                self.spans.append(record)
+
+    def finish(self):
+        """Close the trace and export it; later calls do nothing"""
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = (time.perf_counter() - self.start) * 1000
+        if TRACE_FILE:
+            self.export(TRACE_FILE)
+
+    def stage_ms(self):
+        """Summed duration of the top-level spans (more than wall time when they overlap)"""
+        return sum(s.duration_ms for s in self.spans if s.parent is None and s.duration_ms is not None)
+
+    def to_dict(self):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return {
+            'trace_id': self.id,
+            'name': self.name,
+            'timestamp': self.timestamp,
+            'duration_ms': None if self.duration_ms is None else round(self.duration_ms, 3),
+            'stage_ms': round(self.stage_ms(), 3),
+            **self.attrs,
+            'spans': [s.to_dict(self.start) for s in spans]
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, default=str)
+
+    def export(self, path):
+        """Append this trace as one JSON line"""
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(self.to_json() + '\n')
+
+class _NullSpan:
+    def set(self, **attrs):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+@contextmanager
+def span(name, detached=False, **attrs):
+    """Record a span on the active trace; does nothing when no trace is active"""
+    trace = current_trace.get()
+    if trace is None:
+        yield NULL_SPAN
+        return
+    with trace.span(name, detached=detached, **attrs) as record:
+        yield record
+
+def annotate(**attrs):
+    """Add attributes (e.g. cache_hit) to the innermost active span"""
+    record = current_span.get()
+    if record is not None:
+        record.set(**attrs)
+
+@contextmanager
+def activate(trace):
+    """Make trace the active trace for the enclosed code"""
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit that keeps the active trace and span in the worker thread"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
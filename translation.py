@@ -0,0 +1,246 @@
+import os
+import sys
+import time
+import hashlib
+import sqlite3
+import threading
+from functools import lru_cache
+from langdetect import detect, DetectorFactory
+from langdetect.lang_detect_exception import LangDetectException
+from tracing import span, annotate
+
+# Set seed for consistent language detection
+DetectorFactory.seed = 0
+
+CACHE_PATH = './cache/translations.sqlite3'
+DEFAULT_MAX_ENTRIES = 50000
+
+# "google" (default) or "local", an offline stand-in for tests and development
+TRANSLATOR_BACKEND = os.environ.get('TRANSLATOR_BACKEND', 'google')
+
+# Language name mapping (100+ languages supported)
+LANGUAGE_NAMES = {
+    'en': 'English', 'fr': 'French', 'ar': 'Arabic', 'es': 'Spanish',
+    'de': 'German', 'it': 'Italian', 'pt': 'Portuguese', 'ru': 'Russian',
+    'zh-cn': 'Chinese (Simplified)', 'zh-tw': 'Chinese (Traditional)',
+    'ja': 'Japanese', 'ko': 'Korean', 'nl': 'Dutch', 'pl': 'Polish',
+    'tr': 'Turkish', 'sv': 'Swedish', 'da': 'Danish', 'fi': 'Finnish',
+    'no': 'Norwegian', 'cs': 'Czech', 'el': 'Greek', 'he': 'Hebrew',
+    'hi': 'Hindi', 'id': 'Indonesian', 'ms': 'Malay', 'th': 'Thai',
+    'vi': 'Vietnamese', 'uk': 'Ukrainian', 'ro': 'Romanian', 'hu': 'Hungarian',
+    'sk': 'Slovak', 'bg': 'Bulgarian', 'hr': 'Croatian', 'sr': 'Serbian',
+    'ca': 'Catalan', 'lt': 'Lithuanian', 'lv': 'Latvian', 'et': 'Estonian',
+    'sl': 'Slovenian', 'af': 'Afrikaans', 'sq': 'Albanian', 'bn': 'Bengali',
+    'fa': 'Persian', 'ur': 'Urdu', 'sw': 'Swahili', 'ta': 'Tamil'
+}
+
+# Fixed answers shown when the knowledge base cannot help
+SYSTEM_MESSAGES = {
+    'no_info': "I don't have information about this topic. I can only answer questions about Tunisian archaeological sites like Carthage, Dougga, El Jem, Kerkouane, Sbeitla, and Bulla Regia.",
+    'not_found': "I couldn't find relevant information about this in my database. Please ask about Tunisian archaeological sites."
+}
+
+# "translate" (default): Llama 3 answers in English and the answer is
+# translated back; "direct": Llama 3 answers in the user's language, saving
+# the back-translation call
+ANSWER_MODE = os.environ.get('RAG_ANSWER_MODE', 'translate')
+
+# Refusals the generation prompts ask for verbatim, and the system message
+# each stands for; in direct mode they stay English so they can be recognized
+REFUSALS = {
+    "I can only answer questions about Tunisian archaeological sites": 'no_info',
+    "I don't have information about this in my knowledge base": 'not_found'
+}
+
+def answer_language_instruction(language):
+    """Prompt line asking Llama 3 to answer in language (empty for English)"""
+    if language == 'en':
+        return ""
+    name = LANGUAGE_NAMES.get(language, language)
+    return f"- Write your answer in {name}, but write the refusal sentences above in English, exactly as given\n"
+
+def refusal_key(answer):
+    """The SYSTEM_MESSAGES key of a refusal answer, or None for a real answer"""
+    lowered = answer.lower()
+    for phrase, key in REFUSALS.items():
+        if phrase.lower() in lowered:
+            return key
+    return None
+
+class GoogleBackend:
+    """deep-translator's GoogleTranslator, one reusable instance per language pair"""
+
+    # langdetect codes that Google spells differently
+    CODES = {'zh-cn': 'zh-CN', 'zh-tw': 'zh-TW', 'he': 'iw'}
+
+    def __init__(self):
+        self.translators = {}
+        self.lock = threading.Lock()
+
+    def translate(self, text, source_lang, target_lang):
+        from deep_translator import GoogleTranslator
+        pair = (self.CODES.get(source_lang, source_lang), self.CODES.get(target_lang, target_lang))
+        with self.lock:
+            translator = self.translators.get(pair)
+            if translator is None:
+                translator = GoogleTranslator(source=pair[0], target=pair[1])
+                self.translators[pair] = translator
+        return translator.translate(text)
+
+class LocalBackend:
+    """Offline stand-in that tags text with the target language instead of translating
+
+    English is left untagged and a source-language tag is removed first, so
+    en -> fr -> en returns the original text.
+    """
+
+    def translate(self, text, source_lang, target_lang):
+        tag = f"[{source_lang}] "
+        if text.startswith(tag):
+            text = text[len(tag):]
+        return text if target_lang == 'en' else f"[{target_lang}] {text}"
+
+BACKENDS = {'google': GoogleBackend, 'local': LocalBackend}
+
+class TranslationCache:
+    """Persistent SQLite cache of translations keyed by (backend, text hash, source, target)
+
+    The backend is part of the key so the local stand-in's tagged output is
+    never served as a Google translation. Holds at most max_entries rows;
+    the least recently used ones are deleted when it grows past that.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, backend_name=TRANSLATOR_BACKEND):
+        self.path = path
+        self.max_entries = max_entries
+        self.backend_name = backend_name
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(translations)")]
+        if columns and 'backend' not in columns:
+            # Rows from before the backend was part of the key: no telling
+            # which of them came from the stand-in, so start over
+            self.conn.execute("DROP TABLE translations")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                backend TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                translated TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (backend, text_hash, source, target)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, text, source_lang, target_lang):
+        key = (self.backend_name, self.text_hash(text), source_lang, target_lang)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT translated FROM translations WHERE backend = ? AND text_hash = ? AND source = ? AND target = ?",
+                key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE translations SET last_used = ? WHERE backend = ? AND text_hash = ? AND source = ? AND target = ?",
+                (time.time(),) + key
+            )
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, text, source_lang, target_lang, translated):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)",
+                (self.backend_name, self.text_hash(text), source_lang, target_lang, translated, time.time())
+            )
+            count = self.conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM translations WHERE rowid IN "
+                    "(SELECT rowid FROM translations ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self.conn.commit()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+backend = BACKENDS[TRANSLATOR_BACKEND]()
+translation_cache = TranslationCache()
+
+def detect_language(text):
+    """Automatically detect language from text (supports 100+ languages)"""
+    with span('language_detection', chars_in=len(text)) as sp:
+        misses = _detect_language.cache_info().misses
+        language = _detect_language(text)
+        sp.set(language=language, cache_hit=_detect_language.cache_info().misses == misses)
+    return language
+
+@lru_cache(maxsize=4096)
+def _detect_language(text):
+    try:
+        detected_lang = detect(text)
+        return detected_lang
+    except LangDetectException:
+        return 'en'
+    except Exception:
+        return 'en'
+
+def translate_text(text, source_lang='auto', target_lang='en'):
+    """Translate text between any languages, going through the persistent cache"""
+    try:
+        if source_lang == target_lang or (source_lang == 'auto' and target_lang == 'en'):
+            return text
+
+        cached = translation_cache.get(text, source_lang, target_lang)
+        annotate(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+
+        translated = backend.translate(text, source_lang, target_lang)
+        if not translated:
+            return text
+        translation_cache.put(text, source_lang, target_lang, translated)
+        return translated
+    except Exception as e:
+        return text
+
+def system_message(key, language='en'):
+    """A fixed system message in the user's language"""
+    return translate_text(SYSTEM_MESSAGES[key], source_lang='en', target_lang=language)
+
+def prewarm_system_messages(languages=None):
+    """Translate every fixed system message into every supported language"""
+    languages = languages or [lang for lang in LANGUAGE_NAMES if lang != 'en']
+    failed = []
+    for lang in languages:
+        for key, message in SYSTEM_MESSAGES.items():
+            if system_message(key, lang) == message:
+                failed.append((lang, key))
+    return failed
+
+if __name__ == "__main__":
+    # Build step: python translation.py --prewarm
+    if '--prewarm' not in sys.argv:
+        print("Usage: python translation.py --prewarm")
+        sys.exit(1)
+
+    print(f"Pre-translating {len(SYSTEM_MESSAGES)} system messages into {len(LANGUAGE_NAMES) - 1} languages...")
+    failed = prewarm_system_messages()
+    for lang, key in failed:
+        print(f"✗ {lang}: {key}")
+    stats = translation_cache.stats()
+    print(f"✅ Done ({stats['hits']} already cached, {stats['misses'] - len(failed)} translated, {len(failed)} failed)")
@@ -0,0 +1,350 @@
+import os
+import json
+import numpy as np
+
+CHROMA_PATH = './chroma_db'
+COLLECTION_NAME = 'tunisian_archaeology'
+MANIFEST_PATH = os.path.join(CHROMA_PATH, 'ingest_manifest.json')
+NUMPY_STORE_PATH = os.path.join(CHROMA_PATH, 'numpy_store')
+
+# "chroma" (default), "numpy", the in-process exact-search matrix, or
+# "snapshot", the same search over a single snapshot file (see snapshot.py)
+VECTOR_STORE = os.environ.get('RAG_VECTOR_STORE', 'chroma')
+# Storage precision of the numpy matrix: "float32" or "float16" (half the memory)
+NUMPY_STORE_DTYPE = os.environ.get('RAG_VECTOR_DTYPE', 'float32')
+# First-pass index of the numpy store: "" (search the matrix), "int8" or "binary"
+NUMPY_STORE_QUANTIZATION = os.environ.get('RAG_VECTOR_QUANTIZATION', '') or None
+
+QUANTIZATIONS = (None, 'int8', 'binary')
+
+# Rows scored per matmul, bounds the temporary memory of large stores
+BLOCK_ROWS = 65536
+
+# A quantized first pass keeps this many candidates per result for exact
+# rescoring; sign bits lose more than int8 so binary keeps more
+RESCORE_FACTOR = {'int8': 10, 'binary': 40}
+RESCORE_MIN = 50
+
+# The eight +1/-1 signs encoded by every byte value of a packed binary code
+BYTE_SIGNS = 2 * np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(np.float32) - 1
+
+def manifest_mtime(manifest_path=MANIFEST_PATH):
+    try:
+        return os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        return None
+
+def quantize_int8(embeddings):
+    """Per-row symmetric int8 codes and the scales that map them back"""
+    scales = np.abs(embeddings).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.round(embeddings / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def quantize_binary(embeddings):
+    """One sign bit per dimension, packed eight to a byte"""
+    return np.packbits(embeddings > 0, axis=1)
+
+def index_arrays(embeddings, dtype=NUMPY_STORE_DTYPE, quantization=NUMPY_STORE_QUANTIZATION):
+    """Stored matrix, squared norms and quantized codes of float32 embeddings"""
+    stored = embeddings.astype(dtype)
+    arrays = {
+        'embeddings': stored,
+        'norms': np.einsum('ij,ij->i', stored.astype(np.float32), stored.astype(np.float32))
+    }
+    if quantization == 'int8':
+        arrays['codes'], arrays['scales'] = quantize_int8(embeddings)
+    elif quantization == 'binary':
+        arrays['codes'] = quantize_binary(embeddings)
+    return arrays
+
+class NumpyStore:
+    """Exact nearest-neighbour search over one memory-mapped embedding matrix
+
+    Embeddings live in a contiguous float32 or float16 .npy file opened with
+    np.memmap; documents and metadata are in records.json. query() takes the
+    same arguments as a Chroma collection and returns the same shape, with
+    squared L2 distances like Chroma's default space, so the two are
+    interchangeable for rag.py and app.py.
+
+    With int8 or binary quantization the first pass scans only the small
+    quantized codes; the full-precision rows of the best candidates are then
+    read from the memory-mapped matrix to rescore them exactly.
+    """
+
+    def __init__(self, path=NUMPY_STORE_PATH):
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        quantization = meta.get('quantization')
+        with open(os.path.join(path, 'records.json'), 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        self._attach(
+            meta,
+            np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'norms.npy')),
+            records,
+            codes=np.load(os.path.join(path, 'codes.npy')) if quantization is not None else None,
+            scales=np.load(os.path.join(path, 'scales.npy')) if quantization == 'int8' else None,
+            path=path
+        )
+
+    def _attach(self, meta, embeddings, norms, records, codes=None, scales=None, path=None):
+        self.path = path
+        self.meta = meta
+        self.name = meta['name']
+        self.quantization = meta.get('quantization')
+        self.embeddings = embeddings
+        # Squared norms of the stored rows, for |q - x|^2 = |q|^2 - 2 q.x + |x|^2
+        self.norms = norms
+        self.codes = codes
+        self.scales = scales
+        self.ids = records['ids']
+        self.documents = records['documents']
+        self.metadatas = records['metadatas']
+        # id -> row, built on the first get() by id
+        self.rows = None
+        # BM25 index and domain centroids bundled with the vectors (snapshots only)
+        self.lexical_index = None
+        self.domain_gate = None
+        if len(self.ids) != len(self.embeddings):
+            raise ValueError("numpy store is inconsistent")
+
+    @classmethod
+    def from_arrays(cls, meta, embeddings, norms, records, codes=None, scales=None):
+        """A store over arrays that are already loaded or memory-mapped (e.g. from a snapshot)"""
+        store = cls.__new__(cls)
+        store._attach(meta, embeddings, norms, records, codes, scales)
+        return store
+
+    @classmethod
+    def build(cls, ids, embeddings, documents, metadatas, path=NUMPY_STORE_PATH,
+              name=COLLECTION_NAME, dtype=NUMPY_STORE_DTYPE, quantization=NUMPY_STORE_QUANTIZATION,
+              source=None):
+        """Write a store to path and open it"""
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization} (expected int8 or binary)")
+        os.makedirs(path, exist_ok=True)
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        arrays = index_arrays(embeddings, dtype, quantization)
+
+        # Write each file under a temporary name first; meta.json goes last so
+        # a half-written store is never opened as valid
+        def write(filename, save):
+            tmp = os.path.join(path, filename + '.tmp')
+            with open(tmp, 'wb') as f:
+                save(f)
+            os.replace(tmp, os.path.join(path, filename))
+
+        for key, array in arrays.items():
+            write(key + '.npy', lambda f: np.save(f, array))
+        write('records.json', lambda f: f.write(json.dumps(
+            {'ids': list(ids), 'documents': list(documents), 'metadatas': list(metadatas)},
+            ensure_ascii=False
+        ).encode('utf-8')))
+        write('meta.json', lambda f: f.write(json.dumps({
+            'name': name,
+            'count': len(ids),
+            'dim': int(embeddings.shape[1]) if len(ids) else 0,
+            'dtype': str(np.dtype(dtype)),
+            'quantization': quantization,
+            'source': source
+        }).encode('utf-8')))
+        return cls(path)
+
+    @classmethod
+    def from_collection(cls, collection, path=NUMPY_STORE_PATH, dtype=NUMPY_STORE_DTYPE,
+                        quantization=NUMPY_STORE_QUANTIZATION):
+        """Export every chunk of a Chroma collection into a store"""
+        data = collection.get(include=['embeddings', 'documents', 'metadatas'])
+        return cls.build(
+            data['ids'], data['embeddings'], data['documents'], data['metadatas'],
+            path=path, name=collection.name, dtype=dtype, quantization=quantization,
+            source={'count': collection.count(), 'manifest_mtime_ns': manifest_mtime()}
+        )
+
+    def count(self):
+        return len(self.ids)
+
+    def nbytes(self):
+        """Size of all vector data, on disk and memory-mapped"""
+        size = self.embeddings.nbytes + self.norms.nbytes
+        for extra in (self.codes, self.scales):
+            if extra is not None:
+                size += extra.nbytes
+        return size
+
+    def index_nbytes(self):
+        """Size of what every query scans (the resident part of the index)"""
+        if self.quantization is None:
+            return self.embeddings.nbytes + self.norms.nbytes
+        size = self.codes.nbytes
+        if self.scales is not None:
+            size += self.scales.nbytes + self.norms.nbytes
+        return size
+
+    def _block_distances(self, queries, query_norms, start):
+        """First-pass distances from every query to rows start:start + BLOCK_ROWS
+
+        Squared L2 for float and int8 stores. Binary stores score the float
+        query against the sign codes (negated, so smaller is closer) through a
+        per-query table of the 256 possible byte contributions.
+        """
+        stop = start + BLOCK_ROWS
+        if self.quantization == 'binary':
+            codes = self.codes[start:stop]
+            columns = np.arange(codes.shape[1])
+            scores = []
+            for query in queries:
+                # Pad to whole bytes like np.packbits does
+                padded = np.zeros(codes.shape[1] * 8, dtype=np.float32)
+                padded[:len(query)] = query
+                table = BYTE_SIGNS @ padded.reshape(-1, 8).T
+                scores.append(-table[codes, columns].sum(axis=1))
+            return np.stack(scores)
+        if self.quantization == 'int8':
+            dots = (queries @ self.codes[start:stop].T.astype(np.float32)) * self.scales[start:stop]
+        else:
+            dots = queries @ np.asarray(self.embeddings[start:stop], dtype=np.float32).T
+        return self.norms[start:stop] - 2 * dots + query_norms[:, None]
+
+    def _first_pass(self, queries, query_norms, k):
+        """Indices and first-pass distances of the k nearest rows, in no particular order"""
+        best_index = []
+        best_dist = []
+        for start in range(0, self.count(), BLOCK_ROWS):
+            dist = self._block_distances(queries, query_norms, start)
+            block_k = min(k, dist.shape[1])
+            part = np.argpartition(dist, block_k - 1, axis=1)[:, :block_k]
+            best_index.append(part + start)
+            best_dist.append(np.take_along_axis(dist, part, axis=1))
+
+        index = np.concatenate(best_index, axis=1)
+        dist = np.concatenate(best_dist, axis=1)
+        if index.shape[1] > k:
+            part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+            index = np.take_along_axis(index, part, axis=1)
+            dist = np.take_along_axis(dist, part, axis=1)
+        return index, dist
+
+    def _rescore(self, queries, query_norms, candidates):
+        """Exact squared L2 distances to each query's candidate rows"""
+        dist = np.empty(candidates.shape, dtype=np.float32)
+        for i, rows in enumerate(candidates):
+            # Sorted reads touch the memory-mapped matrix in file order
+            order = np.argsort(rows)
+            vectors = np.asarray(self.embeddings[rows[order]], dtype=np.float32)
+            dist[i, order] = self.norms[rows[order]] - 2 * (vectors @ queries[i]) + query_norms[i]
+        return dist
+
+    def search(self, query_embeddings, top_k, rescore_k=None):
+        """Indices and squared L2 distances of the top_k rows for each query
+
+        rescore_k is the number of quantized first-pass candidates rescored
+        exactly (default: RESCORE_FACTOR * top_k, at least RESCORE_MIN).
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        top_k = min(top_k, self.count())
+        if top_k == 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+        if self.quantization is None:
+            index, dist = self._first_pass(queries, query_norms, top_k)
+        else:
+            rescore_k = rescore_k or max(top_k * RESCORE_FACTOR[self.quantization], RESCORE_MIN)
+            index, _ = self._first_pass(queries, query_norms, min(max(rescore_k, top_k), self.count()))
+            dist = self._rescore(queries, query_norms, index)
+            part = np.argpartition(dist, top_k - 1, axis=1)[:, :top_k]
+            index = np.take_along_axis(index, part, axis=1)
+            dist = np.take_along_axis(dist, part, axis=1)
+
+        order = np.argsort(dist, axis=1, kind='stable')
+        index = np.take_along_axis(index, order, axis=1)
+        # Rounding can push a near-exact match slightly below zero
+        dist = np.maximum(np.take_along_axis(dist, order, axis=1), 0.0)
+        return index, dist
+
+    def get(self, ids=None, include=('metadatas', 'documents')):
+        """Chroma-compatible lookup of chunks by id (every chunk when ids is None)"""
+        if ids is None:
+            rows = list(range(self.count()))
+        else:
+            if self.rows is None:
+                self.rows = {cid: row for row, cid in enumerate(self.ids)}
+            rows = [self.rows[cid] for cid in ids if cid in self.rows]
+        results = {
+            'ids': [self.ids[row] for row in rows],
+            'embeddings': None,
+            'documents': None,
+            'metadatas': None,
+            'included': list(include)
+        }
+        if 'documents' in include:
+            results['documents'] = [self.documents[row] for row in rows]
+        if 'metadatas' in include:
+            results['metadatas'] = [self.metadatas[row] for row in rows]
+        if 'embeddings' in include:
+            results['embeddings'] = np.asarray(self.embeddings[rows], dtype=np.float32).tolist()
+        return results
+
+    def query(self, query_embeddings, n_results=10, include=('metadatas', 'documents', 'distances')):
+        """Chroma-compatible top-k query for one or more embeddings"""
+        index, dist = self.search(query_embeddings, n_results)
+        results = {
+            'ids': [[self.ids[i] for i in row] for row in index.tolist()],
+            'embeddings': None,
+            'documents': None,
+            'metadatas': None,
+            'distances': None,
+            'included': list(include)
+        }
+        if 'documents' in include:
+            results['documents'] = [[self.documents[i] for i in row] for row in index.tolist()]
+        if 'metadatas' in include:
+            results['metadatas'] = [[self.metadatas[i] for i in row] for row in index.tolist()]
+        if 'distances' in include:
+            results['distances'] = dist.tolist()
+        if 'embeddings' in include:
+            results['embeddings'] = [self.embeddings[row].astype(np.float32).tolist() for row in index]
+        return results
+
+def chroma_collection(path=CHROMA_PATH, name=COLLECTION_NAME):
+    import chromadb
+    client = chromadb.PersistentClient(path=path)
+    return client.get_collection(name=name)
+
+def export_numpy_store(collection, path=NUMPY_STORE_PATH, dtype=NUMPY_STORE_DTYPE,
+                       quantization=NUMPY_STORE_QUANTIZATION):
+    """Rebuild the numpy store from the Chroma collection (run after ingest)"""
+    store = NumpyStore.from_collection(collection, path, dtype, quantization)
+    print(f"✓ Numpy store exported: {store.count()} vectors, {store.nbytes() / 1e6:.1f} MB "
+          f"({store.meta['dtype']}, index {store.quantization or 'exact'} {store.index_nbytes() / 1e6:.1f} MB)")
+    return store
+
+def load_numpy_store(path=NUMPY_STORE_PATH, dtype=NUMPY_STORE_DTYPE, quantization=NUMPY_STORE_QUANTIZATION):
+    """Open the numpy store, re-exporting it if ingest ran since or its settings changed"""
+    try:
+        store = NumpyStore(path)
+        source = store.meta.get('source') or {}
+        if (source.get('manifest_mtime_ns') == manifest_mtime()
+                and store.meta['dtype'] == str(np.dtype(dtype))
+                and store.quantization == quantization):
+            return store
+    except (OSError, ValueError, KeyError):
+        pass
+    print("⚠️  Numpy store missing or out of date - exporting from ChromaDB")
+    return export_numpy_store(chroma_collection(), path, dtype, quantization)
+
+def open_store(backend=VECTOR_STORE):
+    """The collection-like retrieval backend: a Chroma collection or a NumpyStore"""
+    if backend == 'numpy':
+        return load_numpy_store()
+    if backend == 'snapshot':
+        from snapshot import load_snapshot
+        return load_snapshot()
+    if backend == 'chroma':
+        return chroma_collection()
+    raise ValueError(f"Unknown vector store: {backend} (expected 'chroma', 'numpy' or 'snapshot')")